@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 import logging
-from modelcache.adapter.adapter_query import adapt_query
+from modelcache.adapter.adapter_query import adapt_query, adapt_batch_query
 from modelcache.adapter.adapter_insert import adapt_insert
 from modelcache.adapter.adapter_remove import adapt_remove
 from modelcache.adapter.adapter_register import adapt_register
+from modelcache.manager.scalar_data.answer_codec import resolve_answer
 
 
 class ChatCompletion(object):
@@ -11,8 +12,8 @@ class ChatCompletion(object):
 
     @classmethod
     async def create_query(cls, *args, **kwargs):
-        def cache_data_convert(cache_data, cache_query):
-            return construct_resp_from_cache(cache_data, cache_query)
+        def cache_data_convert(cache_data, cache_query, cache_id=None):
+            return construct_resp_from_cache(cache_data, cache_query, cache_id)
         try:
             return await adapt_query(
                 cache_data_convert,
@@ -23,6 +24,20 @@ class ChatCompletion(object):
             print(e)
             return str(e)
 
+    @classmethod
+    async def create_batch_query(cls, *args, **kwargs):
+        def cache_data_convert(cache_data, cache_query, cache_id=None):
+            return construct_resp_from_cache(cache_data, cache_query, cache_id)
+        try:
+            return await adapt_batch_query(
+                cache_data_convert,
+                *args,
+                **kwargs
+            )
+        except Exception as e:
+            print(e)
+            return str(e)
+
     @classmethod
     async def create_insert(cls, *args, **kwargs):
         try:
@@ -57,10 +72,16 @@ class ChatCompletion(object):
             return str(e)
 
 
-def construct_resp_from_cache(return_message, return_query):
+def construct_resp_from_cache(return_message, return_query, return_id=None):
+    # Compressed answers are only decompressed once they are returned
+    if isinstance(return_message, list):
+        return_message = [resolve_answer(message) for message in return_message]
+    else:
+        return_message = resolve_answer(return_message)
     return {
         "modelcache": True,
         "hitQuery": return_query,
+        "hitId": return_id,
         "data": return_message,
         "errorCode": 0
     }
@@ -46,8 +46,7 @@ async def adapt_insert(*args, **kwargs):
     embedding_data_list = await asyncio.gather(*embedding_futures_list)
 
     # Save all processed data to the data manager asynchronously
-    await asyncio.to_thread(
-        chat_cache.data_manager.save,
+    await chat_cache.data_manager.asave(
         pre_embedding_data_list,
         llm_data_list,
         embedding_data_list,
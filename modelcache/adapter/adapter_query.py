@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 import asyncio
-import logging
 from modelcache.embedding import MetricType
-from modelcache.utils.time import time_cal
+from modelcache.manager.scalar_data.answer_codec import resolve_answer
+from modelcache.utils.time import time_cal, async_time_cal
 from FlagEmbedding import FlagReranker
 
 USE_RERANKER = False  # 如果为 True 则启用 reranker，否则使用原有逻辑
@@ -22,6 +22,11 @@ async def adapt_query(cache_data_convert, *args, **kwargs):
         prompts=chat_cache.prompts,
     )
 
+    # Exact-match fast path: identical question text skips embedding and vector search
+    exact_resp = await exact_match_query(chat_cache, cache_data_convert, pre_embedding_data, model, context)
+    if exact_resp is not None:
+        return exact_resp
+
     # Generate embedding with performance monitoring
     embedding_data = await time_cal(
         chat_cache.embedding_func,
@@ -30,20 +35,132 @@ async def adapt_query(cache_data_convert, *args, **kwargs):
         cache_obj=chat_cache
     )(pre_embedding_data)
 
-    search_time_cal = time_cal(
-        chat_cache.data_manager.search,
+    search_time_cal = async_time_cal(
+        chat_cache.data_manager.asearch,
         func_name="vector_search",
         report_func=chat_cache.report.search,
         cache_obj=chat_cache
     )
-    cache_data_list = await asyncio.to_thread(
-        search_time_cal,
+    cache_data_list = await search_time_cal(
         embedding_data,
         extra_param=context.get("search_func", None),
         top_k=kwargs.pop("top_k", -1),
         model=model
     )
 
+    return await evaluate_search_result(
+        chat_cache, cache_data_convert, cache_data_list,
+        pre_embedding_data, embedding_data, model, context, cache_factor
+    )
+
+
+async def adapt_batch_query(cache_data_convert, *args, **kwargs):
+    """
+    Look up many queries at once.
+
+    All queries are embedded together, then each model gets a single multi-vector search.
+    Returns one entry per query, in order: a converted cache hit, None on a miss,
+    or the error message if that query failed.
+    """
+    chat_cache = kwargs.pop("cache_obj")
+    queries = kwargs.pop("queries")  # List of (model, query)
+    context = kwargs.pop("cache_context", {})
+    cache_factor = kwargs.pop("cache_factor", 1.0)
+    top_k = kwargs.pop("top_k", -1)
+
+    results = [None] * len(queries)
+    pre_embedding_datas = [None] * len(queries)
+    pending = []  # Indices of queries that still need a vector search
+
+    for i, (model, query) in enumerate(queries):
+        try:
+            pre_embedding_datas[i] = chat_cache.query_pre_embedding_func(
+                {"query": query},
+                extra_param=context.get("pre_embedding_func", None),
+                prompts=chat_cache.prompts,
+            )
+            results[i] = await exact_match_query(
+                chat_cache, cache_data_convert, pre_embedding_datas[i], model, context
+            )
+            if results[i] is None:
+                pending.append(i)
+        except Exception as e:
+            results[i] = str(e)
+
+    # Submit every embedding at once so the workers can batch them
+    embedding_datas = await asyncio.gather(*(
+        time_cal(
+            chat_cache.embedding_func,
+            func_name="embedding",
+            report_func=chat_cache.report.embedding,
+            cache_obj=chat_cache
+        )(pre_embedding_datas[i])
+        for i in pending
+    ), return_exceptions=True)
+    embeddings = {}
+    for i, embedding_data in zip(pending, embedding_datas):
+        if isinstance(embedding_data, Exception):
+            results[i] = str(embedding_data)
+        else:
+            embeddings[i] = embedding_data
+
+    # One multi-vector search per model
+    indices_by_model = {}
+    for i in embeddings:
+        indices_by_model.setdefault(queries[i][0], []).append(i)
+
+    search_many_time_cal = time_cal(
+        chat_cache.data_manager.search_many,
+        func_name="vector_search",
+        report_func=chat_cache.report.search,
+        cache_obj=chat_cache
+    )
+    for model, indices in indices_by_model.items():
+        try:
+            cache_data_lists = await asyncio.to_thread(
+                search_many_time_cal,
+                [embeddings[i] for i in indices],
+                extra_param=context.get("search_func", None),
+                top_k=top_k,
+                model=model
+            )
+        except Exception as e:
+            for i in indices:
+                results[i] = str(e)
+            continue
+
+        for i, cache_data_list in zip(indices, cache_data_lists):
+            try:
+                results[i] = await evaluate_search_result(
+                    chat_cache, cache_data_convert, cache_data_list,
+                    pre_embedding_datas[i], embeddings[i], model, context, cache_factor
+                )
+            except Exception as e:
+                results[i] = str(e)
+    return results
+
+
+async def exact_match_query(chat_cache, cache_data_convert, pre_embedding_data, model, context):
+    """Serve a query whose text is identical to a stored question, or return None."""
+    exact_id = chat_cache.data_manager.exact_match(pre_embedding_data, model=model)
+    if exact_id is None:
+        return None
+    ret = await chat_cache.data_manager.aget_scalar_data(
+        (1.0, exact_id), extra_param=context.get("get_scalar_data", None), model=model
+    )
+    if ret is None:
+        return None
+    return cache_data_convert(ret[0], ret[1], exact_id)
+
+
+async def evaluate_search_result(
+        chat_cache, cache_data_convert, cache_data_list,
+        pre_embedding_data, embedding_data, model, context, cache_factor=1.0
+):
+    """Evaluate vector search candidates against the similarity thresholds and build the response."""
+    if not cache_data_list:
+        return None  # Nothing stored for this model yet
+
     # Initialize result containers
     cache_answers = []
     cache_questions = []
@@ -99,19 +216,20 @@ async def adapt_query(cache_data_convert, *args, **kwargs):
             f"Unsupported similarity metric type: {chat_cache.similarity_metric_type}"
         )
 
+    # Retrieve every candidate's cache entry in one round trip
+    rets = await chat_cache.data_manager.aget_scalar_data_many(
+        cache_data_list, extra_param=context.get("get_scalar_data", None), model=model
+    )
+
     # Process search results with optional reranking
     if USE_RERANKER:
         reranker = FlagReranker('BAAI/bge-reranker-v2-m3', use_fp16=False)
-        for cache_data in cache_data_list:
+        for cache_data, ret in zip(cache_data_list, rets):
             primary_id = cache_data[1]
-            ret = await asyncio.to_thread(
-                chat_cache.data_manager.get_scalar_data,
-                cache_data, extra_param=context.get("get_scalar_data", None), model=model
-            )
             if ret is None:
                 continue
 
-            rank = reranker.compute_score([pre_embedding_data, ret[0]], normalize=True)[0]
+            rank = reranker.compute_score([pre_embedding_data, resolve_answer(ret[0])], normalize=True)[0]
 
             if "deps" in context and hasattr(ret.question, "deps"):
                 eval_query_data = {
@@ -148,13 +266,8 @@ async def adapt_query(cache_data_convert, *args, **kwargs):
                     cache_ids.append((rank, primary_id))
     else:
         # Original logic without reranking
-        for cache_data in cache_data_list:
+        for cache_data, ret in zip(cache_data_list, rets):
             primary_id = cache_data[1]
-            # Retrieve full cache entry data
-            ret = await asyncio.to_thread(
-                chat_cache.data_manager.get_scalar_data,
-                cache_data, extra_param=context.get("get_scalar_data", None), model=model
-            )
             if ret is None:
                 continue
 
@@ -225,13 +338,6 @@ async def adapt_query(cache_data_convert, *args, **kwargs):
             [t[1] for t in cache_ids]
         )
 
-        # Update hit count for analytics (async to avoid blocking)
-        try:
-            asyncio.create_task(asyncio.to_thread(chat_cache.data_manager.update_hit_count,return_id))
-        except Exception:
-            logging.info('update_hit_count except, please check!')
-
-        # Record cache hit for reporting
-        chat_cache.report.hint_cache()
-        return cache_data_convert(return_message, return_query)
+        # Hit count and hit report are recorded per caller by Cache.handle_query
+        return cache_data_convert(return_message, return_query, return_id)
     return None
\ No newline at end of file
@@ -15,8 +15,7 @@ async def adapt_remove(*args, **kwargs):
     # delete data
     if remove_type == 'delete_by_id':
         id_list = kwargs.pop("id_list", [])
-        resp = await asyncio.to_thread(
-            chat_cache.data_manager.delete,
+        resp = await chat_cache.data_manager.adelete(
             id_list, model=model
         )
     elif remove_type == 'truncate_by_model':
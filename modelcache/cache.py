@@ -8,6 +8,7 @@ from asyncio import AbstractEventLoop
 from typing import Callable, Optional, List, Any, Coroutine
 from modelcache.adapter import adapter
 from modelcache.embedding.embedding_dispatcher import EmbeddingDispatcher
+from modelcache.embedding.embedding_memo import EmbeddingMemo
 from modelcache.utils.model_filter import model_blacklist_filter
 from concurrent.futures import ThreadPoolExecutor, Future
 import configparser
@@ -21,6 +22,7 @@ from modelcache.report import Report
 from modelcache.similarity_evaluation.distance import SearchDistanceEvaluation
 from modelcache.utils.error import CacheError
 from modelcache.utils.log import modelcache_log
+from modelcache.utils.single_flight import SingleFlight
 from modelcache.manager.data_manager import DataManager
 
             #=====================================================================#
@@ -46,6 +48,7 @@ class Cache:
         similarity_threshold_long: float = 0.95,
         prompts: Optional[List[str]] = None,
         log_time_func: Callable[[str, float], None] = None,
+        coalesce_queries: bool = True,
     ):
         if similarity_threshold < 0 or similarity_threshold > 1:
             raise CacheError(
@@ -64,6 +67,8 @@ class Cache:
         self.similarity_threshold_long = similarity_threshold_long
         self.prompts = prompts
         self.log_time_func: Callable[[str, float], None] = log_time_func
+        # Identical concurrent queries share one in-flight lookup
+        self.query_flights: Optional[SingleFlight] = SingleFlight() if coalesce_queries else None
 
         @atexit.register
         def close():
@@ -74,32 +79,27 @@ class Cache:
 
     def save_query_resp(self, query_resp_dict, **kwargs):
         """
-        Save query response asynchronously to avoid blocking main thread.
-        Used for logging and analytics purposes.
+        Save query response for logging and analytics purposes.
+        The data manager queues the row and writes it in batches; on the event loop this never
+        waits, even when the query log policy is "block" and its queue is full.
         """
-        # Execute save operation in a separate thread to maintain async performance
-        asyncio.create_task(asyncio.to_thread(
-            self.data_manager.save_query_resp,
-            query_resp_dict, **kwargs
-        ))
+        self.data_manager.save_query_resp(query_resp_dict, **kwargs)
 
     def save_query_info(self, result, model, query, delta_time_log):
         """
         Save query information with execution timing for performance analysis.
         Serializes query data to JSON for storage.
         """
-        # Convert query to JSON and save asynchronously
-        asyncio.create_task(asyncio.to_thread(
-            self.data_manager.save_query_resp,
+        self.save_query_resp(
             result, model=model, query=json.dumps(query, ensure_ascii=False), delta_time=delta_time_log
-        ))
+        )
 
     async def handle_request(self, param_dict: dict):
         """
         Main entry point for processing cache requests.
 
         Routes requests to appropriate handlers based on request type.
-        Supports: query, insert, remove, register operations.
+        Supports: query, batch_query, insert, remove, register operations.
 
         Args:
             param_dict: Request parameters containing type, scope, query, etc.
@@ -115,17 +115,15 @@ class Cache:
             scope = param_dict.get("scope")
             model = None
             if scope is not None:
-                model = scope.get('model')
-                # Normalize model name for consistent storage (replace special chars)
-                model = model.replace('-', '_')
-                model = model.replace('.', '_')
+                model = self._normalize_model(scope.get('model'))
             query = param_dict.get("query")
             chat_info = param_dict.get("chat_info")
 
             # Validate request type against supported operations
-            if request_type is None or request_type not in ['query', 'insert', 'remove', 'register']:
+            if request_type is None or request_type not in ['query', 'batch_query', 'insert', 'remove', 'register']:
                 result = {"errorCode": 102,
-                          "errorDesc": "type exception, should one of ['query', 'insert', 'remove', 'register']",
+                          "errorDesc": "type exception, should one of "
+                                       "['query', 'batch_query', 'insert', 'remove', 'register']",
                           "cacheHit": False, "delta_time": 0, "hit_query": '', "answer": ''}
                 self.save_query_resp(result, model=model, query='', delta_time=0)
                 return result
@@ -142,6 +140,8 @@ class Cache:
         # Route to appropriate handler based on request type
         if request_type == 'query':
             return await self.handle_query(model, query)
+        elif request_type == 'batch_query':
+            return await self.handle_batch_query(model, param_dict)
         elif request_type == 'insert':
             return await self.handle_insert(chat_info, model)
         elif request_type == 'remove':
@@ -151,6 +151,13 @@ class Cache:
         else:
             return {"errorCode": 400, "errorDesc": "bad request"}
 
+    @staticmethod
+    def _normalize_model(model):
+        # Normalize model name for consistent storage (replace special chars)
+        model = model.replace('-', '_')
+        model = model.replace('.', '_')
+        return model
+
     async def handle_register(self, model):
         response = await adapter.ChatCompletion.create_register(
             model=model,
@@ -210,31 +217,14 @@ class Cache:
         try:
             start_time = time.time()  # Start performance timer
 
-            # Execute query through adapter system
-            response = await adapter.ChatCompletion.create_query(
-                scope={"model": model},
-                query=query,
-                cache_obj=self
-            )
+            # Execute query through adapter system, shared with identical in-flight queries
+            response = await self._coalesced_query(model, query)
 
             # Calculate query execution time
             delta_time = '{}s'.format(round(time.time() - start_time, 2))
 
             # Process different response types
-            if response is None:
-                # No cache hit found
-                result = {"errorCode": 0, "errorDesc": '', "cacheHit": False, "delta_time": delta_time, "hit_query": '',
-                          "answer": ''}
-            elif isinstance(response, str):
-                # Error occurred during query processing
-                result = {"errorCode": 201, "errorDesc": response, "cacheHit": False, "delta_time": delta_time,
-                          "hit_query": '', "answer": ''}
-            else:
-                # Cache hit found - extract response data
-                answer = response['data']
-                hit_query = response['hitQuery']
-                result = {"errorCode": 0, "errorDesc": '', "cacheHit": True, "delta_time": delta_time,
-                          "hit_query": hit_query, "answer": answer}
+            result = self._query_result(response, delta_time, model)
 
             # Log query performance data asynchronously
             delta_time_log = round(time.time() - start_time, 2)
@@ -245,6 +235,112 @@ class Cache:
             logging.info('result: {}'.format(result))
         return result
 
+    async def handle_batch_query(self, model, param_dict):
+        """
+        Look up many queries in one request.
+
+        Each item of param_dict["queries"] is {"query": [...]} and may carry its own
+        {"scope": {"model": ...}}; items without a scope use the request's model.
+        Queries are embedded together and searched with one multi-vector search per model.
+
+        Returns:
+            dict: errorCode, delta_time and "results", one query result per item in order
+        """
+        try:
+            start_time = time.time()
+            items = param_dict.get("queries")
+            if not isinstance(items, list) or len(items) == 0:
+                return {"errorCode": 104, "errorDesc": "queries should be a non-empty list",
+                        "delta_time": 0, "results": []}
+
+            results = [None] * len(items)
+            lookups = []  # (index, model, query) of the items to look up
+            for i, item in enumerate(items):
+                if not isinstance(item, dict):
+                    results[i] = {"errorCode": 104, "errorDesc": "query item should be a dict", "cacheHit": False,
+                                  "delta_time": 0, "hit_query": '', "answer": ''}
+                    continue
+                item_scope = item.get("scope")
+                item_model = model
+                if item_scope:
+                    if not isinstance(item_scope, dict) or not isinstance(item_scope.get('model'), str):
+                        results[i] = {"errorCode": 104, "errorDesc": "query item scope should be a dict with a model",
+                                      "cacheHit": False, "delta_time": 0, "hit_query": '', "answer": ''}
+                        continue
+                    item_model = self._normalize_model(item_scope['model'])
+                filter_resp = model_blacklist_filter(item_model, 'query')
+                if isinstance(filter_resp, dict):
+                    results[i] = filter_resp
+                else:
+                    lookups.append((i, item_model, item.get("query")))
+
+            responses = []
+            if lookups:
+                responses = await adapter.ChatCompletion.create_batch_query(
+                    queries=[(item_model, query) for _, item_model, query in lookups],
+                    cache_obj=self
+                )
+                if isinstance(responses, str):
+                    responses = [responses] * len(lookups)  # The whole batch failed
+
+            delta_time = '{}s'.format(round(time.time() - start_time, 2))
+            delta_time_log = round(time.time() - start_time, 2)
+            for (i, item_model, query), response in zip(lookups, responses):
+                results[i] = self._query_result(response, delta_time, item_model)
+                self.save_query_info(results[i], item_model, query, delta_time_log)
+            return {"errorCode": 0, "errorDesc": '', "delta_time": delta_time, "results": results}
+        except Exception as e:
+            result = {"errorCode": 203, "errorDesc": str(e), "delta_time": 0, "results": []}
+            logging.info('result: {}'.format(result))
+            return result
+
+    def _query_result(self, response, delta_time, model=None):
+        """Turn an adapter query response into the query result returned to the caller."""
+        if response is None:
+            # No cache hit found
+            return {"errorCode": 0, "errorDesc": '', "cacheHit": False, "delta_time": delta_time, "hit_query": '',
+                    "answer": ''}
+        if isinstance(response, str):
+            # Error occurred during query processing
+            return {"errorCode": 201, "errorDesc": response, "cacheHit": False, "delta_time": delta_time,
+                    "hit_query": '', "answer": ''}
+        # Cache hit found - extract response data
+        self.record_hit(response, model)
+        return {"errorCode": 0, "errorDesc": '', "cacheHit": True, "delta_time": delta_time,
+                "hit_query": response['hitQuery'], "answer": response['data']}
+
+    async def _create_query(self, model, query):
+        return await adapter.ChatCompletion.create_query(
+            scope={"model": model},
+            query=query,
+            cache_obj=self
+        )
+
+    async def _coalesced_query(self, model, query):
+        """
+        Run the query lookup, joining an identical lookup already in flight.
+        Queries are identical when their model and JSON-normalized query match.
+        """
+        if self.query_flights is None:
+            return await self._create_query(model, query)
+        try:
+            key = (model, json.dumps(query, sort_keys=True, ensure_ascii=False))
+        except (TypeError, ValueError):
+            return await self._create_query(model, query)
+        return await self.query_flights.do(key, self._create_query, model, query)
+
+    def record_hit(self, response, model=None):
+        """Record a cache hit for one caller: hit report and hit count of the returned entry."""
+        self.report.hint_cache()
+        hit_id = response.get('hitId')
+        if hit_id is None:
+            return
+        # Hit counts are aggregated in memory and flushed in batches, so this does not block
+        try:
+            self.data_manager.update_hit_count(hit_id, model=model)
+        except Exception:
+            logging.info('update_hit_count except, please check!')
+
     def flush(self):
         """Flush all cached data to persistent storage backends."""
         self.data_manager.flush()
@@ -254,16 +350,26 @@ class Cache:
             sql_storage: str,
             vector_storage: str,
             embedding_model: EmbeddingModel,
-            embedding_workers_num: int
+            embedding_workers_num: int,
+            embedding_max_batch_size: int = 32,
+            embedding_max_wait_ms: float = 5,
+            embedding_memo_size: int = 10000,
+            embedding_memo_policy: str = "ARC",
+            exact_match: bool = False,
     ) -> tuple['Cache' , AbstractEventLoop]:
         """
         Initialize a complete Cache system with all required components.
 
         Args:
-            sql_storage: SQL backend type ("mysql", "sqlite", "elasticsearch")
-            vector_storage: Vector backend type ("milvus", "faiss", "chromadb", "redis")
+            sql_storage: SQL backend type ("mysql", "sqlite", "elasticsearch", "lmdb")
+            vector_storage: Vector backend type ("milvus", "faiss", "hnswlib", "numpy", "chromadb", "redis")
             embedding_model: Embedding model enum value
             embedding_workers_num: Number of parallel embedding worker processes
+            embedding_max_batch_size: Max number of texts a worker embeds in one forward pass
+            embedding_max_wait_ms: Max time a worker waits for a micro-batch to fill
+            embedding_memo_size: Number of embeddings memoized by pre-embedding text (0 disables the memo)
+            embedding_memo_policy: Eviction policy of the embedding memo ("ARC", "WTINYLFU", "LRU", ...)
+            exact_match: Serve queries identical to a stored question without embedding or vector search
 
         Returns:
             tuple: (Cache instance, event loop) ready for async operations
@@ -291,6 +397,8 @@ class Cache:
             sql_config.read('modelcache/config/elasticsearch_config.ini')
         elif sql_storage == "sqlite":
             sql_config.read('modelcache/config/sqlite_config.ini')
+        elif sql_storage == "lmdb":
+            sql_config.read('modelcache/config/lmdb_config.ini')
         else:
             modelcache_log.error(f"Unsupported cache storage: {sql_storage}.")
             raise CacheError(f"Unsupported cache storage: {sql_storage}.")
@@ -303,7 +411,11 @@ class Cache:
         elif vector_storage == "redis" :
             vector_config.read('modelcache/config/redis_config.ini')
         elif vector_storage == "faiss" :
-            vector_config = None # FAISS does not require external configuration
+            vector_config.read('modelcache/config/faiss_config.ini')
+        elif vector_storage == "hnswlib" :
+            vector_config.read('modelcache/config/hnswlib_config.ini')
+        elif vector_storage == "numpy" :
+            vector_config.read('modelcache/config/numpy_config.ini')
         else:
             modelcache_log.error(f"Unsupported vector storage: {vector_storage}.")
             raise CacheError(f"Unsupported vector storage: {vector_storage}.")
@@ -321,7 +433,26 @@ class Cache:
             raise CacheError(f"Please set the model_path and dimension for {embedding_model} in modelcache/embedding/base.py.")
 
         # Initialize parallel embedding generation system
-        embedding_dispatcher = EmbeddingDispatcher(embedding_model, model_path, event_loop, embedding_workers_num)
+        embedding_dispatcher = EmbeddingDispatcher(
+            embedding_model,
+            model_path,
+            event_loop,
+            embedding_workers_num,
+            max_batch_size=embedding_max_batch_size,
+            max_wait_ms=embedding_max_wait_ms,
+            dimension=dimension,
+        )
+        embedding_func: Callable = embedding_dispatcher.embed
+
+        # Skip model inference for repeated pre-embedding texts
+        if embedding_memo_size > 0:
+            embedding_memo = EmbeddingMemo(
+                embedding_dispatcher.embed,
+                embedding_model,
+                policy=embedding_memo_policy,
+                max_size=embedding_memo_size,
+            )
+            embedding_func = embedding_memo.embed
 
         #=== These will be used to initialize the cache ===#
         query_pre_embedding_func: Callable = None
@@ -376,6 +507,7 @@ class Cache:
             memory_cache_policy='ARC',
             max_size=10000,
             normalize=normalize,
+            exact_match=exact_match,
         )
 
         #================== Cache Initialization ====================#
@@ -386,7 +518,7 @@ class Cache:
             similarity_metric_type = similarity_metric_type,
             data_manager = data_manager,
             report = Report(),
-            embedding_func = embedding_dispatcher.embed,
+            embedding_func = embedding_func,
             query_pre_embedding_func = query_pre_embedding_func,
             insert_pre_embedding_func = insert_pre_embedding_func,
             similarity_evaluation = similarity_evaluation,
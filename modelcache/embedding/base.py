@@ -52,6 +52,15 @@ class BaseEmbedding(metaclass=ABCMeta):
     def to_embeddings(self, data, **kwargs):
         pass
 
+    def to_embeddings_batch(self, data_list, **kwargs):
+        """
+        Generate embeddings for a list of inputs.
+        Models that support batched inference should override this with a single forward pass.
+        :param data_list: The inputs to embed.
+        :return: A list of embeddings, in the same order as the inputs.
+        """
+        return [self.to_embeddings(data, **kwargs) for data in data_list]
+
     @property
     @abstractmethod
     def dimension(self) -> int:
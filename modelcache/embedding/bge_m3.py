@@ -23,6 +23,9 @@ class BgeM3Embedding(BaseEmbedding):
         embeddings = self.bge_model.encode(data, batch_size=12, max_length=8192)['dense_vecs']
         return np.array(embeddings).astype("float32")
 
+    def to_embeddings_batch(self, data_list, **_):
+        return list(self.to_embeddings(list(data_list)))
+
     @property
     def dimension(self):
         return self.__dimension
\ No newline at end of file
@@ -88,6 +88,19 @@ class Data2VecAudio(BaseEmbedding):
             embedding_array = np.mean(embedding_array_list, axis=0)
             return embedding_array
 
+    def to_embeddings_batch(self, data_list, **kwargs):
+        encoded_input = self.tokenizer(list(data_list), padding=True, truncation=True, return_tensors='pt')
+        # inputs longer than the model window need the sliding-window path, one at a time
+        if int(encoded_input['attention_mask'].sum(dim=1).max()) > 512:
+            return super().to_embeddings_batch(data_list, **kwargs)
+
+        with torch.no_grad():
+            encoded_input = {k: v.to(self.device) for k, v in encoded_input.items()}
+            model_output = self.model(**encoded_input)
+        sentence_embeddings = mean_pooling(model_output, encoded_input['attention_mask'])
+        embedding_array = sentence_embeddings.detach().cpu().numpy().astype("float32")
+        return list(embedding_array)
+
     def post_proc(self, token_embeddings, inputs):
         attention_mask = inputs["attention_mask"]
         input_mask_expanded = (
@@ -1,26 +1,104 @@
+import atexit
 import multiprocessing
+import queue
 import threading
+import time
 import uuid
 import asyncio
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
 import psutil
 from asyncio import Future, AbstractEventLoop
 
 from modelcache.embedding import EmbeddingModel
 from modelcache.embedding.base import BaseEmbedding
 
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 5
+RESULT_SLOTS = 1024
+
+
+def gather_batch(task_queue, max_batch_size: int, max_wait_ms: float) -> list:
+    """
+    Block until one task is available, then keep collecting tasks until either
+    the batch is full or max_wait_ms has passed since the first task arrived.
+    """
+    batch = [task_queue.get()]
+    deadline = time.monotonic() + max_wait_ms / 1000
+    while len(batch) < max_batch_size:
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                batch.append(task_queue.get_nowait())  # Drain what is already queued
+            else:
+                batch.append(task_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def embed_batch(base_embedding: BaseEmbedding, datas: list) -> list:
+    """Run one batched forward pass, returning an embedding or an exception per input."""
+    try:
+        return base_embedding.to_embeddings_batch(datas)
+    except Exception:
+        # Isolate the failing input so the rest of the batch still gets its embeddings
+        results = []
+        for data in datas:
+            try:
+                results.append(base_embedding.to_embeddings(data))
+            except Exception as e:
+                results.append(e)
+        return results
+
 
-def worker_func(embedding_model: EmbeddingModel, model_path, task_queue, result_queue, worker_id):
+def slot_array(shm: shared_memory.SharedMemory, num_slots: int, dimension: int) -> np.ndarray:
+    """View the shared memory block as a (num_slots, dimension) float32 matrix."""
+    return np.ndarray((num_slots, dimension), dtype=np.float32, buffer=shm.buf)
+
+
+def write_result(slots: Optional[np.ndarray], slot: Optional[int], result):
+    """
+    Write an embedding into its shared memory slot.
+    Returns None when the vector went through shared memory, otherwise the result itself,
+    which is then sent through the result queue (exceptions, missing slot, unexpected shape).
+    """
+    if slots is None or slot is None or isinstance(result, Exception):
+        return result
+    try:
+        slots[slot] = result
+    except (ValueError, TypeError):
+        return result
+    return None
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach to the dispatcher's shared memory block without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track flag
+        return shared_memory.SharedMemory(name=name)
+
+
+def worker_func(embedding_model: EmbeddingModel, model_path, task_queue, result_queue, worker_id,
+                max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, shm_name=None, num_slots=0, dimension=0):
     """Worker function that runs in separate processes to generate embeddings."""
     base_embedding = BaseEmbedding.get(embedding_model, model_path=model_path)
+    shm = attach_shared_memory(shm_name) if shm_name else None
+    slots = slot_array(shm, num_slots, dimension) if shm else None
     print(f"Embedding worker {worker_id} started.")
     try:
         while True:
-            job_id, data = task_queue.get()  # Get task from queue
-            try:
-                result = base_embedding.to_embeddings(data)  # Generate embedding
-            except Exception as e:
-                result = e
-            result_queue.put((job_id, result))  # Send result back
+            batch = gather_batch(task_queue, max_batch_size, max_wait_ms)  # Get tasks from queue
+            results = embed_batch(base_embedding, [data for _, _, data in batch])  # Generate embeddings
+            result_queue.put([
+                (job_id, slot, write_result(slots, slot, result))
+                for (job_id, slot, _), result in zip(batch, results)
+            ])  # Send job ids and slots back, vectors stay in shared memory
     except KeyboardInterrupt:
         print(f"Embedding worker {worker_id} stopped.")
     except Exception as e:
@@ -35,16 +113,47 @@ class EmbeddingDispatcher:
         embedding_model: EmbeddingModel,
         model_path: str,
         event_loop: AbstractEventLoop,
-        num_workers: int
+        num_workers: int,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        dimension: Optional[int] = None,
+        result_slots: int = RESULT_SLOTS,
     ):
-        """Initialize the dispatcher with worker processes."""
+        """
+        Initialize the dispatcher with worker processes.
+
+        Each worker groups pending jobs into micro-batches of at most max_batch_size,
+        waiting no longer than max_wait_ms for a batch to fill.
+
+        When the embedding dimension is known, workers write vectors into a preallocated
+        shared memory ring of result_slots float32 slots and only send (job_id, slot)
+        back through the result queue. Jobs submitted while every slot is in use fall
+        back to sending the vector through the queue.
+        """
         if num_workers <= 0:
             raise ValueError("Number of workers must be greater than 0.")
+        if max_batch_size <= 0:
+            raise ValueError("Max batch size must be greater than 0.")
+        if max_wait_ms < 0:
+            raise ValueError("Max wait must not be negative.")
 
         self.task_queue = multiprocessing.Queue()  # Tasks to workers
         self.result_queue = multiprocessing.Queue()  # Results from workers
         self.futures: dict[str, asyncio.Future] = {}  # Pending futures
         self.event_loop = event_loop
+
+        # Shared memory ring for results
+        self.shm: Optional[shared_memory.SharedMemory] = None
+        self.slots: Optional[np.ndarray] = None
+        self.free_slots = deque()
+        num_slots = result_slots if dimension else 0
+        if num_slots > 0:
+            self.shm = shared_memory.SharedMemory(create=True, size=num_slots * dimension * 4)
+            self.slots = slot_array(self.shm, num_slots, dimension)
+            self.free_slots.extend(range(num_slots))
+            atexit.register(self.close)
+        shm_name = self.shm.name if self.shm else None
+
         self._start_result_collector_thread()  # Start result collection thread
 
         # Start worker processes
@@ -52,7 +161,8 @@ class EmbeddingDispatcher:
         for i in range(num_workers):
             p = multiprocessing.Process(
                 target=worker_func,
-                args=(embedding_model, model_path, self.task_queue, self.result_queue, i)
+                args=(embedding_model, model_path, self.task_queue, self.result_queue, i,
+                      max_batch_size, max_wait_ms, shm_name, num_slots, dimension)
             )
             p.daemon = True
             p.start()
@@ -63,13 +173,19 @@ class EmbeddingDispatcher:
         """Start a thread to collect results from worker processes."""
         def collect():
             while True:
-                job_id, result = self.result_queue.get()  # Get result from queue
-                future = self.futures.pop(job_id, None)  # Retrieve future
-                if future:
-                    self.event_loop.call_soon_threadsafe(
-                        future.set_exception if isinstance(result, Exception) else future.set_result,
-                        result
-                    )
+                results = self.result_queue.get()  # Get a batch of results from queue
+                for job_id, slot, result in results:
+                    if slot is not None:
+                        if result is None:
+                            # Copy the vector out of the zero-copy slot view so the slot can be reused
+                            result = self.slots[slot].copy()
+                        self.free_slots.append(slot)
+                    future = self.futures.pop(job_id, None)  # Retrieve future
+                    if future:
+                        self.event_loop.call_soon_threadsafe(
+                            future.set_exception if isinstance(result, Exception) else future.set_result,
+                            result
+                        )
 
         t = threading.Thread(target=collect, daemon=True)
         t.start()
@@ -79,6 +195,21 @@ class EmbeddingDispatcher:
         job_id = str(uuid.uuid4())  # Generate unique job ID
         future = asyncio.get_running_loop().create_future()  # Create future
         self.futures[job_id] = future  # Store future
-        self.task_queue.put((job_id, data))  # Add task to queue
+        try:
+            slot = self.free_slots.popleft()  # Reserve a shared memory slot for the result
+        except IndexError:
+            slot = None
+        self.task_queue.put((job_id, slot, data))  # Add task to queue
         return future
 
+    def close(self):
+        """Release the shared memory ring."""
+        if self.shm is None:
+            return
+        shm, self.shm = self.shm, None
+        self.slots = None
+        try:
+            shm.close()
+            shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+from asyncio import Future
+from functools import partial
+from typing import Callable, Any
+
+from modelcache.embedding.base import EmbeddingModel
+from modelcache.manager.eviction.memory_cache import MemoryCacheEviction
+
+
+class EmbeddingMemo:
+    """
+    Memoizes embeddings in front of an embedding function.
+
+    Entries are keyed by a hash of the pre-embedding text and kept in a bounded
+    memory cache with the given eviction policy (ARC, WTINYLFU, LRU, ...).
+    Concurrent requests for the same text share one in-flight embedding.
+    """
+
+    def __init__(
+        self,
+        embedding_func: Callable[[Any], Future],
+        embedding_model: EmbeddingModel,
+        policy: str = "ARC",
+        max_size: int = 10000,
+    ):
+        if max_size <= 0:
+            raise ValueError("Max size must be greater than 0.")
+        self.embedding_func = embedding_func
+        self.embedding_model = embedding_model
+        self._cache = MemoryCacheEviction(policy=policy, maxsize=max_size, clean_size=1)
+        self._inflight: dict[bytes, Future] = {}
+
+    @staticmethod
+    def key(data) -> bytes:
+        """Hash the pre-embedding text (or raw bytes) into a fixed-size cache key."""
+        if not isinstance(data, (bytes, bytearray)):
+            data = str(data).encode("utf-8")
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def embed(self, data) -> Future:
+        """Return the memoized embedding, joining an in-flight request for the same text if any."""
+        key = self.key(data)
+        cached = self._cache.get(key, model=self.embedding_model.name)
+        if cached is not None:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(cached)
+            return future
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = self.embedding_func(data)
+            self._inflight[key] = future
+            future.add_done_callback(partial(self._on_done, key))
+        # Shield the shared future so a cancelled caller does not cancel it for everyone else
+        return asyncio.shield(future)
+
+    def _on_done(self, key: bytes, future: Future):
+        self._inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if hasattr(result, "setflags"):
+            result.setflags(write=False)  # The same array is handed to every caller
+        self._cache.put([(key, result)], model=self.embedding_model.name)
+
+    def clear(self):
+        self._cache.clear(self.embedding_model.name)
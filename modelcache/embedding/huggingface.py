@@ -29,6 +29,18 @@ class Huggingface(BaseEmbedding):
         embeddings = self.model.encode(data)
         return embeddings[0] if len(data) == 1 else embeddings
 
+    def to_embeddings_batch(self, data_list, **_):
+        """Generate embeddings for a batch of texts in a single forward pass
+
+        :param data_list: texts in strings.
+        :type data_list: List[str]
+
+        :return: a list of text embeddings, each in shape of (dim,).
+        """
+        if not data_list:
+            raise ValueError("No data provided for embedding.")
+        return list(self.model.encode(list(data_list)))
+
     @property
     def dimension(self):
         """Embedding dimension.
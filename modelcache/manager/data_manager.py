@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import logging
-import time
 import requests
 import pickle
 import numpy as np
@@ -13,6 +13,9 @@ from modelcache.utils.error import CacheError, ParamError
 from modelcache.manager.vector_data.base import VectorStorage, VectorData
 from modelcache.manager.object_data.base import ObjectBase
 from modelcache.manager.eviction.memory_cache import MemoryCacheEviction
+from modelcache.manager.exact_match_index import ExactMatchIndex
+from modelcache.manager.hit_count_aggregator import HitCountAggregator
+from modelcache.manager.query_log_writer import QueryLogWriter
 from modelcache.utils.log import modelcache_log
 
 
@@ -35,6 +38,10 @@ class DataManager(metaclass=ABCMeta):
     def get_scalar_data(self, res_data, **kwargs) -> CacheData:
         pass
 
+    def get_scalar_data_many(self, res_datas, **kwargs) -> List[Optional[CacheData]]:
+        """Retrieve the scalar data of several search results, in order, None for entries not found."""
+        return [self.get_scalar_data(res_data, **kwargs) for res_data in res_datas]
+
     @abstractmethod
     def update_hit_count(self, primary_id, **kwargs):
         pass
@@ -42,10 +49,38 @@ class DataManager(metaclass=ABCMeta):
     def hit_cache_callback(self, res_data, **kwargs):
         pass
 
+    def exact_match(self, question, **kwargs):
+        """Return the cache id of a stored question identical to this one, if tracked."""
+        return None
+
     @abstractmethod
     def search(self, embedding_data, **kwargs):
         pass
 
+    def search_many(self, embedding_datas, **kwargs):
+        """Search several embeddings of one model, returning one result list per embedding."""
+        return [self.search(embedding_data, **kwargs) for embedding_data in embedding_datas]
+
+    async def asearch(self, embedding_data, **kwargs):
+        """Search from an event loop; runs search in a worker thread unless overridden."""
+        return await asyncio.to_thread(self.search, embedding_data, **kwargs)
+
+    async def asave(self, question, answer, embedding_data, **kwargs):
+        """Save from an event loop; runs save in a worker thread unless overridden."""
+        return await asyncio.to_thread(self.save, question, answer, embedding_data, **kwargs)
+
+    async def aget_scalar_data(self, res_data, **kwargs) -> Optional[CacheData]:
+        """Same as get_scalar_data, from an event loop."""
+        return await asyncio.to_thread(self.get_scalar_data, res_data, **kwargs)
+
+    async def aget_scalar_data_many(self, res_datas, **kwargs) -> List[Optional[CacheData]]:
+        """Same as get_scalar_data_many, from an event loop."""
+        return await asyncio.to_thread(self.get_scalar_data_many, res_datas, **kwargs)
+
+    async def adelete(self, id_list, **kwargs):
+        """Same as delete, from an event loop."""
+        return await asyncio.to_thread(self.delete, id_list, **kwargs)
+
     @abstractmethod
     def delete(self, id_list, **kwargs):
         pass
@@ -72,7 +107,12 @@ class DataManager(metaclass=ABCMeta):
             memory_cache_policy: str = "ARC",
             data_path: str = "data_map.txt",
             get_data_container: Callable = None,
-            normalize: bool = True
+            normalize: bool = True,
+            exact_match: bool = False,
+            hit_count_flush_interval: float = 1.0,
+            hit_count_flush_size: int = 1000,
+            query_log_queue_size: int = 10000,
+            query_log_policy: str = "drop",
     ):
         if not cache_base and not vector_base:
             return MapDataManager(data_path, max_size, get_data_container)
@@ -84,7 +124,12 @@ class DataManager(metaclass=ABCMeta):
         if isinstance(object_base, str):
             object_base = ObjectBase.get(name=object_base)
         assert cache_base and vector_base
-        return SSDataManager(cache_base, vector_base, object_base, max_size, clean_size,normalize, memory_cache_policy)
+        return SSDataManager(cache_base, vector_base, object_base, max_size, clean_size,normalize, memory_cache_policy,
+                             exact_match=exact_match,
+                             hit_count_flush_interval=hit_count_flush_interval,
+                             hit_count_flush_size=hit_count_flush_size,
+                             query_log_queue_size=query_log_queue_size,
+                             query_log_policy=query_log_policy)
 
 
 class MapDataManager(DataManager):
@@ -170,6 +215,11 @@ class SSDataManager(DataManager):
         clean_size,
         normalize: bool,
         policy="LRU",
+        exact_match: bool = False,
+        hit_count_flush_interval: float = 1.0,
+        hit_count_flush_size: int = 1000,
+        query_log_queue_size: int = 10000,
+        query_log_policy: str = "drop",
     ):
         self.max_size = max_size
         self.clean_size = clean_size
@@ -184,16 +234,36 @@ class SSDataManager(DataManager):
             maxsize=max_size,
             clean_size=clean_size)
 
+        # Optional exact-match tier in front of the vector search
+        self.exact_index = ExactMatchIndex() if exact_match else None
+
+        # Hit counts are summed in memory and written to SQL storage in batches
+        self.hit_counts = HitCountAggregator(
+            self.s.update_hit_counts,
+            flush_interval=hit_count_flush_interval,
+            max_pending=hit_count_flush_size)
+
+        # Query log rows are queued and written by a background thread in multi-row inserts
+        self.query_log = QueryLogWriter(
+            self.s.batch_insert_query_resp,
+            max_queue_size=query_log_queue_size,
+            policy=query_log_policy)
+
     def save(self, questions: List[any], answers: List[any], embedding_datas: List[any], **kwargs):
         """Save multiple questions, answers, and embeddings to storage."""
         model = kwargs.pop("model", None)
         self.import_data(questions, answers, embedding_datas, model)
 
+    async def asave(self, questions: List[any], answers: List[any], embedding_datas: List[any], **kwargs):
+        """Same as save, awaiting the SQL storage's async insert."""
+        model = kwargs.pop("model", None)
+        embedding_datas, cache_datas = self._prepare_import(questions, answers, embedding_datas, model)
+        ids = await self.s.abatch_insert(cache_datas)
+        await asyncio.to_thread(self._index_imported, ids, questions, embedding_datas, cache_datas, model)
+
     def save_query_resp(self, query_resp_dict, **kwargs):
-        """Save query response log to SQL storage for analytics."""
-        save_query_start_time = time.time()
-        self.s.insert_query_resp(query_resp_dict, **kwargs)
-        save_query_delta_time = '{}s'.format(round(time.time() - save_query_start_time, 2))
+        """Queue a query response log row; it reaches SQL storage with the next batched write."""
+        self.query_log.put(query_resp_dict, **kwargs)
 
     def _process_answer_data(self, answers: Union[Answer, List[Answer]]):
         if isinstance(answers, Answer):
@@ -227,6 +297,14 @@ class SSDataManager(DataManager):
         Coordinates data insertion across SQL, vector, and object storage,
         with memory cache population and optional vector normalization.
         """
+        embedding_datas, cache_datas = self._prepare_import(questions, answers, embedding_datas, model)
+
+        # Insert into SQL storage and get generated IDs
+        ids = self.s.batch_insert(cache_datas)
+        self._index_imported(ids, questions, embedding_datas, cache_datas, model)
+
+    def _prepare_import(self, questions, answers, embedding_datas, model):
+        """Validate and normalize new entries, returning their embeddings and SQL storage rows."""
         if len(questions) != len(answers) or len(questions) != len(embedding_datas):
             raise ParamError("Make sure that all parameters have the same length")
         cache_datas = []
@@ -243,17 +321,30 @@ class SSDataManager(DataManager):
 
             embedding_data = embedding_data.astype("float32")
             cache_datas.append([answer, question, embedding_data, model])
+        return embedding_datas, cache_datas
 
-        # Insert into SQL storage and get generated IDs
-        ids = self.s.batch_insert(cache_datas)
-
+    def _index_imported(self, ids, questions, embedding_datas, cache_datas, model):
+        """
+        Make entries already written to SQL storage searchable.
+        ids holds one entry per row; a None id marks a row the storage failed to write, which is skipped.
+        """
         # Prepare vector data and populate memory cache
         datas = []
         for _id,embedding_data,cache_data in zip(ids,embedding_datas,cache_datas):
+            if _id is None:
+                continue
             datas.append(VectorData(id=_id, data=embedding_data.astype("float32")))
-            self.eviction_base.put([(_id, cache_data)],model=model)
+            # Nothing reads a cached entry's embedding, so the memory cache does not hold it
+            answer, question, _, model_name = cache_data
+            self.eviction_base.put([(_id, (answer, question, None, model_name))], model=model)
         self.v.mul_add(datas,model)
 
+        # Index question text only once the entries are searchable
+        if self.exact_index is not None:
+            for _id, question in zip(ids, questions):
+                if _id is not None:
+                    self.exact_index.put(question, _id, model)
+
     def get_scalar_data(self, res_data, **kwargs) -> Optional[CacheData]:
         """
         Retrieve scalar data with multi-level caching strategy.
@@ -273,14 +364,70 @@ class SSDataManager(DataManager):
         self.eviction_base.put([(_id, cache_data)], model=model)
         return cache_data
 
+    async def aget_scalar_data(self, res_data, **kwargs) -> Optional[CacheData]:
+        """Same as get_scalar_data, awaiting the SQL storage on a memory cache miss."""
+        model = kwargs.pop("model")
+        _id = res_data[1]
+        cache_hit = self.eviction_base.get(_id, model=model)
+        if cache_hit is not None:
+            return cache_hit
+        cache_data = await self.s.aget_data_by_id(_id)
+        if cache_data is None:
+            return None
+        self.eviction_base.put([(_id, cache_data)], model=model)
+        return cache_data
+
+    def get_scalar_data_many(self, res_datas, **kwargs) -> List[Optional[CacheData]]:
+        """
+        Retrieve scalar data for several search results at once.
+
+        Entries in the memory cache are served directly; the misses are
+        fetched from SQL storage in a single round trip.
+        """
+        model = kwargs.pop("model")
+        ids, results, missing = self._cached_scalar_data(res_datas, model)
+        if missing:
+            fetched = self.s.get_data_by_ids(missing)
+            results = self._merge_fetched(ids, results, fetched, model)
+        return results
+
+    async def aget_scalar_data_many(self, res_datas, **kwargs) -> List[Optional[CacheData]]:
+        """Same as get_scalar_data_many, awaiting the SQL storage for the misses."""
+        model = kwargs.pop("model")
+        ids, results, missing = self._cached_scalar_data(res_datas, model)
+        if missing:
+            fetched = await self.s.aget_data_by_ids(missing)
+            results = self._merge_fetched(ids, results, fetched, model)
+        return results
+
+    def _cached_scalar_data(self, res_datas, model):
+        """Ids of the search results, their memory cache entries (None on a miss) and the distinct missing ids."""
+        ids = [res_data[1] for res_data in res_datas]
+        results = [self.eviction_base.get(_id, model=model) for _id in ids]
+        missing = list(dict.fromkeys(_id for _id, ret in zip(ids, results) if ret is None))
+        return ids, results, missing
+
+    def _merge_fetched(self, ids, results, fetched, model):
+        if fetched:
+            self.eviction_base.put(list(fetched.items()), model=model)
+        return [fetched.get(_id) if ret is None else ret for _id, ret in zip(ids, results)]
+
     def update_hit_count(self, primary_id, **kwargs):
-        """Update hit count statistics in SQL storage."""
-        self.s.update_hit_count_by_id(primary_id)
+        """Count a hit; the increment reaches SQL storage with the next batched flush."""
+        model = kwargs.pop("model", None)
+        self.hit_counts.add(primary_id, model)
 
     def hit_cache_callback(self, res_data, **kwargs):
         """Callback executed on cache hit to update memory cache."""
         self.eviction_base.get(res_data[1])
 
+    def exact_match(self, question, **kwargs):
+        """Look up the cache id of a stored question with identical normalized text."""
+        if self.exact_index is None:
+            return None
+        model = kwargs.pop("model", None)
+        return self.exact_index.get(question, model)
+
     def search(self, embedding_data, **kwargs):
         """
         Search for similar vectors in vector storage.
@@ -293,6 +440,27 @@ class SSDataManager(DataManager):
         top_k = kwargs.get("top_k", -1)
         return self.v.search(data=embedding_data, top_k=top_k, model=model)
 
+    async def asearch(self, embedding_data, **kwargs):
+        """Same as search, awaiting the vector storage's async search."""
+        model = kwargs.pop("model", None)
+        if self.normalize:
+            embedding_data = normalize(embedding_data)
+        top_k = kwargs.get("top_k", -1)
+        return await self.v.asearch(data=embedding_data, top_k=top_k, model=model)
+
+    def search_many(self, embedding_datas, **kwargs):
+        """
+        Search several embeddings of one model in a single vector storage call.
+
+        Returns one result list per embedding, in order.
+        """
+        model = kwargs.pop("model", None)
+        datas = np.asarray(embedding_datas, dtype="float32").reshape(len(embedding_datas), -1)
+        if self.normalize:
+            datas = datas / np.linalg.norm(datas, axis=1, keepdims=True)
+        top_k = kwargs.get("top_k", -1)
+        return self.v.search_many(datas=datas, top_k=top_k, model=model)
+
     def delete(self, id_list, **kwargs):
         """
         Delete cache entries from all storage backends.
@@ -302,21 +470,49 @@ class SSDataManager(DataManager):
         """
         model = kwargs.pop("model")
         try:
-            # Remove from memory cache
-            for id in id_list:
-                self.eviction_base.get_cache(model).pop(id, None)
-            # Delete from vector storage
-            v_delete_count = self.v.delete(ids=id_list, model=model)
+            v_delete_count = self._delete_searchable(id_list, model)
         except Exception as e:
-            return {'status': 'failed', 'milvus': 'delete milvus data failed, please check! e: {}'.format(e),
-                    'mysql': 'unexecuted'}
+            return self._vector_delete_failed(e)
         try:
             # Mark as deleted in SQL storage
             s_delete_count = self.s.mark_deleted(id_list)
         except Exception as e:
-            return {'status': 'failed', 'milvus': 'success',
-                    'mysql': 'delete mysql data failed, please check! e: {}'.format(e)}
+            return self._scalar_delete_failed(e)
+        return self._delete_succeeded(v_delete_count, s_delete_count)
+
+    async def adelete(self, id_list, **kwargs):
+        """Same as delete, awaiting the SQL storage's async mark_deleted."""
+        model = kwargs.pop("model")
+        try:
+            v_delete_count = await asyncio.to_thread(self._delete_searchable, id_list, model)
+        except Exception as e:
+            return self._vector_delete_failed(e)
+        try:
+            s_delete_count = await self.s.amark_deleted(id_list)
+        except Exception as e:
+            return self._scalar_delete_failed(e)
+        return self._delete_succeeded(v_delete_count, s_delete_count)
+
+    def _delete_searchable(self, id_list, model):
+        """Remove entries from the memory cache, exact-match index and vector storage."""
+        for id in id_list:
+            self.eviction_base.get_cache(model).pop(id, None)
+        if self.exact_index is not None:
+            self.exact_index.remove(id_list, model)
+        return self.v.delete(ids=id_list, model=model)
+
+    @staticmethod
+    def _vector_delete_failed(e):
+        return {'status': 'failed', 'milvus': 'delete milvus data failed, please check! e: {}'.format(e),
+                'mysql': 'unexecuted'}
+
+    @staticmethod
+    def _scalar_delete_failed(e):
+        return {'status': 'failed', 'milvus': 'success',
+                'mysql': 'delete mysql data failed, please check! e: {}'.format(e)}
 
+    @staticmethod
+    def _delete_succeeded(v_delete_count, s_delete_count):
         return {'status': 'success', 'milvus': 'delete_count: '+str(v_delete_count),
                 'mysql': 'delete_count: '+str(s_delete_count)}
 
@@ -333,6 +529,8 @@ class SSDataManager(DataManager):
         """
         # Clear memory cache data
         self.eviction_base.clear(model)
+        if self.exact_index is not None:
+            self.exact_index.clear(model)
 
         # Rebuild vector storage (drops and recreates collection)
         try:
@@ -353,11 +551,16 @@ class SSDataManager(DataManager):
 
     def flush(self):
         """Flush all storage backends to ensure data persistence."""
+        self.hit_counts.flush()
+        self.query_log.flush()
         self.s.flush()
         self.v.flush()
 
     def close(self):
         """Close all storage connections and release resources."""
+        # Drain pending hit counts and query log rows while storage is still open
+        self.hit_counts.close()
+        self.query_log.close()
         self.s.close()
         self.v.close()
 
@@ -20,7 +20,7 @@ class EvictionManager:
         self.delete_count = 0
 
     def check_evict(self):
-        mark_count = self._scalar_storage.count(state=-1)
+        mark_count = self._scalar_storage.count(state=1)
         all_count = self._scalar_storage.count(is_all=True)
         if (
             mark_count > self.MAX_MARK_COUNT
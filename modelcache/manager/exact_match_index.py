@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional, Iterable
+
+
+class ExactMatchIndex:
+    """
+    Per-model hash index from normalized question text to cache id.
+
+    Lets a query whose text is identical to a stored question skip embedding and
+    vector search. Each model keeps at most max_size entries, least recently used first out.
+    """
+
+    def __init__(self, max_size: int = 100000):
+        if max_size <= 0:
+            raise ValueError("Max size must be greater than 0.")
+        self.max_size = max_size
+        self._models: dict[str, OrderedDict] = {}  # model -> {question hash: id}
+        self._reverse: dict[str, dict] = {}  # model -> {id: question hash}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question) -> str:
+        if hasattr(question, "content"):
+            question = question.content
+        return unicodedata.normalize("NFC", str(question)).strip()
+
+    @classmethod
+    def key(cls, question) -> bytes:
+        return hashlib.blake2b(cls.normalize(question).encode("utf-8"), digest_size=16).digest()
+
+    def put(self, question, _id: Any, model: str):
+        key = self.key(question)
+        with self._lock:
+            index = self._models.setdefault(model, OrderedDict())
+            reverse = self._reverse.setdefault(model, {})
+            old_id = index.pop(key, None)
+            if old_id is not None:
+                reverse.pop(old_id, None)
+            index[key] = _id
+            reverse[_id] = key
+            while len(index) > self.max_size:
+                _, evicted_id = index.popitem(last=False)
+                reverse.pop(evicted_id, None)
+
+    def get(self, question, model: str) -> Optional[Any]:
+        key = self.key(question)
+        with self._lock:
+            index = self._models.get(model)
+            if index is None:
+                return None
+            _id = index.get(key)
+            if _id is not None:
+                index.move_to_end(key)
+            return _id
+
+    def remove(self, ids: Iterable[Any], model: str):
+        with self._lock:
+            index = self._models.get(model)
+            reverse = self._reverse.get(model)
+            if index is None:
+                return
+            for _id in ids:
+                key = reverse.pop(_id, None)
+                if key is not None:
+                    index.pop(key, None)
+
+    def clear(self, model: str):
+        with self._lock:
+            self._models.pop(model, None)
+            self._reverse.pop(model, None)
+
+    def __len__(self):
+        return sum(len(index) for index in self._models.values())
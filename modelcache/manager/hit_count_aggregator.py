@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from modelcache.utils.error import HitCountUpdateError
+from modelcache.utils.log import modelcache_log
+
+
+class HitCountAggregator:
+    """
+    Accumulate hit-count increments in memory and write them in batches.
+
+    Increments are summed per (model, id) and handed to flush_func as one
+    {id: count} dict, either every flush_interval seconds or as soon as
+    max_pending distinct entries are waiting, whichever comes first.
+    A failed flush is retried with the next one; when flush_func raises
+    HitCountUpdateError only the increments it names are retried, so the
+    ones that were applied are never counted twice.
+    """
+
+    def __init__(
+            self,
+            flush_func: Callable[[Dict[Any, int]], None],
+            flush_interval: float = 1.0,
+            max_pending: int = 1000,
+    ):
+        if flush_interval <= 0:
+            raise ValueError("flush_interval should be greater than 0")
+        if max_pending <= 0:
+            raise ValueError("max_pending should be greater than 0")
+        self.flush_func = flush_func
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending: Dict[Tuple[Hashable, Any], int] = {}
+        self._lock = threading.Lock()
+        # Serializes flushes so a timer flush and a close() flush never interleave
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="hit-count-flusher", daemon=True)
+        self._thread.start()
+
+    def add(self, primary_id, model=None, count: int = 1):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("HitCountAggregator is closed")
+            key = (model, primary_id)
+            self._pending[key] = self._pending.get(key, 0) + count
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every pending increment now."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            counts: Dict[Any, int] = {}
+            for (_, primary_id), count in pending.items():
+                counts[primary_id] = counts.get(primary_id, 0) + count
+            try:
+                self.flush_func(counts)
+                return
+            except HitCountUpdateError as e:
+                modelcache_log.error(f"hit count flush failed for {len(e.failed)} of {len(counts)} entries, will retry them")
+                # Split the failed count of each id back over the models it was summed from
+                left = dict(e.failed)
+                retry = {}
+                for key, count in pending.items():
+                    count = min(count, left.get(key[1], 0))
+                    if count > 0:
+                        left[key[1]] -= count
+                        retry[key] = count
+            except Exception as e:
+                modelcache_log.error(f"hit count flush failed, will retry: {e}")
+                retry = pending
+            # Put the increments back so they go out with the next flush
+            with self._lock:
+                for key, count in retry.items():
+                    self._pending[key] = self._pending.get(key, 0) + count
+
+    def close(self):
+        """Stop the background flusher and drain what is left."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._closed:
+                break
+            self.flush()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from modelcache.utils.log import modelcache_log
+
+QueryLogRow = Tuple[Dict[str, Any], Dict[str, Any]]  # (query_resp, kwargs) as given to insert_query_resp
+
+_STOP = object()
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class QueryLogWriter:
+    """
+    Buffer query log rows in a bounded queue and write them in batches.
+
+    A background thread collects up to batch_size rows, waiting at most
+    flush_interval seconds after the first one, and hands them to
+    write_func in one call. When the queue is full, policy "drop"
+    discards the new row and policy "block" waits for room. A caller on
+    an event loop never waits itself: under "block" its rows go to a
+    handoff thread that does the waiting, so the loop keeps serving.
+    """
+
+    POLICIES = ("drop", "block")
+
+    def __init__(
+            self,
+            write_func: Callable[[List[QueryLogRow]], None],
+            max_queue_size: int = 10000,
+            batch_size: int = 500,
+            flush_interval: float = 1.0,
+            policy: str = "drop",
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown query log policy {policy}, expected one of {self.POLICIES}")
+        if max_queue_size <= 0 or batch_size <= 0:
+            raise ValueError("max_queue_size and batch_size should be greater than 0")
+        self.write_func = write_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        # Serializes writes so flush() and the background thread never write concurrently
+        self._write_lock = threading.Lock()
+        self._dropped = 0
+        self._flushed = 0
+        self._failed = 0
+        self._closed = False
+        # Rows from event loop callers waiting for room under "block", oldest first
+        self._handoff = collections.deque()
+        self._handoff_ready = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+        self._thread.start()
+        self._handoff_thread = None
+        if policy == "block":
+            self._handoff_thread = threading.Thread(target=self._run_handoff, name="query-log-handoff", daemon=True)
+            self._handoff_thread.start()
+
+    def put(self, query_resp: Dict[str, Any], **kwargs):
+        """Queue one row; only waits under the "block" policy, and never on an event loop."""
+        if self._closed:
+            self._count(dropped=1)
+            return
+        row = (query_resp, kwargs)
+        if self.policy == "block":
+            if _on_event_loop():
+                self._hand_off(row)
+            else:
+                self._queue.put(row)
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count(dropped=1)
+
+    def flush(self):
+        """Write every row queued so far from the calling thread."""
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is _STOP:
+                self._queue.put(_STOP)  # Leave the stop marker for the background thread
+                break
+            rows.append(row)
+            if len(rows) >= self.batch_size:
+                self._write(rows)
+                rows = []
+        self._write(rows)
+
+    def close(self):
+        """Stop accepting rows and write out everything still queued."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._handoff_thread is not None:
+            # The stop marker goes through the handoff so rows waiting there are written first
+            self._hand_off(_STOP)
+            self._handoff_thread.join()
+        else:
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def flushed(self) -> int:
+        return self._flushed
+
+    @property
+    def failed(self) -> int:
+        return self._failed
+
+    def __len__(self):
+        with self._lock:
+            return self._queue.qsize() + len(self._handoff)
+
+    def _count(self, dropped=0, flushed=0, failed=0):
+        with self._lock:
+            self._dropped += dropped
+            self._flushed += flushed
+            self._failed += failed
+
+    def _hand_off(self, row):
+        with self._handoff_ready:
+            if not self._handoff:
+                try:
+                    self._queue.put_nowait(row)
+                    return
+                except queue.Full:
+                    pass
+            self._handoff.append(row)
+            self._handoff_ready.notify()
+
+    def _run_handoff(self):
+        while True:
+            with self._handoff_ready:
+                while not self._handoff:
+                    self._handoff_ready.wait()
+                row = self._handoff[0]
+            # Waits for room; later rows queue up behind this one in the handoff
+            self._queue.put(row)
+            with self._lock:
+                self._handoff.popleft()
+            if row is _STOP:
+                return
+
+    def _write(self, rows: List[QueryLogRow]):
+        if not rows:
+            return
+        with self._write_lock:
+            try:
+                self.write_func(rows)
+            except Exception as e:
+                modelcache_log.error(f"query log write of {len(rows)} rows failed: {e}")
+                self._count(failed=len(rows))
+                return
+        self._count(flushed=len(rows))
+
+    def _run(self):
+        while True:
+            row = self._queue.get()
+            if row is _STOP:
+                return
+            rows = [row]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stop = True
+                    break
+                rows.append(row)
+            self._write(rows)
+            if stop:
+                return
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from modelcache.utils import import_zstandard
+from modelcache.utils.error import ParamError
+from modelcache.utils.log import modelcache_log
+
+# How the scalar store keeps answer text: verbatim in each row, or once per distinct
+# answer of a model in a shared table, zstd-compressed with a dictionary trained per model
+ANSWER_STORAGES = ("plain", "zstd")
+
+# Codec of a stored answer blob
+CODEC_RAW = 0
+CODEC_ZSTD = 1
+
+ZSTD_LEVEL = 3
+# A model's dictionary is trained from its first DICT_TRAIN_SAMPLES distinct answers
+DICT_TRAIN_SAMPLES = 256
+DICT_SIZE = 16 * 1024
+
+
+def check_answer_storage(storage: str) -> str:
+    if storage not in ANSWER_STORAGES:
+        raise ParamError(f"Unsupported answer storage: {storage}, expected one of {ANSWER_STORAGES}.")
+    return storage
+
+
+def content_hash(model, answer: str) -> str:
+    """Dedup key of an answer; scoped to the model so that deleting a model never drops another model's answers."""
+    return hashlib.sha256(f"{model}\x00{answer}".encode("utf-8")).hexdigest()
+
+
+class LazyAnswer:
+    """
+    A stored answer that stays compressed until read, so memory-cached entries keep the compressed size.
+    str() decompresses it; resolve_answer does the same and passes plain strings through.
+    The dictionary is loaded when the answer is read from storage, so str() never queries the store.
+    """
+
+    __slots__ = ("_zstd", "_zstd_dict", "_data")
+
+    def __init__(self, zstd, zstd_dict, data: bytes):
+        self._zstd = zstd
+        self._zstd_dict = zstd_dict
+        self._data = data
+
+    def __str__(self):
+        return self._zstd.ZstdDecompressor(dict_data=self._zstd_dict).decompress(self._data).decode("utf-8")
+
+    def __repr__(self):
+        return f"LazyAnswer({len(self._data)} bytes)"
+
+    def __eq__(self, other):
+        if isinstance(other, (LazyAnswer, str)):
+            return str(self) == str(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+
+def resolve_answer(answer):
+    """Plain text of an answer as read from the scalar store."""
+    return str(answer) if isinstance(answer, LazyAnswer) else answer
+
+
+class AnswerCodec:
+    """
+    Compresses answers with a zstd dictionary per model.
+
+    The storage passed in persists the dictionaries and must provide
+    load_answer_dict(dict_id) -> bytes, latest_answer_dict(model) -> (dict_id, bytes) or None,
+    and save_answer_dict(model, data) -> dict_id. Until a model has seen enough distinct
+    answers to train on, its answers are compressed without a dictionary (dict_id 0).
+    """
+
+    def __init__(
+        self,
+        store,
+        level: int = ZSTD_LEVEL,
+        dict_size: int = DICT_SIZE,
+        train_samples: int = DICT_TRAIN_SAMPLES,
+    ):
+        import_zstandard()
+        import zstandard
+
+        self._zstd = zstandard
+        self._store = store
+        self.level = level
+        self.dict_size = dict_size
+        self.train_samples = train_samples
+        self._dicts: Dict[int, object] = {}
+        self._model_dicts: Dict[str, Tuple[int, object]] = {}
+        self._samples: Dict[str, List[bytes]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, dict_id: int):
+        zstd_dict = self._dicts.get(dict_id)
+        if zstd_dict is None:
+            zstd_dict = self.add_dict(dict_id, self._store.load_answer_dict(dict_id))
+        return zstd_dict
+
+    def add_dict(self, dict_id: int, data: bytes):
+        """Cache a dictionary fetched by the caller, for stores that load them without blocking."""
+        zstd_dict = self._zstd.ZstdCompressionDict(data)
+        self._dicts[dict_id] = zstd_dict
+        return zstd_dict
+
+    def missing_dicts(self, dict_ids) -> List[int]:
+        """The ids among dict_ids whose dictionary is not cached yet."""
+        return [dict_id for dict_id in set(dict_ids) if dict_id and dict_id not in self._dicts]
+
+    def _model_dict(self, model) -> Tuple[int, Optional[object]]:
+        entry = self._model_dicts.get(model)
+        if entry is None:
+            latest = self._store.latest_answer_dict(model)
+            if latest is None:
+                entry = (0, None)
+            else:
+                dict_id, data = latest
+                entry = (dict_id, self._zstd.ZstdCompressionDict(data))
+                self._dicts[dict_id] = entry[1]
+            self._model_dicts[model] = entry
+        return entry
+
+    def _train(self, model, raw: bytes):
+        samples = self._samples.setdefault(model, [])
+        samples.append(raw)
+        if len(samples) < self.train_samples:
+            return
+        del self._samples[model]
+        try:
+            zstd_dict = self._zstd.train_dictionary(self.dict_size, samples)
+        except self._zstd.ZstdError as e:
+            # Too little material to train on; try again on the next round of samples
+            modelcache_log.warning("Could not train an answer dictionary for %s: %s", model, e)
+            return
+        dict_id = self._store.save_answer_dict(model, zstd_dict.as_bytes())
+        self._dicts[dict_id] = zstd_dict
+        self._model_dicts[model] = (dict_id, zstd_dict)
+
+    def compress(self, model, answer: str) -> Tuple[int, int, bytes]:
+        """(codec, dict_id, data) to store for a new distinct answer of model."""
+        raw = str(answer).encode("utf-8")
+        with self._lock:
+            dict_id, zstd_dict = self._model_dict(model)
+            if zstd_dict is None:
+                self._train(model, raw)
+            compressor = self._zstd.ZstdCompressor(level=self.level, dict_data=zstd_dict)
+            data = compressor.compress(raw)
+        if len(data) >= len(raw):
+            return CODEC_RAW, 0, raw
+        return CODEC_ZSTD, dict_id, data
+
+    def forget(self, model):
+        """Drop what is cached for a deleted model, so its next answers start a new dictionary."""
+        with self._lock:
+            self._model_dicts.pop(model, None)
+            self._samples.pop(model, None)
+
+    def decompress(self, dict_id: int, data: bytes) -> str:
+        zstd_dict = self._load(dict_id) if dict_id else None
+        return self._zstd.ZstdDecompressor(dict_data=zstd_dict).decompress(data).decode("utf-8")
+
+    def decode(self, codec: int, dict_id: int, data):
+        """
+        Answer for a stored blob: the text itself for raw blobs, a LazyAnswer for compressed ones.
+        Loads the blob's dictionary if it is not cached, so call it where blocking on the store is fine.
+        """
+        if codec == CODEC_ZSTD:
+            return LazyAnswer(self._zstd, self._load(dict_id) if dict_id else None, bytes(data))
+        return bytes(data).decode("utf-8")
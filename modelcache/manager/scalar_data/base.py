@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
+import asyncio
 from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass
 from typing import Union, Dict, List, Optional, Any
 from enum import IntEnum
 import numpy as np
 
-from modelcache.utils import import_sql_client
-from modelcache.utils.error import NotFoundError
+from modelcache.utils import import_aiomysql, import_lmdb, import_sql_client
+from modelcache.utils.error import HitCountUpdateError, NotFoundError
 
 
 class DataType(IntEnum):
@@ -101,8 +102,19 @@ class CacheStorage(metaclass=ABCMeta):
     def insert_query_resp(self, query_resp, **kwargs):
         pass
 
+    def batch_insert_query_resp(self, rows: List[Any]):
+        """Write several query log rows, each a (query_resp, kwargs) pair as given to insert_query_resp."""
+        for query_resp, kwargs in rows:
+            self.insert_query_resp(query_resp, **kwargs)
+
+    @abstractmethod
+    def get_data_by_id(self, key, with_embedding: bool = False):
+        """Fetch one entry as (answer, question, embedding, model); the embedding is None unless asked for."""
+        pass
+
     @abstractmethod
-    def get_data_by_id(self, key):
+    def get_data_by_ids(self, keys: List[Any], with_embedding: bool = False) -> Dict[Any, Any]:
+        """Fetch several entries in one round trip, returning {id: data} for the ids found."""
         pass
 
     @abstractmethod
@@ -135,28 +147,107 @@ class CacheStorage(metaclass=ABCMeta):
 
     @abstractmethod
     def batch_insert(self, all_data: List[CacheData]):
+        """Store the rows and return one id per row, in order; None marks a row that could not be stored."""
         pass
 
     @abstractmethod
     def update_hit_count_by_id(self, primary_id):
         pass
 
+    def update_hit_counts(self, counts: Dict[Any, int]):
+        """
+        Add counts[id] to the hit count of each entry; backends override this with one batched write.
+        Raises HitCountUpdateError with the increments still to apply if only some went through.
+        """
+        left = dict(counts)
+        try:
+            for primary_id, count in counts.items():
+                for _ in range(count):
+                    self.update_hit_count_by_id(primary_id)
+                    left[primary_id] -= 1
+        except Exception as e:
+            if left == counts:
+                raise
+            raise HitCountUpdateError({k: v for k, v in left.items() if v > 0}) from e
+
+    # Coroutine variants for the request path. They run the blocking method in a
+    # worker thread; backends with a native async driver should override them.
+
+    async def abatch_insert(self, all_data: List[CacheData]):
+        return await asyncio.to_thread(self.batch_insert, all_data)
+
+    async def aget_data_by_id(self, key, with_embedding: bool = False):
+        return await asyncio.to_thread(self.get_data_by_id, key, with_embedding)
+
+    async def aget_data_by_ids(self, keys: List[Any], with_embedding: bool = False) -> Dict[Any, Any]:
+        return await asyncio.to_thread(self.get_data_by_ids, keys, with_embedding)
+
+    async def amark_deleted(self, keys):
+        return await asyncio.to_thread(self.mark_deleted, keys)
+
+    async def ainsert_query_resp(self, query_resp, **kwargs):
+        return await asyncio.to_thread(self.insert_query_resp, query_resp, **kwargs)
+
     @staticmethod
     def get(name, **kwargs):
         if name in ["mysql", "oceanbase"]:
-            from modelcache.manager.scalar_data.sql_storage import SQLStorage
             config = kwargs.get("config")
+            async_client = kwargs.get("async_client")
+            if async_client is None and config is not None:
+                async_client = config.get("mysql", "async_client", fallback="false")
             import_sql_client(name)
-            cache_base = SQLStorage(db_type=name, config=config)
+            if str(async_client).lower() in ("true", "1", "yes"):
+                import_aiomysql()
+                from modelcache.manager.scalar_data.sql_storage_aiomysql import AsyncSQLStorage
+                cache_base = AsyncSQLStorage(
+                    db_type=name,
+                    config=config,
+                    embedding_storage=kwargs.get("embedding_storage"),
+                    answer_storage=kwargs.get("answer_storage"),
+                    pool_minsize=kwargs.get("pool_minsize"),
+                    pool_maxsize=kwargs.get("pool_maxsize"),
+                )
+            else:
+                from modelcache.manager.scalar_data.sql_storage import SQLStorage
+                cache_base = SQLStorage(
+                    db_type=name,
+                    config=config,
+                    embedding_storage=kwargs.get("embedding_storage"),
+                    answer_storage=kwargs.get("answer_storage"),
+                )
         elif name == 'sqlite':
             SQL_URL = {"sqlite": "./sqlite.db"}
             from modelcache.manager.scalar_data.sql_storage_sqlite import SQLStorage
             sql_url = kwargs.get("sql_url", SQL_URL[name])
-            cache_base = SQLStorage(db_type=name, url=sql_url)
+            cache_base = SQLStorage(
+                db_type=name,
+                url=sql_url,
+                embedding_storage=kwargs.get("embedding_storage", "full"),
+                answer_storage=kwargs.get("answer_storage", "plain"),
+            )
+        elif name == 'lmdb':
+            import_lmdb()
+            from modelcache.manager.scalar_data.sql_storage_lmdb import SQLStorage, MAP_SIZE
+            config = kwargs.get("config")
+
+            def option(key, default):
+                if key in kwargs:
+                    return kwargs[key]
+                if config is not None and config.has_option("lmdb", key):
+                    return config.get("lmdb", key)
+                return default
+
+            cache_base = SQLStorage(
+                db_type=name,
+                path=option("path", "./lmdb_cache"),
+                embedding_storage=option("embedding_storage", "full"),
+                map_size=int(option("map_size", MAP_SIZE)),
+                sync=str(option("sync", True)).lower() in ("true", "1", "yes"),
+            )
         elif name == 'elasticsearch':
             from modelcache.manager.scalar_data.sql_storage_es import SQLStorage
             config = kwargs.get("config")
-            cache_base = SQLStorage(db_type=name, config=config)
+            cache_base = SQLStorage(db_type=name, config=config, embedding_storage=kwargs.get("embedding_storage"))
         else:
             raise NotFoundError("cache store", name)
         return cache_base
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from typing import Optional
+
+import numpy as np
+
+from modelcache.manager.vector_data.quantization import dequantize, quantize_per_vector
+from modelcache.utils.error import ParamError
+
+# How the scalar store keeps each entry's embedding: raw float32, not at all, or compressed
+EMBEDDING_STORAGES = ("full", "none", "float16", "int8")
+
+# Compressed blobs start with a 4-byte tag that reads as a float32 NaN, which no
+# stored embedding starts with, so rows written under any setting decode alike.
+_FLOAT16_TAG = b"\x01\x00\xa0\x7f"
+_INT8_TAG = b"\x02\x00\xa0\x7f"
+
+
+def check_embedding_storage(storage: str) -> str:
+    if storage not in EMBEDDING_STORAGES:
+        raise ParamError(f"Unsupported embedding storage: {storage}, expected one of {EMBEDDING_STORAGES}.")
+    return storage
+
+
+def encode_embedding(embedding, storage: str = "full") -> bytes:
+    """Blob stored for an embedding; empty when embeddings are not stored."""
+    if storage == "none":
+        return b""
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    if storage == "float16":
+        return _FLOAT16_TAG + vector.astype(np.float16).tobytes()
+    if storage == "int8":
+        codes, scales = quantize_per_vector(vector[None, :])
+        return _INT8_TAG + scales.tobytes() + codes.tobytes()
+    return vector.tobytes()
+
+
+def decode_embedding(blob) -> Optional[np.ndarray]:
+    """float32 embedding of a stored blob, whatever setting wrote it; None when nothing was stored."""
+    if not blob:
+        return None
+    blob = bytes(blob)
+    tag = blob[:4]
+    if tag == _FLOAT16_TAG:
+        return np.frombuffer(blob, dtype=np.float16, offset=4).astype(np.float32)
+    if tag == _INT8_TAG:
+        scales = np.frombuffer(blob, dtype=np.float32, count=1, offset=4)
+        codes = np.frombuffer(blob, dtype=np.int8, offset=8)
+        return dequantize(codes[None, :], scales)[0]
+    return np.frombuffer(blob, dtype=np.float32)
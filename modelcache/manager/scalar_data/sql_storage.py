@@ -3,18 +3,53 @@ import uuid
 
 import pymysql
 import json
-import numpy as np
-from typing import List
+from typing import Dict, List
+from modelcache.manager.scalar_data.answer_codec import AnswerCodec, check_answer_storage, content_hash
 from modelcache.manager.scalar_data.base import CacheStorage, CacheData
+from modelcache.manager.scalar_data.embedding_codec import (
+    check_embedding_storage,
+    decode_embedding,
+    encode_embedding,
+)
 from DBUtils.PooledDB import PooledDB
 
 
+ANSWER_TABLE = "modelcache_llm_answer"
+LOG_TABLE = "modelcache_query_log"
+# Distinct answers and the zstd dictionaries they are compressed with, used with answer_storage = zstd
+BLOB_TABLE = "modelcache_answer_blob"
+DICT_TABLE = "modelcache_answer_dict"
+
+BATCH_INSERT_SQL = f"""
+    INSERT INTO {ANSWER_TABLE}
+    (id, question, answer, answer_type, model, embedding_data, is_deleted)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+BATCH_INSERT_BLOB_REF_SQL = f"""
+    INSERT INTO {ANSWER_TABLE}
+    (id, question, answer, answer_type, model, embedding_data, is_deleted, answer_id)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+INSERT_BLOB_SQL = f"""
+    INSERT IGNORE INTO {BLOB_TABLE}
+    (content_hash, model, codec, dict_id, data)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+INSERT_LOG_SQL = f"""
+    INSERT INTO {LOG_TABLE}
+    (error_code, error_desc, cache_hit, model, query, delta_time, hit_query, answer)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
 class SQLStorage(CacheStorage):
 
     def __init__(
         self,
         db_type: str = "mysql",
-        config=None
+        config=None,
+        embedding_storage: str = None,
+        answer_storage: str = None,
     ):
 
         self.host = config.get('mysql', 'host')
@@ -30,17 +65,91 @@ class SQLStorage(CacheStorage):
             port=self.port,
             database=self.database
         )
+        # full, none, float16 or int8; see embedding_codec
+        if embedding_storage is None:
+            embedding_storage = config.get('mysql', 'embedding_storage', fallback='full')
+        self.embedding_storage = check_embedding_storage(embedding_storage)
+        # plain or zstd; see answer_codec. Reads join the blob table in either mode, so the
+        # answer_id column and the blob and dict tables are needed
+        if answer_storage is None:
+            answer_storage = config.get('mysql', 'answer_storage', fallback='plain')
+        self.answer_storage = check_answer_storage(answer_storage)
+        self._answer_codec = None
 
     def create(self):
         pass
 
+    @property
+    def answer_codec(self) -> AnswerCodec:
+        if self._answer_codec is None:
+            self._answer_codec = AnswerCodec(self)
+        return self._answer_codec
+
+    def _fetch(self, sql, args, fetch="all"):
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, args)
+                return cursor.fetchone() if fetch == "one" else cursor.fetchall()
+        finally:
+            conn.close()
+
+    def load_answer_dict(self, dict_id: int) -> bytes:
+        return self._fetch(f"SELECT data FROM {DICT_TABLE} WHERE id = %s", (dict_id,), fetch="one")[0]
+
+    def latest_answer_dict(self, model):
+        return self._fetch(
+            f"SELECT id, data FROM {DICT_TABLE} WHERE model = %s ORDER BY id DESC LIMIT 1", (model,), fetch="one")
+
+    def save_answer_dict(self, model, data: bytes) -> int:
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {DICT_TABLE} (model, data) VALUES (%s, %s)", (model, data))
+                dict_id = cursor.lastrowid
+                conn.commit()
+        finally:
+            conn.close()
+        return dict_id
+
+    def _blob_ids(self, cursor, hashes: List[str]) -> Dict[str, int]:
+        if not hashes:
+            return {}
+        placeholders = ",".join(["%s"] * len(hashes))
+        # A shared lock until the insert commits, so clear_deleted_data cannot remove a blob
+        # that the new rows are about to refer to; it waits, then sees the references
+        cursor.execute(
+            f"SELECT content_hash, id FROM {BLOB_TABLE} WHERE content_hash IN ({placeholders}) LOCK IN SHARE MODE",
+            hashes)
+        return dict(cursor.fetchall())
+
+    def _store_answers(self, cursor, all_data: List[List]) -> List[int]:
+        """
+        Blob id of every row's answer, storing the answers not seen before compressed.
+        Identical answers of a model share one blob, keyed by content_hash.
+        """
+        hashes = [content_hash(data[3], data[0]) for data in all_data]
+        distinct = list(dict.fromkeys(hashes))
+        stored = self._blob_ids(cursor, distinct)
+        blobs = {}
+        for answer_hash, data in zip(hashes, all_data):
+            if answer_hash not in stored and answer_hash not in blobs:
+                blobs[answer_hash] = (answer_hash, data[3]) + self.answer_codec.compress(data[3], data[0])
+        if blobs:
+            cursor.executemany(INSERT_BLOB_SQL, list(blobs.values()))
+            # INSERT IGNORE skips blobs a concurrent writer stored first, so their ids are read back
+            stored.update(self._blob_ids(cursor, list(blobs)))
+        return [stored[answer_hash] for answer_hash in hashes]
+
     def _insert(self, data: List):
+        if self.answer_storage == "zstd":
+            return self.batch_insert([data])[0]
         answer = data[0]
         question = data[1]
         embedding_data = data[2]
         model = data[3]
         answer_type = 0
-        embedding_data = embedding_data.tobytes()
+        embedding_data = encode_embedding(embedding_data, self.embedding_storage)
         is_deleted = 0
         _id = str(uuid.uuid4())
 
@@ -63,20 +172,36 @@ class SQLStorage(CacheStorage):
         return _id
 
     def batch_insert(self, all_data: List[List]):
-        table_name = "modelcache_llm_answer"
-        insert_sql = f"""
-            INSERT INTO {table_name}
-            (id, question, answer, answer_type, model, embedding_data, is_deleted)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
+        ids, values_list = self._batch_insert_values(all_data)
+
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                if self.answer_storage == "zstd":
+                    answer_ids = self._store_answers(cursor, all_data)
+                    values_list = [
+                        (_id, question, "", answer_type, model, embedding_data, is_deleted, answer_id)
+                        for (_id, question, _, answer_type, model, embedding_data, is_deleted), answer_id
+                        in zip(values_list, answer_ids)
+                    ]
+                    cursor.executemany(BATCH_INSERT_BLOB_REF_SQL, values_list)
+                else:
+                    cursor.executemany(BATCH_INSERT_SQL, values_list)
+                conn.commit()
+        finally:
+            conn.close()
+
+        return ids
 
+    def _batch_insert_values(self, all_data: List[List]):
+        """Generated ids and the BATCH_INSERT_SQL parameter rows for all_data."""
         values_list = []
         ids = []
 
         for data in all_data:
             answer = data[0]
             question = data[1]
-            embedding_data = data[2].tobytes()
+            embedding_data = encode_embedding(data[2], self.embedding_storage)
             model = data[3]
             answer_type = 0
             is_deleted = 0
@@ -86,18 +211,10 @@ class SQLStorage(CacheStorage):
             values_list.append((
                 _id, question, answer, answer_type, model, embedding_data, is_deleted
             ))
+        return ids, values_list
 
-        conn = self.pool.connection()
-        try:
-            with conn.cursor() as cursor:
-                cursor.executemany(insert_sql, values_list)
-                conn.commit()
-        finally:
-            conn.close()
-
-        return ids
-
-    def insert_query_resp(self, query_resp, **kwargs):
+    @staticmethod
+    def _query_log_values(query_resp, **kwargs):
         error_code = query_resp.get('errorCode')
         error_desc = query_resp.get('errorDesc')
         cache_hit = query_resp.get('cacheHit')
@@ -109,46 +226,89 @@ class SQLStorage(CacheStorage):
 
         if isinstance(hit_query, list):
             hit_query = json.dumps(hit_query, ensure_ascii=False)
+        return error_code, error_desc, cache_hit, model, query, delta_time, hit_query, answer
 
-        table_name = "modelcache_query_log"
-        insert_sql = f"""
-            INSERT INTO {table_name} 
-            (error_code, error_desc, cache_hit, model, query, delta_time, hit_query, answer) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
+    def insert_query_resp(self, query_resp, **kwargs):
         conn = self.pool.connection()
         try:
             with conn.cursor() as cursor:
                 # 执行插入数据操作
-                values = (error_code, error_desc, cache_hit, model, query, delta_time, hit_query, answer)
-                cursor.execute(insert_sql, values)
+                values = self._query_log_values(query_resp, **kwargs)
+                cursor.execute(INSERT_LOG_SQL, values)
                 conn.commit()
         finally:
             # 关闭连接，将连接返回给连接池
             conn.close()
 
-    def get_data_by_id(self, key: int):
-        table_name = "modelcache_llm_answer"
-        query_sql = f"""
-            SELECT answer, question, embedding_data, model
-            FROM {table_name}
-            WHERE id = %s
+    def batch_insert_query_resp(self, rows):
+        if not rows:
+            return
+        values = [self._query_log_values(query_resp, **kwargs) for query_resp, kwargs in rows]
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                # executemany turns this into one multi-row INSERT
+                cursor.executemany(INSERT_LOG_SQL, values)
+                conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _select_columns(with_embedding: bool) -> str:
+        embedding_column = "a.embedding_data" if with_embedding else "NULL"
+        # Rows written with answer_storage = zstd find their answer in the blob table, also after
+        # switching back to plain; rows without an answer_id keep their answer inline
+        return f"""a.answer, a.question, {embedding_column}, a.model, b.codec, b.dict_id, b.data
+            FROM {ANSWER_TABLE} a LEFT JOIN {BLOB_TABLE} b ON b.id = a.answer_id"""
+
+    def _get_data_by_id_sql(self, with_embedding: bool) -> str:
+        return f"""
+            SELECT {self._select_columns(with_embedding)}
+            WHERE a.id = %s
+        """
+
+    def _get_data_by_ids_sql(self, count: int, with_embedding: bool) -> str:
+        placeholders = ",".join(["%s"] * count)
+        return f"""
+            SELECT a.id, {self._select_columns(with_embedding)}
+            WHERE a.id IN ({placeholders})
         """
+
+    def _to_data(self, resp):
+        if resp is None or len(resp) not in (4, 7):
+            return None
+        answer, question, embedding_data, model = resp[:4]
+        if len(resp) == 7 and resp[6] is not None:
+            answer = self.answer_codec.decode(resp[4], resp[5], resp[6])
+        # parse the numpy array from bytes and return the data
+        return answer, question, decode_embedding(embedding_data), model
+
+    def _to_data_by_id(self, rows):
+        return {row[0]: self._to_data(row[1:]) for row in rows}
+
+    def get_data_by_id(self, key: int, with_embedding: bool = False):
         conn = self.pool.connection()
         try:
             with conn.cursor() as cursor:
                 # 执行数据库操作
-                cursor.execute(query_sql, (key,))
+                cursor.execute(self._get_data_by_id_sql(with_embedding), (key,))
                 resp = cursor.fetchone()
         finally:
             # 关闭连接，将连接返回给连接池
             conn.close()
+        return self._to_data(resp)
 
-        if resp is not None and len(resp) == 4:
-            # parse the numpy array from bytes and return the data
-            return resp[0], resp[1], np.frombuffer(resp[2], dtype=np.float32), resp[3]
-        else:
-            return None
+    def get_data_by_ids(self, keys: List, with_embedding: bool = False):
+        if not keys:
+            return {}
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(self._get_data_by_ids_sql(len(keys), with_embedding), list(keys))
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+        return self._to_data_by_id(rows)
 
     def update_hit_count_by_id(self, primary_id: int):
         table_name = "modelcache_llm_answer"
@@ -169,6 +329,27 @@ class SQLStorage(CacheStorage):
             # 关闭连接，将连接返回给连接池
             conn.close()
 
+    def update_hit_counts(self, counts: Dict[int, int]):
+        if not counts:
+            return
+        table_name = "modelcache_llm_answer"
+        ids = list(counts)
+        cases = " ".join(["WHEN %s THEN %s"] * len(ids))
+        placeholders = ",".join(["%s"] * len(ids))
+        update_sql = f"""
+            UPDATE {table_name}
+            SET hit_count = hit_count + CASE id {cases} END
+            WHERE id IN ({placeholders})
+        """
+        params = [v for primary_id in ids for v in (primary_id, counts[primary_id])] + ids
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(update_sql, params)
+                conn.commit()
+        finally:
+            conn.close()
+
     def get_ids(self, deleted=True):
         table_name = "modelcache_llm_answer"
         state = 1 if deleted else 0
@@ -188,19 +369,20 @@ class SQLStorage(CacheStorage):
         
         return ids
 
-    def mark_deleted(self, keys):
-        table_name = "modelcache_llm_answer"
-        placeholders = ",".join(["%s"] * len(keys))
-        mark_sql = f"""
-            UPDATE {table_name}
+    @staticmethod
+    def _mark_deleted_sql(count: int) -> str:
+        placeholders = ",".join(["%s"] * count)
+        return f"""
+            UPDATE {ANSWER_TABLE}
             SET is_deleted=1 
             WHERE id in ({placeholders})
         """
 
+    def mark_deleted(self, keys):
         conn = self.pool.connection()
         try:
             with conn.cursor() as cursor:
-                cursor.execute(mark_sql, keys)
+                cursor.execute(self._mark_deleted_sql(len(keys)), keys)
                 delete_count = cursor.rowcount
                 conn.commit()
         finally:
@@ -230,9 +412,15 @@ class SQLStorage(CacheStorage):
                 # 执行删除该模型对应日志操作 resp_log行数不返回
                 resp_log = cursor.execute(delete_log_sql, (model_name,))
                 conn.commit()  # 分别提交事务
+                if self.answer_storage == "zstd":
+                    cursor.execute(f"DELETE FROM {BLOB_TABLE} WHERE model = %s", (model_name,))
+                    cursor.execute(f"DELETE FROM {DICT_TABLE} WHERE model = %s", (model_name,))
+                    conn.commit()
         finally:
             # 关闭连接，将连接返回给连接池
             conn.close()
+        if self._answer_codec is not None:
+            self._answer_codec.forget(model_name)
         return resp
 
     def clear_deleted_data(self):
@@ -247,6 +435,14 @@ class SQLStorage(CacheStorage):
             with conn.cursor() as cursor:
                 cursor.execute(delete_sql)
                 delete_count = cursor.rowcount
+                if self.answer_storage == "zstd":
+                    # Answers no longer referenced by any row. Blobs that a running insert has looked up
+                    # are share-locked by it (see _blob_ids), so this waits and then finds them in use
+                    cursor.execute(f"""
+                        DELETE b FROM {BLOB_TABLE} b
+                        LEFT JOIN {table_name} a ON a.answer_id = b.id
+                        WHERE a.id IS NULL
+                    """)
                 conn.commit()
         finally:
             conn.close()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import List
+
+import aiomysql
+
+from modelcache.manager.scalar_data.answer_codec import CODEC_ZSTD
+from modelcache.manager.scalar_data.sql_storage import BATCH_INSERT_SQL, DICT_TABLE, INSERT_LOG_SQL, SQLStorage
+
+POOL_MINSIZE = 1
+POOL_MAXSIZE = 10
+
+
+class AsyncSQLStorage(SQLStorage):
+    """
+    MySQL storage whose request-path calls (the a* coroutines) run on an aiomysql pool,
+    so the event loop awaits them without a worker thread per call.
+
+    The blocking methods inherited from SQLStorage stay on the pymysql pool; background
+    writers such as the hit count aggregator and the query log writer keep using them.
+    The aiomysql pool is created on first use by the event loop that awaits it.
+    """
+
+    def __init__(
+        self,
+        db_type: str = "mysql",
+        config=None,
+        embedding_storage: str = None,
+        answer_storage: str = None,
+        pool_minsize: int = None,
+        pool_maxsize: int = None,
+    ):
+        super().__init__(
+            db_type=db_type,
+            config=config,
+            embedding_storage=embedding_storage,
+            answer_storage=answer_storage,
+        )
+        if pool_minsize is None:
+            pool_minsize = config.getint('mysql', 'async_pool_minsize', fallback=POOL_MINSIZE)
+        if pool_maxsize is None:
+            pool_maxsize = config.getint('mysql', 'async_pool_maxsize', fallback=POOL_MAXSIZE)
+        self.pool_minsize = int(pool_minsize)
+        self.pool_maxsize = int(pool_maxsize)
+        if self.pool_minsize < 0 or self.pool_maxsize < max(self.pool_minsize, 1):
+            raise ValueError(
+                f"Invalid async pool size: minsize={self.pool_minsize}, maxsize={self.pool_maxsize}."
+            )
+        self._apool_loop = None
+        self._apool_future = None
+
+    async def _create_pool(self):
+        # autocommit keeps reads from leaving a transaction open, which would make the pool discard the connection
+        return await aiomysql.create_pool(
+            host=self.host,
+            port=self.port,
+            user=self.username,
+            password=self.password,
+            db=self.database,
+            minsize=self.pool_minsize,
+            maxsize=self.pool_maxsize,
+            autocommit=True,
+        )
+
+    async def _get_pool(self):
+        loop = asyncio.get_running_loop()
+        if self._apool_loop is not loop:
+            # Coroutines racing for the first connection share one pool creation
+            self._apool_loop = loop
+            self._apool_future = asyncio.ensure_future(self._create_pool())
+        try:
+            return await self._apool_future
+        except Exception:
+            self._apool_loop = None
+            raise
+
+    async def _execute(self, sql, args=None, many=False, fetch=None):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                if many:
+                    await cursor.executemany(sql, args)
+                else:
+                    await cursor.execute(sql, args)
+                if fetch == "one":
+                    return await cursor.fetchone()
+                if fetch == "all":
+                    return await cursor.fetchall()
+                return cursor.rowcount
+
+    async def abatch_insert(self, all_data: List[List]):
+        if self.answer_storage == "zstd":
+            # Deduplication reads and writes the blob table in the insert's transaction
+            return await asyncio.to_thread(self.batch_insert, all_data)
+        ids, values_list = self._batch_insert_values(all_data)
+        if values_list:
+            await self._execute(BATCH_INSERT_SQL, values_list, many=True)
+        return ids
+
+    async def _load_answer_dicts(self, rows):
+        """Fetch the zstd dictionaries of compressed answers in rows, so _to_data decodes them without blocking."""
+        dict_ids = [row[-2] for row in rows if row and len(row) >= 7 and row[-3] == CODEC_ZSTD]
+        if not dict_ids:
+            return
+        for dict_id in self.answer_codec.missing_dicts(dict_ids):
+            resp = await self._execute(f"SELECT data FROM {DICT_TABLE} WHERE id = %s", (dict_id,), fetch="one")
+            self.answer_codec.add_dict(dict_id, resp[0])
+
+    async def aget_data_by_id(self, key, with_embedding: bool = False):
+        resp = await self._execute(self._get_data_by_id_sql(with_embedding), (key,), fetch="one")
+        await self._load_answer_dicts([resp])
+        return self._to_data(resp)
+
+    async def aget_data_by_ids(self, keys: List, with_embedding: bool = False):
+        if not keys:
+            return {}
+        rows = await self._execute(self._get_data_by_ids_sql(len(keys), with_embedding), list(keys), fetch="all")
+        await self._load_answer_dicts(rows)
+        return self._to_data_by_id(rows)
+
+    async def amark_deleted(self, keys):
+        if not keys:
+            return 0
+        return await self._execute(self._mark_deleted_sql(len(keys)), list(keys))
+
+    async def ainsert_query_resp(self, query_resp, **kwargs):
+        await self._execute(INSERT_LOG_SQL, self._query_log_values(query_resp, **kwargs))
+
+    def _take_pool(self):
+        """Detach and return the aiomysql pool, or None if none was created."""
+        future, self._apool_future, self._apool_loop = self._apool_future, None, None
+        if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    async def aclose(self):
+        pool = self._take_pool()
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+    def close(self):
+        # Called outside the event loop (e.g. at exit): drop the pooled connections without awaiting
+        pool = self._take_pool()
+        if pool is not None:
+            pool.terminate()
+        super().close()
@@ -1,10 +1,29 @@
 # -*- coding: utf-8 -*-
+import base64
 import json
-from typing import List
+from typing import Dict, List, Optional
+import numpy as np
 from elasticsearch import Elasticsearch, helpers
 from modelcache.manager.scalar_data.base import CacheStorage, CacheData
+from modelcache.manager.scalar_data.embedding_codec import (
+    check_embedding_storage,
+    decode_embedding,
+    encode_embedding,
+)
+import threading
 import time
 from snowflake import SnowflakeGenerator
+from modelcache.utils.error import HitCountUpdateError, ParamError
+from modelcache.utils.log import modelcache_log
+
+# Documents per bulk request
+BULK_CHUNK_SIZE = 500
+# When bulk writes become visible to search: "false" leaves it to the index refresh
+# interval, "wait_for" blocks until the next scheduled refresh, "true" forces one
+REFRESH_POLICIES = ("false", "wait_for", "true")
+# Item statuses worth retrying; other failures, such as an update of a
+# document that has been deleted since (404), would fail again
+RETRY_STATUSES = (409, 429)
 
 
 class SQLStorage(CacheStorage):
@@ -12,7 +31,10 @@ class SQLStorage(CacheStorage):
     def __init__(
             self,
             db_type: str = "elasticsearch",
-            config=None
+            config=None,
+            embedding_storage: str = None,
+            bulk_chunk_size: int = None,
+            refresh: str = None,
     ):
         self.host = config.get('elasticsearch', 'host')
         self.port = int(config.get('elasticsearch', 'port'))
@@ -22,12 +44,30 @@ class SQLStorage(CacheStorage):
             http_auth=('esuser', 'password')
         )
 
+        # full, none, float16 or int8; see embedding_codec
+        if embedding_storage is None:
+            embedding_storage = config.get('elasticsearch', 'embedding_storage', fallback='full')
+        self.embedding_storage = check_embedding_storage(embedding_storage)
+
+        if bulk_chunk_size is None:
+            bulk_chunk_size = config.getint('elasticsearch', 'bulk_chunk_size', fallback=BULK_CHUNK_SIZE)
+        self.bulk_chunk_size = int(bulk_chunk_size)
+        if self.bulk_chunk_size <= 0:
+            raise ParamError(f"bulk_chunk_size must be positive, got {self.bulk_chunk_size}.")
+        if refresh is None:
+            refresh = config.get('elasticsearch', 'refresh', fallback='false')
+        self.refresh = str(refresh).lower()
+        if self.refresh not in REFRESH_POLICIES:
+            raise ParamError(f"Unsupported refresh policy: {refresh}, expected one of {REFRESH_POLICIES}.")
+
         self.log_index = "modelcache_query_log"
         self.ans_index = "modelcache_llm_answer"
         self.create()
-        self.instance_id = 1  # 雪花算法使用的机器id 使用同一套数据库的分布式系统需要配置不同id
+        # 雪花算法使用的机器id 使用同一套数据库的分布式系统需要配置不同id
+        self.instance_id = config.getint('elasticsearch', 'instance_id', fallback=1)
         # 生成雪花id
         self.snowflake_id = SnowflakeGenerator(self.instance_id)
+        self._snowflake_lock = threading.Lock()
 
     def create(self):
         answer_index_body = {
@@ -69,42 +109,75 @@ class SQLStorage(CacheStorage):
         if not self.client.indices.exists(index=self.log_index):
             self.client.indices.create(index=self.log_index, body=log_index_body)
 
-    def _insert(self, data: List) -> str or None:
+    def _next_ids(self, count: int) -> List[int]:
+        """Draw count snowflake ids under one lock acquisition."""
+        ids = []
+        with self._snowflake_lock:
+            while len(ids) < count:
+                _id = next(self.snowflake_id)
+                if _id is None:
+                    # The generator has used up this millisecond's sequence numbers
+                    time.sleep(0.0005)
+                    continue
+                ids.append(_id)
+        return ids
+
+    def _bulk(self, actions, refresh: str = "false", raise_on_exception: bool = True):
+        """
+        Send actions through streaming_bulk in chunks of bulk_chunk_size.
+        Returns the (ok, item) result of every action, in order; failures are logged.
+        With raise_on_exception=False a chunk whose request fails is reported
+        as failed items instead of raising after earlier chunks went through.
+        """
+        results = []
+        for ok, item in helpers.streaming_bulk(
+                self.client, actions,
+                chunk_size=self.bulk_chunk_size,
+                raise_on_error=False,
+                raise_on_exception=raise_on_exception,
+                refresh=refresh,
+        ):
+            if not ok:
+                modelcache_log.error("Elasticsearch bulk action failed: %s", item)
+            results.append((ok, item))
+        return results
+
+    @staticmethod
+    def _retryable(item) -> bool:
+        status = next(iter(item.values()), {}).get("status")
+        # Request-level errors carry no HTTP status ("N/A")
+        return not isinstance(status, int) or status in RETRY_STATUSES or status >= 500
+
+    def _answer_doc(self, data: List):
         doc = {
             "answer": data[0],
             "question": data[1],
-            "embedding_data": data[2].tolist() if hasattr(data[2], "tolist") else data[2],
             "model": data[3],
             "answer_type": 0,
             "hit_count": 0,
             "is_deleted": 0
         }
+        if self.embedding_storage != "none":
+            # binary fields take base64
+            blob = encode_embedding(data[2], self.embedding_storage)
+            doc["embedding_data"] = base64.b64encode(blob).decode("ascii")
+        return doc
 
-        try:
-
-            response = self.client.index(
-                index=self.ans_index,
-                id=next(self.snowflake_id),
-                body=doc,
-            )
-            return int(response['_id'])
-        except Exception as e:
-
-            print(f"Failed to insert document: {e}")
-            return None
-
-    def batch_insert(self, all_data: List[List]) -> List[str]:
-        successful_ids = []
-        for data in all_data:
-            _id = self._insert(data)
-            if _id is not None:
-                successful_ids.append(_id)
-        self.client.indices.refresh(index=self.ans_index)  # 批量插入后手动刷新
+    def _insert(self, data: List) -> str or None:
+        return self.batch_insert([data])[0]
 
-        return successful_ids
+    def batch_insert(self, all_data: List[List]) -> List[Optional[str]]:
+        """One id per row, in order; None for a document that failed to index."""
+        ids = self._next_ids(len(all_data))
+        actions = (
+            {"_index": self.ans_index, "_id": _id, "_source": self._answer_doc(data)}
+            for _id, data in zip(ids, all_data)
+        )
+        return [_id if ok else None for _id, (ok, _) in zip(ids, self._bulk(actions, refresh=self.refresh))]
 
-    def insert_query_resp(self, query_resp, **kwargs):
-        doc = {
+    @staticmethod
+    def _query_log_doc(query_resp, **kwargs):
+        return {
             "error_code": query_resp.get('errorCode'),
             "error_desc": query_resp.get('errorDesc'),
             "cache_hit": query_resp.get('cacheHit'),
@@ -118,22 +191,64 @@ class SQLStorage(CacheStorage):
             "is_deleted": 0
 
         }
-        self.client.index(index=self.log_index, body=doc)
 
-    def get_data_by_id(self, key: int):
+    def insert_query_resp(self, query_resp, **kwargs):
+        self.batch_insert_query_resp([(query_resp, kwargs)])
+
+    def batch_insert_query_resp(self, rows):
+        if not rows:
+            return
+        actions = (
+            {
+                "_index": self.log_index,
+                "_source": self._query_log_doc(query_resp, **kwargs)
+            }
+            for query_resp, kwargs in rows
+        )
+        # Nothing searches the query log right away, so it never waits for a refresh
+        self._bulk(actions)
+
+    @staticmethod
+    def _source_fields(with_embedding):
+        return ['question', 'answer', 'embedding_data', 'model'] if with_embedding else ['question', 'answer', 'model']
+
+    def get_data_by_id(self, key: int, with_embedding: bool = False):
         try:
-            response = self.client.get(index=self.ans_index, id=key, _source=['question', 'answer', 'embedding_data', 'model'])
-            source = response["_source"]
-            result = [
-                source.get('question'),
-                source.get('answer'),
-                source.get('embedding_data'),
-                source.get('model')
-            ]
-            return result
+            response = self.client.get(index=self.ans_index, id=key, _source=self._source_fields(with_embedding))
+            return self._to_data(response["_source"])
         except Exception as e:
             print(e)
 
+    def get_data_by_ids(self, keys: List, with_embedding: bool = False):
+        if not keys:
+            return {}
+        key_by_doc_id = {str(key): key for key in keys}
+        response = self.client.mget(
+            index=self.ans_index,
+            body={"ids": list(key_by_doc_id)},
+            _source=self._source_fields(with_embedding)
+        )
+        return {
+            key_by_doc_id[doc["_id"]]: self._to_data(doc["_source"])
+            for doc in response["docs"]
+            if doc.get("found")
+        }
+
+    @staticmethod
+    def _to_data(source):
+        embedding_data = source.get('embedding_data')
+        if isinstance(embedding_data, str):
+            embedding_data = decode_embedding(base64.b64decode(embedding_data))
+        elif embedding_data is not None:
+            # Documents written before embeddings were encoded hold a plain list
+            embedding_data = np.array(embedding_data, dtype=np.float32)
+        return [
+            source.get('answer'),
+            source.get('question'),
+            embedding_data,
+            source.get('model')
+        ]
+
     def update_hit_count_by_id(self, primary_id: int):
         self.client.update(
             index=self.ans_index,
@@ -141,6 +256,31 @@ class SQLStorage(CacheStorage):
             body={"script": {"source": "ctx._source.hit_count += 1"}}
         )
 
+    def update_hit_counts(self, counts: Dict[int, int]):
+        if not counts:
+            return
+        actions = [
+            {
+                "_op_type": "update",
+                "_index": self.ans_index,
+                "_id": primary_id,
+                "script": {
+                    "source": "ctx._source.hit_count += params.count",
+                    "params": {"count": count}
+                }
+            }
+            for primary_id, count in counts.items()
+        ]
+        # Applied increments must not be sent again, so only the failed ones go back to the caller
+        results = self._bulk(actions, raise_on_exception=False)
+        failed = {
+            primary_id: count
+            for (primary_id, count), (ok, item) in zip(counts.items(), results)
+            if not ok and self._retryable(item)
+        }
+        if failed:
+            raise HitCountUpdateError(failed)
+
     def get_ids(self, deleted=True):
         query = {
             "query": {
@@ -160,8 +300,7 @@ class SQLStorage(CacheStorage):
             }
             for key in keys
         ]
-        responses = helpers.bulk(self.client, actions)
-        return responses[0]  # 返回更新的文档数
+        return sum(ok for ok, _ in self._bulk(actions, refresh=self.refresh))  # 返回更新的文档数
 
     def model_deleted(self, model_name):
         query = {
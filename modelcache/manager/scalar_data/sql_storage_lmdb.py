@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+import json
+import struct
+from typing import Dict, List
+
+import lmdb
+
+from modelcache.manager.scalar_data.base import CacheStorage, CacheData
+from modelcache.manager.scalar_data.embedding_codec import (
+    check_embedding_storage,
+    decode_embedding,
+    encode_embedding,
+)
+
+# Upper bound of the memory map; LMDB only allocates what is written, and writes
+# fail with lmdb.MapFullError once the database reaches it
+MAP_SIZE = 10 * 1024 ** 3
+MAX_READERS = 1024
+
+# Record layout: byte lengths of answer, question, embedding and model, then the
+# UTF-8 answer and question, the encoded embedding, and the UTF-8 model name
+_RECORD_HEADER = struct.Struct("<IIII")
+_ID = struct.Struct(">Q")  # big-endian, so keys sort by id
+_COUNT = struct.Struct("<Q")
+_SEPARATOR = b"\x00"
+_NEXT_ID = b"next_id"
+_NEXT_LOG_ID = b"next_log_id"
+
+
+def _id_key(_id) -> bytes:
+    return _ID.pack(int(_id))
+
+
+def _model_prefix(model) -> bytes:
+    return str(model).encode("utf-8") + _SEPARATOR
+
+
+class SQLStorage(CacheStorage):
+    """
+    Scalar storage on an embedded LMDB environment, for single-node deployments without a database server.
+
+    Entries are keyed by an integer cache id. A per-model secondary index serves model_deleted,
+    and soft-deleted ids and hit counts sit in their own sub-databases so that neither rewrites
+    a record. Reads run in LMDB read transactions, which take no locks and see the memory map
+    directly, so threads and processes sharing the directory read concurrently while one writer
+    commits at a time.
+    """
+
+    def __init__(
+        self,
+        db_type: str = "lmdb",
+        config=None,
+        path: str = "./lmdb_cache",
+        embedding_storage: str = "full",
+        map_size: int = MAP_SIZE,
+        sync: bool = True,
+        max_readers: int = MAX_READERS,
+    ):
+        self._path = path
+        # full, none, float16 or int8; see embedding_codec
+        self.embedding_storage = check_embedding_storage(embedding_storage)
+        # readahead off: lookups are random, so prefetching neighbouring pages only evicts useful ones
+        self.env = lmdb.open(
+            path,
+            map_size=int(map_size),
+            max_dbs=8,
+            max_readers=int(max_readers),
+            sync=sync,
+            readahead=False,
+        )
+        self.create()
+
+    def create(self):
+        self._answers = self.env.open_db(b"answers")
+        self._models = self.env.open_db(b"model_index")
+        self._deleted = self.env.open_db(b"deleted")
+        self._hits = self.env.open_db(b"hit_counts")
+        self._logs = self.env.open_db(b"query_log")
+        self._meta = self.env.open_db(b"meta")
+
+    def _encode(self, data: List) -> bytes:
+        answer = str(data[0]).encode("utf-8")
+        question = str(data[1]).encode("utf-8")
+        embedding = encode_embedding(data[2], self.embedding_storage)
+        model = str(data[3]).encode("utf-8")
+        header = _RECORD_HEADER.pack(len(answer), len(question), len(embedding), len(model))
+        return b"".join((header, answer, question, embedding, model))
+
+    @staticmethod
+    def _decode(record, with_embedding: bool = False):
+        """(answer, question, embedding, model) of a record, reading the embedding only when asked."""
+        answer_len, question_len, embedding_len, model_len = _RECORD_HEADER.unpack_from(record)
+        start = _RECORD_HEADER.size
+        answer = str(record[start:start + answer_len], "utf-8")
+        start += answer_len
+        question = str(record[start:start + question_len], "utf-8")
+        start += question_len
+        # The record buffer is only valid inside its transaction, so the embedding is copied out
+        embedding = decode_embedding(bytes(record[start:start + embedding_len])) if with_embedding else None
+        start += embedding_len
+        model = str(record[start:start + model_len], "utf-8")
+        return answer, question, embedding, model
+
+    @staticmethod
+    def _model_of(record) -> bytes:
+        answer_len, question_len, embedding_len, model_len = _RECORD_HEADER.unpack_from(record)
+        start = _RECORD_HEADER.size + answer_len + question_len + embedding_len
+        return bytes(record[start:start + model_len])
+
+    def _next(self, txn, key: bytes, count: int) -> int:
+        """Reserve count consecutive ids from the meta counter key, returning the first."""
+        current = txn.get(key, db=self._meta)
+        first = _COUNT.unpack(current)[0] if current is not None else 1
+        txn.put(key, _COUNT.pack(first + count), db=self._meta)
+        return first
+
+    def _insert(self, data: List):
+        return self.batch_insert([data])[0]
+
+    def batch_insert(self, all_data: List[CacheData]):
+        records = [(self._encode(data), _model_prefix(data[3])) for data in all_data]
+        with self.env.begin(write=True) as txn:
+            first = self._next(txn, _NEXT_ID, len(records))
+            ids = list(range(first, first + len(records)))
+            for _id, (record, model_prefix) in zip(ids, records):
+                key = _id_key(_id)
+                txn.put(key, record, db=self._answers)
+                txn.put(model_prefix + key, b"", db=self._models)
+        return ids
+
+    @staticmethod
+    def _query_log_record(query_resp, **kwargs):
+        hit_query = query_resp.get('hit_query')
+        if isinstance(hit_query, list):
+            hit_query = json.dumps(hit_query, ensure_ascii=False)
+        return {
+            "error_code": query_resp.get('errorCode'),
+            "error_desc": query_resp.get('errorDesc'),
+            "cache_hit": query_resp.get('cacheHit'),
+            "model": kwargs.get('model'),
+            "query": kwargs.get('query'),
+            "delta_time": kwargs.get('delta_time'),
+            "hit_query": hit_query,
+            "answer": query_resp.get('answer'),
+        }
+
+    def insert_query_resp(self, query_resp, **kwargs):
+        self.batch_insert_query_resp([(query_resp, kwargs)])
+
+    def batch_insert_query_resp(self, rows):
+        if not rows:
+            return
+        # Log keys start with the model name so that model_deleted clears them with one range scan
+        records = [self._query_log_record(query_resp, **kwargs) for query_resp, kwargs in rows]
+        with self.env.begin(write=True) as txn:
+            first = self._next(txn, _NEXT_LOG_ID, len(records))
+            for offset, record in enumerate(records):
+                key = _model_prefix(record["model"]) + _id_key(first + offset)
+                txn.put(key, json.dumps(record, ensure_ascii=False).encode("utf-8"), db=self._logs)
+
+    def get_data_by_id(self, key, with_embedding: bool = False):
+        id_key = _id_key(key)
+        with self.env.begin(buffers=True) as txn:
+            record = txn.get(id_key, db=self._answers)
+            if record is None or txn.get(id_key, db=self._deleted) is not None:
+                return None
+            return self._decode(record, with_embedding)
+
+    def get_data_by_ids(self, keys: List, with_embedding: bool = False):
+        result = {}
+        with self.env.begin(buffers=True) as txn:
+            for key in keys:
+                id_key = _id_key(key)
+                record = txn.get(id_key, db=self._answers)
+                if record is not None and txn.get(id_key, db=self._deleted) is None:
+                    result[key] = self._decode(record, with_embedding)
+        return result
+
+    # Reads are short memory-map lookups, so the event loop runs them inline
+    # instead of handing them to a worker thread.
+
+    async def aget_data_by_id(self, key, with_embedding: bool = False):
+        return self.get_data_by_id(key, with_embedding)
+
+    async def aget_data_by_ids(self, keys: List, with_embedding: bool = False):
+        return self.get_data_by_ids(keys, with_embedding)
+
+    def update_hit_count_by_id(self, primary_id):
+        self.update_hit_counts({primary_id: 1})
+
+    def update_hit_counts(self, counts: Dict[int, int]):
+        if not counts:
+            return
+        with self.env.begin(write=True, db=self._hits) as txn:
+            for primary_id, count in counts.items():
+                key = _id_key(primary_id)
+                current = txn.get(key)
+                total = (_COUNT.unpack(current)[0] if current is not None else 0) + count
+                txn.put(key, _COUNT.pack(total))
+
+    def get_ids(self, deleted=True):
+        with self.env.begin() as txn:
+            if deleted:
+                return [_ID.unpack(key)[0] for key in txn.cursor(db=self._deleted).iternext(values=False)]
+            deleted_keys = txn.cursor(db=self._deleted)
+            return [
+                _ID.unpack(key)[0]
+                for key in txn.cursor(db=self._answers).iternext(values=False)
+                if not deleted_keys.set_key(key)
+            ]
+
+    def mark_deleted(self, keys):
+        delete_count = 0
+        with self.env.begin(write=True) as txn:
+            for key in keys:
+                id_key = _id_key(key)
+                if txn.get(id_key, db=self._answers) is not None:
+                    delete_count += txn.put(id_key, b"", overwrite=False, db=self._deleted)
+        return delete_count
+
+    def _remove(self, txn, id_key: bytes, model_prefix: bytes):
+        txn.delete(id_key, db=self._answers)
+        txn.delete(model_prefix + id_key, db=self._models)
+        txn.delete(id_key, db=self._deleted)
+        txn.delete(id_key, db=self._hits)
+
+    @staticmethod
+    def _prefixed_keys(txn, db, prefix: bytes) -> List[bytes]:
+        cursor = txn.cursor(db=db)
+        keys = []
+        if cursor.set_range(prefix):
+            for key in cursor.iternext(values=False):
+                if not key.startswith(prefix):
+                    break
+                keys.append(key)
+        return keys
+
+    def model_deleted(self, model_name):
+        prefix = _model_prefix(model_name)
+        with self.env.begin(write=True) as txn:
+            index_keys = self._prefixed_keys(txn, self._models, prefix)
+            for index_key in index_keys:
+                self._remove(txn, index_key[len(prefix):], prefix)
+            for log_key in self._prefixed_keys(txn, self._logs, prefix):
+                txn.delete(log_key, db=self._logs)
+        return len(index_keys)
+
+    def clear_deleted_data(self):
+        with self.env.begin(write=True) as txn:
+            deleted_keys = list(txn.cursor(db=self._deleted).iternext(values=False))
+            for id_key in deleted_keys:
+                record = txn.get(id_key, db=self._answers)
+                if record is None:
+                    txn.delete(id_key, db=self._deleted)
+                    continue
+                self._remove(txn, id_key, self._model_of(record) + _SEPARATOR)
+        return len(deleted_keys)
+
+    def count(self, state: int = 0, is_all: bool = False):
+        with self.env.begin() as txn:
+            total = txn.stat(self._answers)["entries"]
+            deleted = txn.stat(self._deleted)["entries"]
+        if is_all:
+            return total
+        return deleted if state == 1 else total - deleted if state == 0 else 0
+
+    def count_answers(self):
+        return self.count(state=0)
+
+    def flush(self):
+        self.env.sync(True)
+
+    def close(self):
+        self.env.close()
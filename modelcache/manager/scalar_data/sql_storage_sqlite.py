@@ -1,92 +1,233 @@
 # -*- coding: utf-8 -*-
 import json
-from typing import List
+import threading
+from typing import Dict, List
+from modelcache.manager.scalar_data.answer_codec import AnswerCodec, check_answer_storage, content_hash
 from modelcache.manager.scalar_data.base import CacheStorage, CacheData
+from modelcache.manager.scalar_data.embedding_codec import (
+    check_embedding_storage,
+    decode_embedding,
+    encode_embedding,
+)
+from modelcache.utils.log import modelcache_log
 import sqlite3
 
+ANSWER_TABLE = "modelcache_llm_answer"
+LOG_TABLE = "modelcache_query_log"
+# Distinct answers and the zstd dictionaries they are compressed with, used with answer_storage="zstd"
+BLOB_TABLE = "modelcache_answer_blob"
+DICT_TABLE = "modelcache_answer_dict"
+
+ANSWER_TABLE_SQL = f"""CREATE TABLE IF NOT EXISTS {ANSWER_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        gmt_create TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        gmt_modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        question TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        answer_type INTEGER NOT NULL,
+        hit_count INTEGER NOT NULL DEFAULT 0,
+        model VARCHAR(1000) NOT NULL,
+        embedding_data BLOB NOT NULL,
+        is_deleted INTEGER NOT NULL DEFAULT 0,
+        answer_id INTEGER
+        );
+        """
+LOG_TABLE_SQL = f"""CREATE TABLE IF NOT EXISTS {LOG_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        gmt_create TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        gmt_modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        error_code INTEGER NOT NULL,
+        error_desc VARCHAR(1000) NOT NULL,
+        cache_hit VARCHAR(100) NOT NULL,
+        delta_time REAL NOT NULL,
+        model VARCHAR(1000) NOT NULL,
+        query TEXT NOT NULL,
+        hit_query TEXT NOT NULL,
+        answer TEXT NOT NULL
+        );
+        """
+BLOB_TABLE_SQL = f"""CREATE TABLE IF NOT EXISTS {BLOB_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content_hash CHAR(64) NOT NULL UNIQUE,
+        model VARCHAR(1000) NOT NULL,
+        codec INTEGER NOT NULL,
+        dict_id INTEGER NOT NULL DEFAULT 0,
+        data BLOB NOT NULL
+        );
+        """
+DICT_TABLE_SQL = f"""CREATE TABLE IF NOT EXISTS {DICT_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model VARCHAR(1000) NOT NULL,
+        data BLOB NOT NULL
+        );
+        """
+DELETED_INDEX_SQL = f"CREATE INDEX IF NOT EXISTS idx_{ANSWER_TABLE}_is_deleted ON {ANSWER_TABLE} (is_deleted)"
+
+INSERT_COLUMNS = "(question, answer, answer_type, model, embedding_data, answer_id)"
+INSERT_ROW = "(?, ?, ?, ?, ?, ?)"
+INSERT_LOG_SQL = (f"INSERT INTO {LOG_TABLE} (error_code, error_desc, cache_hit, model, query, delta_time, hit_query, "
+                  f"answer) VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+UPDATE_HIT_COUNT_SQL = f"UPDATE {ANSWER_TABLE} SET hit_count = hit_count + ? WHERE id = ?"
+
+# Rows per INSERT and ids per IN (...) list, keeping every statement under SQLite's
+# default limit of 999 bound parameters
+BATCH_SIZE = 150
+ID_BATCH_SIZE = 900
+# RETURNING needs SQLite 3.35; older libraries insert row by row inside the same transaction
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
 
 class SQLStorage(CacheStorage):
     def __init__(
         self,
         db_type: str = "mysql",
         config=None,
-        url="./sqlite.db"
+        url="./sqlite.db",
+        embedding_storage: str = "full",
+        answer_storage: str = "plain",
+        journal_mode: str = "WAL",
+        synchronous: str = "NORMAL",
+        busy_timeout: int = 5000,
+        cached_statements: int = 128,
     ):
         self._url = url
-        # self._engine = sqlite3.connect(url)
+        # full, none, float16 or int8; see embedding_codec
+        self.embedding_storage = check_embedding_storage(embedding_storage)
+        # plain or zstd; see answer_codec
+        self.answer_storage = check_answer_storage(answer_storage)
+        self._answer_codec = None
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = int(busy_timeout)
+        self.cached_statements = int(cached_statements)
+        # One connection per thread, kept open for the life of the store; SQLite
+        # connections must not be shared between threads without extra locking.
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.create()
 
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread is off only so that close() can release every thread's connection
+            conn = sqlite3.connect(self._url, cached_statements=self.cached_statements, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout}")
+            conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+            conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
     def create(self):
-        answer_table_sql = """CREATE TABLE IF NOT EXISTS modelcache_llm_answer (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                gmt_create TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                gmt_modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                question TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                answer_type INTEGER NOT NULL,
-                hit_count INTEGER NOT NULL DEFAULT 0,
-                model VARCHAR(1000) NOT NULL,
-                embedding_data BLOB NOT NULL
-                );
-                """
-
-        log_table_sql = """CREATE TABLE IF NOT EXISTS modelcache_query_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                gmt_create TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                gmt_modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                error_code INTEGER NOT NULL,
-                error_desc VARCHAR(1000) NOT NULL,
-                cache_hit VARCHAR(100) NOT NULL,
-                delta_time REAL NOT NULL,
-                model VARCHAR(1000) NOT NULL,
-                query TEXT NOT NULL,
-                hit_query TEXT NOT NULL,
-                answer TEXT NOT NULL
-                );
-                """
-
-        conn = sqlite3.connect(self._url)
-        try:
-            cursor = conn.cursor()
-            cursor.execute(answer_table_sql)
-            cursor.execute(log_table_sql)
-            conn.commit()
-            cursor.close()
-            conn.close()
-        finally:
-            conn.close()
+        conn = self._connection()
+        with conn:
+            conn.execute(ANSWER_TABLE_SQL)
+            conn.execute(LOG_TABLE_SQL)
+            # Databases created before soft deletion existed lack the column
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({ANSWER_TABLE})")]
+            if "is_deleted" not in columns:
+                conn.execute(f"ALTER TABLE {ANSWER_TABLE} ADD COLUMN is_deleted INTEGER NOT NULL DEFAULT 0")
+            if "answer_id" not in columns:
+                conn.execute(f"ALTER TABLE {ANSWER_TABLE} ADD COLUMN answer_id INTEGER")
+            conn.execute(DELETED_INDEX_SQL)
+            conn.execute(BLOB_TABLE_SQL)
+            conn.execute(DICT_TABLE_SQL)
 
-    def _insert(self, data: List):
-        answer = data[0]
-        question = data[1]
-        embedding_data = data[2]
-        model = data[3]
+    @property
+    def answer_codec(self) -> AnswerCodec:
+        # Also needed in plain mode to read answers written while zstd was on
+        if self._answer_codec is None:
+            self._answer_codec = AnswerCodec(self)
+        return self._answer_codec
+
+    def load_answer_dict(self, dict_id: int) -> bytes:
+        row = self._connection().execute(f"SELECT data FROM {DICT_TABLE} WHERE id = ?", (dict_id,)).fetchone()
+        return row[0]
+
+    def latest_answer_dict(self, model):
+        return self._connection().execute(
+            f"SELECT id, data FROM {DICT_TABLE} WHERE model = ? ORDER BY id DESC LIMIT 1", (model,)).fetchone()
+
+    def save_answer_dict(self, model, data: bytes) -> int:
+        conn = self._connection()
+        with conn:
+            return conn.execute(f"INSERT INTO {DICT_TABLE} (model, data) VALUES (?, ?)", (model, data)).lastrowid
+
+    def _insert_values(self, data: List, answer_id=None):
+        answer, question, embedding_data, model = data[0], data[1], data[2], data[3]
         answer_type = 0
-        embedding_data = embedding_data.tobytes()
+        if answer_id is not None:
+            # The text lives in the blob table
+            answer = ""
+        embedding_data = encode_embedding(embedding_data, self.embedding_storage)
+        return question, answer, answer_type, model, embedding_data, answer_id
 
-        table_name = "modelcache_llm_answer"
-        insert_sql = "INSERT INTO {} (question, answer, answer_type, model, embedding_data) VALUES (?, ?, ?, ?, ?)".format(table_name)
+    def _new_blobs(self, all_data: List[CacheData]):
+        """
+        Content hash of every row's answer, and the compressed blob rows for the answers
+        not stored yet. Compression happens before the insert transaction opens, so a
+        dictionary trained on the way is committed before any row refers to it.
+        """
+        hashes = [content_hash(data[3], data[0]) for data in all_data]
+        distinct = list(dict.fromkeys(hashes))
+        stored = set()
+        conn = self._connection()
+        for start in range(0, len(distinct), ID_BATCH_SIZE):
+            chunk = distinct[start:start + ID_BATCH_SIZE]
+            query_sql = "SELECT content_hash FROM {} WHERE content_hash IN ({})".format(
+                BLOB_TABLE, ",".join(["?"] * len(chunk)))
+            stored.update(row[0] for row in conn.execute(query_sql, chunk))
+        blobs = {}
+        for answer_hash, data in zip(hashes, all_data):
+            if answer_hash not in stored and answer_hash not in blobs:
+                blobs[answer_hash] = (answer_hash, data[3]) + self.answer_codec.compress(data[3], data[0])
+        return hashes, list(blobs.values())
 
-        conn = sqlite3.connect(self._url)
-        try:
-            cursor = conn.cursor()
-            values = (question, answer, answer_type, model, embedding_data)
-            cursor.execute(insert_sql, values)
-            conn.commit()
-            id = cursor.lastrowid
-            cursor.close()
-            conn.close()
-        finally:
-            conn.close()
-        return id
+    def _store_blobs(self, conn, hashes, blobs):
+        """Insert the new blobs in the open transaction and return the blob id of every hash."""
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {BLOB_TABLE} (content_hash, model, codec, dict_id, data) VALUES (?, ?, ?, ?, ?)",
+            blobs)
+        distinct = list(dict.fromkeys(hashes))
+        ids = {}
+        for start in range(0, len(distinct), ID_BATCH_SIZE):
+            chunk = distinct[start:start + ID_BATCH_SIZE]
+            query_sql = "SELECT content_hash, id FROM {} WHERE content_hash IN ({})".format(
+                BLOB_TABLE, ",".join(["?"] * len(chunk)))
+            ids.update(conn.execute(query_sql, chunk))
+        return [ids[answer_hash] for answer_hash in hashes]
+
+    def _insert(self, data: List):
+        return self.batch_insert([data])[0]
 
     def batch_insert(self, all_data: List[CacheData]):
+        if self.answer_storage == "zstd":
+            hashes, blobs = self._new_blobs(all_data)
         ids = []
-        for data in all_data:
-            ids.append(self._insert(data))
+        conn = self._connection()
+        with conn:
+            if self.answer_storage == "zstd":
+                answer_ids = self._store_blobs(conn, hashes, blobs)
+                values = [self._insert_values(data, answer_id) for data, answer_id in zip(all_data, answer_ids)]
+            else:
+                values = [self._insert_values(data) for data in all_data]
+            for start in range(0, len(values), BATCH_SIZE):
+                chunk = values[start:start + BATCH_SIZE]
+                if SUPPORTS_RETURNING:
+                    insert_sql = "INSERT INTO {} {} VALUES {} RETURNING id".format(
+                        ANSWER_TABLE, INSERT_COLUMNS, ", ".join([INSERT_ROW] * len(chunk)))
+                    params = [value for row in chunk for value in row]
+                    # RETURNING order is unspecified, but one statement allocates increasing ids in row order
+                    ids.extend(sorted(row[0] for row in conn.execute(insert_sql, params)))
+                else:
+                    insert_sql = "INSERT INTO {} {} VALUES {}".format(ANSWER_TABLE, INSERT_COLUMNS, INSERT_ROW)
+                    ids.extend(conn.execute(insert_sql, row).lastrowid for row in chunk)
         return ids
 
-    def insert_query_resp(self, query_resp, **kwargs):
+    @staticmethod
+    def _query_log_values(query_resp, **kwargs):
         error_code = query_resp.get('errorCode')
         error_desc = query_resp.get('errorDesc')
         cache_hit = query_resp.get('cacheHit')
@@ -98,107 +239,124 @@ class SQLStorage(CacheStorage):
 
         if isinstance(hit_query, list):
             hit_query = json.dumps(hit_query, ensure_ascii=False)
+        return error_code, error_desc, cache_hit, model, query, delta_time, hit_query, answer
 
-        table_name = "modelcache_query_log"
-        insert_sql = "INSERT INTO {} (error_code, error_desc, cache_hit, model, query, delta_time, hit_query, answer) VALUES (?, ?, ?, ?, ?, ?, ?, ?)".format(table_name)
-        conn = sqlite3.connect(self._url)
-        try:
-            cursor = conn.cursor()
-            values = (error_code, error_desc, cache_hit, model, query, delta_time, hit_query, answer)
-            cursor.execute(insert_sql, values)
-            conn.commit()
-            cursor.close()
-            conn.close()
-        finally:
-            conn.close()
+    def insert_query_resp(self, query_resp, **kwargs):
+        conn = self._connection()
+        with conn:
+            conn.execute(INSERT_LOG_SQL, self._query_log_values(query_resp, **kwargs))
 
-    def get_data_by_id(self, key: int):
-        table_name = "modelcache_llm_answer"
-        query_sql = "select question, answer, embedding_data, model from {} where id={}".format(table_name, key)
-        conn = sqlite3.connect(self._url)
-        try:
-            cursor = conn.cursor()
-            cursor.execute(query_sql)
-            resp = cursor.fetchone()
-            conn.commit()
-            cursor.close()
-            conn.close()
-        finally:
-            conn.close()
+    def batch_insert_query_resp(self, rows):
+        if not rows:
+            return
+        values = [self._query_log_values(query_resp, **kwargs) for query_resp, kwargs in rows]
+        conn = self._connection()
+        with conn:
+            conn.executemany(INSERT_LOG_SQL, values)
+
+    @staticmethod
+    def _select_columns(with_embedding: bool) -> str:
+        # Rows written with answer_storage="zstd" find their answer in the blob table
+        embedding_column = "a.embedding_data" if with_embedding else "NULL"
+        return f"a.answer, a.question, {embedding_column}, a.model, b.codec, b.dict_id, b.data " \
+               f"FROM {ANSWER_TABLE} a LEFT JOIN {BLOB_TABLE} b ON b.id = a.answer_id"
+
+    def _to_data(self, row):
+        answer, question, embedding_data, model, codec, dict_id, data = row
+        if data is not None:
+            answer = self.answer_codec.decode(codec, dict_id, data)
+        return answer, question, decode_embedding(embedding_data), model
 
-        if resp is not None and len(resp) == 4:
-            return resp
+    def get_data_by_id(self, key: int, with_embedding: bool = False):
+        query_sql = "SELECT {} WHERE a.id = ? AND a.is_deleted = 0".format(self._select_columns(with_embedding))
+        resp = self._connection().execute(query_sql, (key,)).fetchone()
+
+        if resp is not None:
+            return self._to_data(resp)
         else:
             return None
 
+    def get_data_by_ids(self, keys: List, with_embedding: bool = False):
+        keys = list(keys)
+        result = {}
+        conn = self._connection()
+        for start in range(0, len(keys), ID_BATCH_SIZE):
+            chunk = keys[start:start + ID_BATCH_SIZE]
+            query_sql = "SELECT a.id, {} WHERE a.id IN ({}) AND a.is_deleted = 0".format(
+                self._select_columns(with_embedding), ",".join(["?"] * len(chunk)))
+            for row in conn.execute(query_sql, chunk):
+                result[row[0]] = self._to_data(row[1:])
+        return result
+
     def update_hit_count_by_id(self, primary_id: int):
-        table_name = "modelcache_llm_answer"
-        update_sql = "UPDATE {} SET hit_count = hit_count+1 WHERE id={}".format(table_name, primary_id)
+        self.update_hit_counts({primary_id: 1})
 
-        conn = sqlite3.connect(self._url)
-        try:
-            cursor = conn.cursor()
-            cursor.execute(update_sql)
-            conn.commit()
-            cursor.close()
-            conn.close()
-        finally:
-            # 关闭连接，将连接返回给连接池
-            conn.close()
+    def update_hit_counts(self, counts: Dict[int, int]):
+        if not counts:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(UPDATE_HIT_COUNT_SQL, [(count, primary_id) for primary_id, count in counts.items()])
 
     def get_ids(self, deleted=True):
-        pass
+        query_sql = f"SELECT id FROM {ANSWER_TABLE} WHERE is_deleted = ?"
+        return [row[0] for row in self._connection().execute(query_sql, (1 if deleted else 0,))]
 
     def mark_deleted(self, keys):
-        table_name = "modelcache_llm_answer"
-        delete_sql = "Delete from {} WHERE id in ({})".format(table_name, ",".join([str(i) for i in keys]))
-        conn = sqlite3.connect(self._url)
-        try:
-            cursor = conn.cursor()
-            cursor.execute(delete_sql)
-            delete_count = cursor.rowcount
-            conn.commit()
-            cursor.close()
-            conn.close()
-        finally:
-            conn.close()
+        keys = list(keys)
+        delete_count = 0
+        conn = self._connection()
+        with conn:
+            for start in range(0, len(keys), ID_BATCH_SIZE):
+                chunk = keys[start:start + ID_BATCH_SIZE]
+                mark_sql = "UPDATE {} SET is_deleted = 1 WHERE id IN ({}) AND is_deleted = 0".format(
+                    ANSWER_TABLE, ",".join(["?"] * len(chunk)))
+                delete_count += conn.execute(mark_sql, chunk).rowcount
         return delete_count
 
     def model_deleted(self, model_name):
-        table_name = "modelcache_llm_answer"
-        delete_sql = "Delete from {} WHERE model=?".format(table_name)
-
-        table_log_name = "modelcache_query_log"
-        delete_log_sql = "Delete from {} WHERE model=?".format(table_log_name)
-        conn = sqlite3.connect(self._url)
+        delete_sql = f"DELETE FROM {ANSWER_TABLE} WHERE model = ?"
+        delete_log_sql = f"DELETE FROM {LOG_TABLE} WHERE model = ?"
+        conn = self._connection()
         try:
-            cursor = conn.cursor()
-            cursor.execute(delete_sql, (model_name,))
-            conn.commit()
-            # get delete rows
-            deleted_rows_count = cursor.rowcount
-            
-            cursor.execute(delete_log_sql, (model_name,))
-            conn.commit()
-            cursor.close()
+            with conn:
+                deleted_rows_count = conn.execute(delete_sql, (model_name,)).rowcount
+                conn.execute(delete_log_sql, (model_name,))
+                conn.execute(f"DELETE FROM {BLOB_TABLE} WHERE model = ?", (model_name,))
+                conn.execute(f"DELETE FROM {DICT_TABLE} WHERE model = ?", (model_name,))
         except sqlite3.Error as e:
-            print(f"SQLite error: {e}")
+            modelcache_log.error("SQLite error: %s", e)
             deleted_rows_count = 0  # if except, return 0
-        finally:
-            conn.close()
+        if self._answer_codec is not None:
+            self._answer_codec.forget(model_name)
         return deleted_rows_count
 
     def clear_deleted_data(self):
-        pass
+        conn = self._connection()
+        with conn:
+            deleted_rows_count = conn.execute(f"DELETE FROM {ANSWER_TABLE} WHERE is_deleted = 1").rowcount
+            # Answers no longer referenced by any row
+            conn.execute(f"DELETE FROM {BLOB_TABLE} WHERE id NOT IN "
+                         f"(SELECT answer_id FROM {ANSWER_TABLE} WHERE answer_id IS NOT NULL)")
+        return deleted_rows_count
 
     def count(self, state: int = 0, is_all: bool = False):
-        pass
+        if is_all:
+            return self._connection().execute(f"SELECT COUNT(*) FROM {ANSWER_TABLE}").fetchone()[0]
+        count_sql = f"SELECT COUNT(*) FROM {ANSWER_TABLE} WHERE is_deleted = ?"
+        return self._connection().execute(count_sql, (state,)).fetchone()[0]
 
     def close(self):
-        pass
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
 
     def count_answers(self):
-        pass
+        return self.count(state=0)
 
     def flush(self):
-        pass
+        # Fold the write-ahead log back into the database file
+        if self.journal_mode.upper() == "WAL":
+            self._connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import json
 from abc import ABC, abstractmethod
 import numpy as np
 from typing import List
@@ -8,7 +10,13 @@ from modelcache.embedding import MetricType
 from modelcache.utils.error import ParamError, NotFoundError
 
 TOP_K = 1
-FAISS_INDEX_PATH = "faiss.index"
+FAISS_INDEX_PATH = "faiss_index"
+FAISS_INDEX_FACTORY = "Flat"
+FAISS_TRAIN_SIZE = 10000
+HNSWLIB_INDEX_PATH = "hnswlib_index"
+HNSWLIB_MAX_ELEMENTS = 100000
+NUMPY_INDEX_PATH = "numpy_index"
+REDIS_BATCH_SIZE = 1000
 DIMENSION = 0
 MILVUS_HOST = "localhost"
 MILVUS_PORT = 19530
@@ -34,6 +42,20 @@ class VectorStorage(ABC):
     def search(self, data: np.ndarray, top_k: int, model):
         pass
 
+    def search_many(self, datas: np.ndarray, top_k: int, model):
+        """
+        Search a 2-D array of query vectors, returning one result list per row.
+        Backends that accept multi-vector queries natively should override this.
+        """
+        return [self.search(data, top_k=top_k, model=model) for data in datas]
+
+    async def asearch(self, data: np.ndarray, top_k: int = -1, model=None):
+        """
+        Search from an event loop. Runs search in a worker thread;
+        backends with a native async client should override this.
+        """
+        return await asyncio.to_thread(self.search, data, top_k=top_k, model=model)
+
     @abstractmethod
     def rebuild(self, ids=None) -> bool:
         pass
@@ -70,8 +92,16 @@ class VectorStorage(ABC):
             metric_type = kwargs.get("metric_type",MetricType.COSINE)
             secure = kwargs.get("secure", MILVUS_SECURE)
             collection_name = kwargs.get("collection_name", COLLECTION_NAME)
+            options = milvus_config['milvus']
             index_params = kwargs.get("index_params", None)
+            if index_params is None and options.get('index_params'):
+                index_params = json.loads(options.get('index_params'))
             search_params = kwargs.get("search_params", None)
+            if search_params is None and options.get('search_params'):
+                search_params = json.loads(options.get('search_params'))
+            partition_per_model = str(
+                kwargs.get("partition_per_model", options.get('partition_per_model', False))
+            ).lower() in ("true", "1", "yes")
             local_mode = kwargs.get("local_mode", False)
             local_data = kwargs.get("local_data", "./milvus_data")
             vector_base = Milvus(
@@ -87,7 +117,8 @@ class VectorStorage(ABC):
                 search_params=search_params,
                 local_mode=local_mode,
                 local_data=local_data,
-                metric_type=metric_type
+                metric_type=metric_type,
+                partition_per_model=partition_per_model,
             )
         elif name == "redis":
             from modelcache.manager.vector_data.redis import RedisVectorStore
@@ -100,6 +131,10 @@ class VectorStorage(ABC):
             user = redis_config.get('redis', 'user')
             password = redis_config.get('redis', 'password')
             namespace = kwargs.get("namespace", "")
+            options = redis_config['redis']
+            batch_size = int(kwargs.get("batch_size", options.get('batch_size', REDIS_BATCH_SIZE)))
+            async_client = str(kwargs.get("async_client", options.get('async_client', False))).lower() in ("true", "1", "yes")
+            top_k = int(kwargs.get("top_k", options.get('top_k', TOP_K)))
             # collection_name = kwargs.get("collection_name", COLLECTION_NAME)
 
             vector_base = RedisVectorStore(
@@ -110,15 +145,63 @@ class VectorStorage(ABC):
                 namespace=namespace,
                 top_k=top_k,
                 dimension=dimension,
+                batch_size=batch_size,
+                async_client=async_client,
+                metric_type=kwargs.get("metric_type", MetricType.L2),
+                vector_type=kwargs.get("vector_type", options.get('vector_type', "FLOAT32")).upper(),
+                m=int(kwargs.get("m", options.get('m', 16))),
+                ef_construction=int(kwargs.get("ef_construction", options.get('ef_construction', 200))),
+                ef_runtime=int(kwargs.get("ef_runtime", options.get('ef_runtime', 10))),
+                initial_cap=int(kwargs.get("initial_cap", options.get('initial_cap', 1000))),
             )
         elif name == "faiss":
             from modelcache.manager.vector_data.faiss import Faiss
 
             dimension = kwargs.get("dimension", DIMENSION)
-            index_path = kwargs.pop("index_path", FAISS_INDEX_PATH)
             check_dimension(dimension)
+            faiss_config = kwargs.get("config")
+            if faiss_config is not None and faiss_config.has_section('faiss'):
+                options = faiss_config['faiss']
+            else:
+                options = {}
+            index_path = kwargs.pop("index_path", options.get('index_path', FAISS_INDEX_PATH))
+            index_factory = kwargs.get("index_factory", options.get('index_factory', FAISS_INDEX_FACTORY))
+            train_size = int(kwargs.get("train_size", options.get('train_size', FAISS_TRAIN_SIZE)))
+            search_params = kwargs.get("search_params", options.get('search_params') or None)
+            metric_type = kwargs.get("metric_type", MetricType.L2)
+            mmap = str(kwargs.get("mmap", options.get('mmap', False))).lower() in ("true", "1", "yes")
             vector_base = Faiss(
-                index_file_path=index_path, dimension=dimension, top_k=top_k
+                index_dir=index_path,
+                dimension=dimension,
+                top_k=top_k,
+                index_factory=index_factory,
+                metric_type=metric_type,
+                train_size=train_size,
+                search_params=search_params,
+                mmap=mmap,
+                **wal_options(kwargs, options),
+            )
+        elif name == "numpy":
+            from modelcache.manager.vector_data.numpy_store import NumpyStore
+
+            dimension = kwargs.get("dimension", DIMENSION)
+            check_dimension(dimension)
+            numpy_config = kwargs.get("config")
+            if numpy_config is not None and numpy_config.has_section('numpy'):
+                options = numpy_config['numpy']
+            else:
+                options = {}
+            vector_base = NumpyStore(
+                index_dir=kwargs.pop("index_path", options.get('index_path', NUMPY_INDEX_PATH)),
+                dimension=dimension,
+                top_k=top_k,
+                metric_type=kwargs.get("metric_type", MetricType.L2),
+                initial_capacity=int(kwargs.get("initial_capacity", options.get('initial_capacity', 1024))),
+                mmap=str(kwargs.get("mmap", options.get('mmap', False))).lower() in ("true", "1", "yes"),
+                quantization=kwargs.get("quantization", options.get('quantization', "none")),
+                quantization_scale=kwargs.get("quantization_scale", options.get('quantization_scale', "vector")),
+                rerank_factor=int(kwargs.get("rerank_factor", options.get('rerank_factor', 4))),
+                **wal_options(kwargs, options),
             )
         elif name == "chromadb":
             from modelcache.manager.vector_data.chroma import Chromadb
@@ -134,12 +217,24 @@ class VectorStorage(ABC):
             from modelcache.manager.vector_data.hnswlib_store import Hnswlib
 
             dimension = kwargs.get("dimension", DIMENSION)
-            index_path = kwargs.pop("index_path", "./hnswlib_index.bin")
-            max_elements = kwargs.pop("max_elements", 100000)
-            VectorStorage.check_dimension(dimension)
+            check_dimension(dimension)
+            hnswlib_config = kwargs.get("config")
+            if hnswlib_config is not None and hnswlib_config.has_section('hnswlib'):
+                options = hnswlib_config['hnswlib']
+            else:
+                options = {}
+            index_path = kwargs.pop("index_path", options.get('index_path', HNSWLIB_INDEX_PATH))
+            max_elements = int(kwargs.pop("max_elements", options.get('max_elements', HNSWLIB_MAX_ELEMENTS)))
             vector_base = Hnswlib(
-                index_file_path=index_path, dimension=dimension,
-                top_k=top_k, max_elements=max_elements
+                index_dir=index_path,
+                dimension=dimension,
+                top_k=top_k,
+                max_elements=max_elements,
+                metric_type=kwargs.get("metric_type", MetricType.L2),
+                m=int(kwargs.get("m", options.get('m', 16))),
+                ef_construction=int(kwargs.get("ef_construction", options.get('ef_construction', 200))),
+                ef_search=int(kwargs.get("ef_search", options.get('ef_search', 64))),
+                **wal_options(kwargs, options),
             )
         else:
             raise NotFoundError("vector store", name)
@@ -151,3 +246,12 @@ def check_dimension(dimension):
         raise ParamError(f"the dimension should be greater than zero, current value: {dimension}.")
 
 
+def wal_options(kwargs, options):
+    """Write-ahead log settings of the in-process stores, from kwargs first and then the config section."""
+    def flag(key, default):
+        return str(kwargs.get(key, options.get(key, default))).lower() in ("true", "1", "yes")
+    return {
+        "wal": flag("wal", False),
+        "wal_fsync": flag("wal_fsync", True),
+        "checkpoint_interval": float(kwargs.get("checkpoint_interval", options.get('checkpoint_interval', 300.0))),
+    }
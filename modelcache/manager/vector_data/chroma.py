@@ -1,3 +1,4 @@
+import threading
 from typing import List
 
 import numpy as np
@@ -12,6 +13,14 @@ import chromadb
 
 
 class Chromadb(VectorStorage):
+    """
+    Chroma vector store with one collection per model.
+
+    Collection handles are fetched once per model and kept until rebuild_col,
+    together with a running entry count that lets searches skip empty
+    collections without a count() round trip. Embeddings go to Chroma as
+    float32 arrays, without per-vector list conversion.
+    """
 
     def __init__(
             self,
@@ -22,44 +31,70 @@ class Chromadb(VectorStorage):
         self.top_k = top_k
 
         self._client = chromadb.PersistentClient(path=persist_directory)
-        self._collection = None
+        self._collections = {}
+        self._counts = {}
+        self._lock = threading.Lock()
 
-    def mul_add(self, datas: List[VectorData], model=None):
+    def _get_collection(self, model):
         collection_name_model = self.collection_name + '_' + model
-        self._collection = self._client.get_or_create_collection(name=collection_name_model)
+        collection = self._collections.get(collection_name_model)
+        if collection is not None:
+            return collection
+        with self._lock:
+            if collection_name_model not in self._collections:
+                collection = self._client.get_or_create_collection(name=collection_name_model)
+                self._counts[collection_name_model] = collection.count()
+                self._collections[collection_name_model] = collection
+            return self._collections[collection_name_model]
+
+    def _add_count(self, collection, delta):
+        # Only used to tell empty collections apart, so re-added ids counting twice is harmless
+        with self._lock:
+            if collection.name in self._counts:
+                self._counts[collection.name] = max(0, self._counts[collection.name] + delta)
 
-        data_array, id_array = map(list, zip(*((data.data.tolist(), str(data.id)) for data in datas)))
-        self._collection.add(embeddings=data_array, ids=id_array)
+    def mul_add(self, datas: List[VectorData], model=None):
+        collection = self._get_collection(model)
+        embeddings = np.asarray([data.data for data in datas], dtype=np.float32).reshape(len(datas), -1)
+        id_array = [str(data.id) for data in datas]
+        collection.add(embeddings=embeddings, ids=id_array)
+        self._add_count(collection, len(id_array))
 
     def search(self, data: np.ndarray, top_k: int = -1, model=None):
-        collection_name_model = self.collection_name + '_' + model
-        self._collection = self._client.get_or_create_collection(name=collection_name_model)
+        return self.search_many(np.asarray(data).reshape(1, -1), top_k=top_k, model=model)[0]
 
-        if self._collection.count() == 0:
-            return []
+    def search_many(self, datas: np.ndarray, top_k: int = -1, model=None):
+        collection = self._get_collection(model)
+        datas = np.asarray(datas, dtype=np.float32).reshape(len(datas), -1)
+        if self._counts.get(collection.name, 0) == 0:
+            return [[] for _ in range(len(datas))]
         if top_k == -1:
             top_k = self.top_k
-        results = self._collection.query(
-            query_embeddings=[data.tolist()],
+        # One query call for every embedding
+        results = collection.query(
+            query_embeddings=datas,
             n_results=top_k,
             include=["distances"],
         )
-        return list(zip(results["distances"][0], [int(x) for x in results["ids"][0]]))
+        return [
+            list(zip(distances, [int(x) for x in ids]))
+            for distances, ids in zip(results["distances"], results["ids"])
+        ]
 
     def rebuild(self, ids=None):
         pass
 
     def delete(self, ids, model=None):
         try:
-            collection_name_model = self.collection_name + '_' + model
-            self._collection = self._client.get_or_create_collection(name=collection_name_model)
+            collection = self._get_collection(model)
             # 查询集合中实际存在的 ID
             ids_str = [str(x) for x in ids]
-            existing_ids = set(self._collection.get(ids=ids_str).ids)
+            existing_ids = set(collection.get(ids=ids_str, include=[])["ids"])
 
             # 删除存在的 ID
             if existing_ids:
-                self._collection.delete(list(existing_ids))
+                collection.delete(list(existing_ids))
+                self._add_count(collection, -len(existing_ids))
 
             # 返回实际删除的条目数量
             return len(existing_ids)
@@ -73,10 +108,14 @@ class Chromadb(VectorStorage):
 
         # 检查集合是否存在，如果存在则删除
         collections = self._client.list_collections()
-        if any(col.name == collection_name_model for col in collections):
+        # Chroma 0.6+ lists collection names rather than collection objects
+        if any(getattr(col, "name", col) == collection_name_model for col in collections):
             self._client.delete_collection(collection_name_model)
         else:
             return 'model collection not found, please check!'
+        with self._lock:
+            self._collections.pop(collection_name_model, None)
+            self._counts.pop(collection_name_model, None)
 
         try:
             self._client.create_collection(collection_name_model)
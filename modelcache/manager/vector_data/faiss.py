@@ -1,56 +1,428 @@
 # -*- coding: utf-8 -*-
 import os
-from typing import List
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import quote
 import numpy as np
+from readerwriterlock import rwlock
+from modelcache.embedding import MetricType
 from modelcache.manager.vector_data.base import VectorStorage, VectorData
+from modelcache.manager.vector_data.id_map import IdMap
+from modelcache.manager.vector_data.wal import WriteAheadLog, OP_ADD, OP_DELETE, OP_DROP
+from modelcache.utils.log import modelcache_log
 from modelcache.utils import import_faiss
 import_faiss()
 import faiss  # pylint: disable=C0413
 
+# Deleted vectors an index may keep (when it cannot remove ids) before it is rebuilt from the live ones
+COMPACT_MIN_TOMBSTONES = 1000
+
+# IO_FLAG_MMAP_IFC (faiss >= 1.11) maps flat codes, HNSW links and IVF lists; IO_FLAG_MMAP only maps IVF lists
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def _is_view(vector) -> bool:
+    # MaybeOwnedVector; plain std::vector wrappers of older faiss are always owned copies
+    return not getattr(vector, "is_owned", True)
+
+
+def _is_mapped(index) -> bool:
+    """Whether the bulk of a loaded index (codes, graph links, inverted lists) is served from its memory map."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexPreTransform)):
+        return _is_mapped(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return _is_view(index.hnsw.neighbors) and _is_mapped(index.storage)
+    if isinstance(index, faiss.IndexFlatCodes):
+        return index.ntotal == 0 or _is_view(index.codes)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        invlists = faiss.downcast_InvertedLists(ivf.invlists)
+        if isinstance(invlists, faiss.OnDiskInvertedLists):
+            return True
+        if isinstance(invlists, faiss.ArrayInvertedLists):
+            return all(_is_view(invlists.codes.at(i)) for i in range(invlists.nlist) if invlists.list_size(i))
+    return False
+
 
 class Faiss(VectorStorage):
-    def __init__(self, index_file_path, dimension, top_k):
-        self._index_file_path = index_file_path
+    """
+    One Faiss index per model, built from a configurable index_factory string
+    ("Flat", "HNSW32", "IVF1024,PQ64", "IVF256,SQ8", ...).
+
+    Cache ids are mapped to int64 labels through an IdMap. Indexes that need
+    training collect their first train_size vectors in a flat staging index,
+    which also serves searches until the real index is trained on them.
+    Each model is persisted as <index_dir>/<model>.index plus its id map.
+
+    With mmap, saved indexes are memory-mapped instead of read into memory, so
+    processes on one host share their vectors through the page cache and
+    startup does not grow with index size; only the id map is read. Which
+    parts faiss can map depends on its version (see MMAP_FLAG); an index it
+    reads into memory anyway is logged with a warning and served as a normal
+    in-memory index. A mapped index is read into memory on its first write.
+    Snapshots are written aside and renamed, which keeps existing mappings of
+    the previous file valid.
+
+    With wal, every insert and delete is appended to a write-ahead log and
+    made durable by a group-committed fsync before the call returns; a
+    background checkpoint snapshots the indexes changed since the previous
+    one and then drops the log segments they cover (see flush).
+    """
+
+    def __init__(
+            self,
+            index_dir: str,
+            dimension: int,
+            top_k: int,
+            index_factory: str = "Flat",
+            metric_type: MetricType = MetricType.L2,
+            train_size: int = 10000,
+            search_params: Optional[str] = None,
+            mmap: bool = False,
+            wal: bool = False,
+            wal_fsync: bool = True,
+            checkpoint_interval: float = 300.0,
+    ):
+        self._index_dir = index_dir
         self._dimension = dimension
-        self._index = faiss.index_factory(self._dimension, "IDMap,Flat", faiss.METRIC_L2)
         self._top_k = top_k
-        if os.path.isfile(index_file_path):
-            self._index = faiss.read_index(index_file_path)
+        self._index_factory = index_factory
+        self._train_size = train_size
+        self._search_params = search_params
+        self._mmap = mmap
+        # Cosine similarity is the inner product of L2-normalized vectors
+        self._normalize = metric_type == MetricType.COSINE
+        self._metric = faiss.METRIC_INNER_PRODUCT if self._normalize else faiss.METRIC_L2
+
+        self._indexes: Dict[str, faiss.Index] = {}
+        self._staging: Dict[str, faiss.Index] = {}
+        self._id_maps: Dict[str, IdMap] = {}
+        # Models whose index is still the read-only memory-mapped snapshot
+        self._mapped = set()
+        # Models changed since the last checkpoint started
+        self._dirty = set()
+        self._lock = rwlock.RWLockWrite()
+        self._flush_lock = threading.Lock()
+        os.makedirs(self._index_dir, exist_ok=True)
+
+        # Inserts and deletes since the last snapshot are replayed from the write-ahead log
+        self._wal = None
+        if wal:
+            # Hold the write lock so no checkpoint can empty the log before it is replayed
+            with self._lock.gen_wlock():
+                self._wal = WriteAheadLog(
+                    os.path.join(self._index_dir, "wal.log"),
+                    fsync=wal_fsync,
+                    checkpoint_func=self.flush,
+                    checkpoint_interval=checkpoint_interval,
+                )
+                self._wal.replay(self._apply_wal_record, self._dimension)
+
+    # ----------- index lifecycle -----------
+
+    def _path(self, model, suffix):
+        return os.path.join(self._index_dir, quote(str(model), safe="") + suffix)
+
+    def _new_index(self):
+        index = faiss.index_factory(self._dimension, self._index_factory, self._metric)
+        if not self._index_factory.startswith("IDMap"):
+            index = faiss.IndexIDMap2(index)
+        self._apply_search_params(index)
+        return index
+
+    def _new_staging(self):
+        return faiss.IndexIDMap2(faiss.IndexFlat(self._dimension, self._metric))
+
+    def _apply_search_params(self, index):
+        if self._search_params:
+            faiss.ParameterSpace().set_index_parameters(index, self._search_params)
+
+    def _load(self, model):
+        """Make the model's index available in memory, reading it from disk if present. Needs the write lock."""
+        if model in self._indexes:
+            return
+        index_path = self._path(model, ".index")
+        if os.path.isfile(index_path):
+            index = self._read_index(index_path, self._mmap)
+            if self._mmap:
+                if _is_mapped(index):
+                    self._mapped.add(model)
+                else:
+                    modelcache_log.warning(
+                        f"faiss {faiss.__version__} cannot memory-map the {self._index_factory} index of model "
+                        f"{model}; it was read into memory.")
+        else:
+            index = self._new_index()
+        staging = None
+        if not index.is_trained:
+            staging_path = self._path(model, ".staging.index")
+            staging = faiss.read_index(staging_path) if os.path.isfile(staging_path) else self._new_staging()
+        self._indexes[model] = index
+        if staging is not None:
+            self._staging[model] = staging
+        self._id_maps[model] = IdMap.load(self._path(model, ".ids"))
+
+    def _read_index(self, path, mmap=False):
+        index = faiss.read_index(path, MMAP_FLAG if mmap else 0)
+        self._apply_search_params(index)
+        return index
+
+    @staticmethod
+    def _write_file(data: np.ndarray, path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(memoryview(data))
+            f.flush()
+            os.fsync(f.fileno())  # The snapshot must be on disk before the log is emptied
+        os.replace(path + ".tmp", path)
+
+    def _make_writable(self, model):
+        """Replace a memory-mapped snapshot by an in-memory copy before modifying it. Needs the write lock."""
+        if model in self._mapped:
+            self._indexes[model] = self._read_index(self._path(model, ".index"))
+            self._mapped.discard(model)
+
+    def _ensure_loaded(self, model):
+        if model in self._indexes:
+            return
+        with self._lock.gen_wlock():
+            self._load(model)
+
+    def _searchable(self, model):
+        staging = self._staging.get(model)
+        return staging if staging is not None else self._indexes[model]
+
+    def _add(self, model, vectors, internal_ids):
+        staging = self._staging.get(model)
+        if staging is None:
+            self._indexes[model].add_with_ids(vectors, internal_ids)
+            return
+        staging.add_with_ids(vectors, internal_ids)
+        if staging.ntotal >= self._train_size:
+            self._train(model)
+
+    def _train(self, model):
+        """Train the model's index on the staged vectors and move them into it."""
+        staging = self._staging[model]
+        vectors = staging.index.reconstruct_n(0, staging.ntotal)
+        ids = faiss.vector_to_array(staging.id_map)
+        index = self._indexes[model]
+        index.train(vectors)
+        index.add_with_ids(vectors, ids)
+        del self._staging[model]
+        modelcache_log.info(f"faiss index of model {model} trained on {len(ids)} vectors.")
+
+    def _remove(self, model, internal_ids):
+        if len(internal_ids) == 0:
+            return
+        index = self._searchable(model)
+        try:
+            index.remove_ids(internal_ids)
+        except RuntimeError:
+            # e.g. HNSW: the vectors stay in the index as tombstones, filtered out at search time
+            tombstones = index.ntotal - len(self._id_maps[model])
+            if tombstones > max(len(self._id_maps[model]), COMPACT_MIN_TOMBSTONES):
+                self._compact(model)
+
+    def _compact(self, model):
+        """Rebuild the model's index from its live vectors only."""
+        old = self._searchable(model)
+        id_map = self._id_maps[model]
+        ids = id_map.internal(id_map.external_ids())
+        vectors = np.vstack([old.reconstruct(int(i)) for i in ids]) if len(ids) else None
+        self._indexes[model] = self._new_index()
+        self._staging.pop(model, None)
+        if not self._indexes[model].is_trained:
+            self._staging[model] = self._new_staging()
+        if vectors is not None:
+            self._add(model, vectors, ids)
+
+    # ----------- VectorStorage -----------
+
+    def create(self, model=None):
+        if model in self._indexes or os.path.isfile(self._path(model, ".index")):
+            return 'already_exists'
+        self._ensure_loaded(model)
+        return 'create_success'
+
+    def _apply_wal_record(self, op, model, ids, vectors):
+        if op == OP_ADD:
+            self._mul_add(model, vectors, ids)
+        elif op == OP_DELETE:
+            self._delete(model, ids)
+        elif op == OP_DROP:
+            self._drop(model)
+
+    def _mul_add(self, model, vectors, ids):
+        """Needs the write lock."""
+        self._load(model)
+        self._make_writable(model)
+        id_map = self._id_maps[model]
+        replaced = id_map.internal(ids)
+        internal_ids = id_map.assign(ids)
+        self._remove(model, replaced)
+        self._add(model, vectors, internal_ids)
+        self._dirty.add(model)
+
+    def _delete(self, model, ids):
+        """Needs the write lock."""
+        self._load(model)
+        internal_ids = self._id_maps[model].remove(ids)
+        if len(internal_ids):
+            self._make_writable(model)
+            self._dirty.add(model)
+        self._remove(model, internal_ids)
+        return len(internal_ids)
+
+    def _drop(self, model):
+        """Needs the write lock."""
+        self._indexes.pop(model, None)
+        self._staging.pop(model, None)
+        self._id_maps.pop(model, None)
+        self._mapped.discard(model)
+        self._dirty.discard(model)
+        for suffix in (".index", ".staging.index", ".ids"):
+            path = self._path(model, suffix)
+            if os.path.isfile(path):
+                os.remove(path)
 
     def mul_add(self, datas: List[VectorData], model=None):
-        data_array, id_array = map(list, zip(*((data.data, data.id) for data in datas)))
-        np_data = np.array(data_array).astype("float32")
-        ids = np.array(id_array)
-        self._index.add_with_ids(np_data, ids)
+        if not datas:
+            return
+        vectors = np.array([data.data for data in datas], dtype="float32").reshape(len(datas), -1)
+        if self._normalize:
+            faiss.normalize_L2(vectors)
+        ids = [data.id for data in datas]
+        seq = None
+        with self._lock.gen_wlock():
+            if self._wal is not None:
+                seq = self._wal.append_add(model, ids, vectors)
+            self._mul_add(model, vectors, ids)
+        if seq is not None:
+            self._wal.wait(seq)
 
     def search(self, data: np.ndarray, top_k: int = -1, model=None):
-        if self._index.ntotal == 0:
-            return None
+        return self.search_many(np.asarray(data).reshape(1, -1), top_k=top_k, model=model)[0]
+
+    def search_many(self, datas: np.ndarray, top_k: int = -1, model=None):
         if top_k == -1:
             top_k = self._top_k
-        np_data = np.array(data).astype("float32").reshape(1, -1)
-        dist, ids = self._index.search(np_data, top_k)
-        ids = [int(i) for i in ids[0]]
-        return list(zip(dist[0], ids))
+        queries = np.array(datas, dtype="float32").reshape(len(datas), -1)
+        if self._normalize:
+            faiss.normalize_L2(queries)
+        if model not in self._indexes and not os.path.isfile(self._path(model, ".index")):
+            return [[] for _ in range(len(queries))]  # Nothing stored for this model
+        self._ensure_loaded(model)
+        with self._lock.gen_rlock():
+            if model not in self._indexes:
+                return [[] for _ in range(len(queries))]  # Dropped by rebuild_col meanwhile
+            index = self._searchable(model)
+            id_map = self._id_maps[model]
+            if index.ntotal == 0:
+                return [[] for _ in range(len(queries))]
+            # Over-fetch by the number of deleted vectors still in the index
+            k = min(top_k + index.ntotal - len(id_map), index.ntotal)
+            dist, labels = index.search(queries, k)
+
+            results = []
+            for row_dist, row_labels in zip(dist, labels):
+                row = []
+                for d, label in zip(row_dist, row_labels):
+                    _id = id_map.external(label) if label != -1 else None
+                    if _id is not None:
+                        row.append((float(d), _id))
+                        if len(row) == top_k:
+                            break
+                results.append(row)
+        return results
+
+    def rebuild(self, ids=None):
+        return True
+
+    def delete(self, ids, model=None):
+        seq = None
+        with self._lock.gen_wlock():
+            models = [model] if model is not None else list(self._indexes)
+            count = 0
+            for m in models:
+                if self._wal is not None:
+                    seq = self._wal.append_delete(m, ids)
+                count += self._delete(m, ids)
+        if seq is not None:
+            self._wal.wait(seq)
+        return count
 
-    def rebuild_col(self, ids=None):
+    def rebuild_col(self, model):
         try:
-            self._index.reset()
+            seq = None
+            # Waits for a running checkpoint, which could otherwise write the dropped model back
+            with self._flush_lock, self._lock.gen_wlock():
+                if self._wal is not None:
+                    seq = self._wal.append_drop(model)
+                self._drop(model)
+            if seq is not None:
+                self._wal.wait(seq)
         except Exception as e:
             return f"An error occurred during index rebuild: {e}"
 
-    def rebuild(self, ids=None):
-        return True
+    def _snapshot(self, model):
+        """In-memory copy of the model's index, staging index and id map, or None if there is nothing to save. Needs the read lock."""
+        index = self._indexes.get(model)
+        if index is None:
+            return None  # Dropped meanwhile
+        staging = self._staging.get(model)
+        return (
+            faiss.serialize_index(index),
+            faiss.serialize_index(staging) if staging is not None else None,
+            self._id_maps[model].dumps(),
+        )
 
-    def delete(self, ids):
-        ids_to_remove = np.array(ids)
-        self._index.remove_ids(faiss.IDSelectorBatch(ids_to_remove.size, faiss.swig_ptr(ids_to_remove)))
+    def _write_snapshot(self, model, snapshot):
+        index_data, staging_data, id_map_data = snapshot
+        self._write_file(index_data, self._path(model, ".index"))
+        staging_path = self._path(model, ".staging.index")
+        if staging_data is not None:
+            self._write_file(staging_data, staging_path)
+        elif os.path.isfile(staging_path):
+            os.remove(staging_path)
+        IdMap.write(self._path(model, ".ids"), id_map_data)
 
     def flush(self):
-        faiss.write_index(self._index, self._index_file_path)
+        """
+        Checkpoint the models changed since the last one.
+
+        Writers are held off only while the log is rotated and while each
+        changed index is serialized in memory, one model at a time; searches
+        go on throughout. The snapshots are written and fsynced without the
+        lock, after which the sealed log segments they cover are deleted.
+        """
+        with self._flush_lock:
+            # The read lock keeps writers, and so new log records, out of the rotation
+            with self._lock.gen_rlock():
+                dirty, self._dirty = self._dirty, set()
+                segment = self._wal.rotate() if self._wal is not None else None
+            try:
+                for model in list(dirty):
+                    with self._lock.gen_rlock():
+                        snapshot = self._snapshot(model)
+                    if snapshot is not None:
+                        self._write_snapshot(model, snapshot)
+                    dirty.discard(model)
+            except Exception:
+                # Saved again by the next checkpoint; the sealed segments stay until then
+                with self._lock.gen_wlock():
+                    self._dirty |= dirty
+                raise
+            if segment is not None:
+                self._wal.remove_sealed(segment)
 
     def close(self):
         self.flush()
+        if self._wal is not None:
+            self._wal.close()
 
-    def count(self):
-        return self._index.ntotal
+    def count(self, model=None):
+        if model is not None:
+            self._ensure_loaded(model)
+            return len(self._id_maps[model])
+        return sum(len(id_map) for id_map in self._id_maps.values())
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+import copy
+import os
+import threading
+from typing import Dict, List
+from urllib.parse import quote
+import numpy as np
+from readerwriterlock import rwlock
+from modelcache.embedding import MetricType
+from modelcache.manager.vector_data.base import VectorStorage, VectorData
+from modelcache.manager.vector_data.id_map import IdMap
+from modelcache.manager.vector_data.wal import WriteAheadLog, OP_ADD, OP_DELETE, OP_DROP
+from modelcache.utils import import_hnswlib
+import_hnswlib()
+import hnswlib  # pylint: disable=C0413
+
+
+class Hnswlib(VectorStorage):
+    """
+    One in-process hnswlib index per model.
+
+    Cache ids are mapped to integer labels through an IdMap. Deleted labels are
+    marked deleted and their slots reused by later inserts; an index that fills
+    up is resized to twice its capacity. Each model is persisted as
+    <index_dir>/<model>.bin plus its id map, optionally backed by a
+    write-ahead log of the changes since the last snapshot. Checkpoints only
+    save the models changed since the previous one (see flush).
+    """
+
+    def __init__(
+            self,
+            index_dir: str,
+            dimension: int,
+            top_k: int,
+            max_elements: int = 100000,
+            metric_type: MetricType = MetricType.L2,
+            m: int = 16,
+            ef_construction: int = 200,
+            ef_search: int = 64,
+            wal: bool = False,
+            wal_fsync: bool = True,
+            checkpoint_interval: float = 300.0,
+    ):
+        self._index_dir = index_dir
+        self._dimension = dimension
+        self._top_k = top_k
+        self._max_elements = max_elements
+        # hnswlib returns 1 - cosine for "cosine" and the squared distance for "l2"
+        self._cosine = metric_type == MetricType.COSINE
+        self._space = "cosine" if self._cosine else "l2"
+        self._m = m
+        self._ef_construction = ef_construction
+        self._ef_search = ef_search
+
+        self._indexes: Dict[str, hnswlib.Index] = {}
+        self._id_maps: Dict[str, IdMap] = {}
+        # Models changed since the last checkpoint started
+        self._dirty = set()
+        self._lock = rwlock.RWLockWrite()
+        self._flush_lock = threading.Lock()
+        os.makedirs(self._index_dir, exist_ok=True)
+
+        # Inserts and deletes since the last snapshot are replayed from the write-ahead log
+        self._wal = None
+        if wal:
+            # Hold the write lock so no checkpoint can empty the log before it is replayed
+            with self._lock.gen_wlock():
+                self._wal = WriteAheadLog(
+                    os.path.join(self._index_dir, "wal.log"),
+                    fsync=wal_fsync,
+                    checkpoint_func=self.flush,
+                    checkpoint_interval=checkpoint_interval,
+                )
+                self._wal.replay(self._apply_wal_record, self._dimension)
+
+    def _path(self, model, suffix):
+        return os.path.join(self._index_dir, quote(str(model), safe="") + suffix)
+
+    def _load(self, model):
+        """Make the model's index available in memory, reading it from disk if present. Needs the write lock."""
+        if model in self._indexes:
+            return
+        index = hnswlib.Index(space=self._space, dim=self._dimension)
+        index_path = self._path(model, ".bin")
+        if os.path.isfile(index_path):
+            index.load_index(index_path, allow_replace_deleted=True)
+        else:
+            index.init_index(
+                max_elements=self._max_elements,
+                ef_construction=self._ef_construction,
+                M=self._m,
+                allow_replace_deleted=True,
+            )
+        index.set_ef(self._ef_search)
+        self._indexes[model] = index
+        self._id_maps[model] = IdMap.load(self._path(model, ".ids"))
+
+    def _ensure_loaded(self, model):
+        if model in self._indexes:
+            return
+        with self._lock.gen_wlock():
+            self._load(model)
+
+    def _mark_deleted(self, model, labels):
+        index = self._indexes[model]
+        for label in labels:
+            index.mark_deleted(int(label))
+
+    def create(self, model=None):
+        if model in self._indexes or os.path.isfile(self._path(model, ".bin")):
+            return 'already_exists'
+        self._ensure_loaded(model)
+        return 'create_success'
+
+    def _apply_wal_record(self, op, model, ids, vectors):
+        if op == OP_ADD:
+            self._mul_add(model, vectors, ids)
+        elif op == OP_DELETE:
+            self._delete(model, ids)
+        elif op == OP_DROP:
+            self._drop(model)
+
+    def _mul_add(self, model, vectors, ids):
+        """Needs the write lock."""
+        self._load(model)
+        index = self._indexes[model]
+        id_map = self._id_maps[model]
+        replaced = id_map.internal(ids)
+        self._mark_deleted(model, replaced)
+        # Deleted slots are reused, so only live elements count against the capacity
+        needed = len(id_map) - len(replaced) + len(ids)
+        labels = id_map.assign(ids)
+        if needed > index.get_max_elements():
+            index.resize_index(max(needed, 2 * index.get_max_elements()))
+        index.add_items(vectors, labels, replace_deleted=True)
+        self._dirty.add(model)
+
+    def _delete(self, model, ids):
+        """Needs the write lock."""
+        self._load(model)
+        labels = self._id_maps[model].remove(ids)
+        self._mark_deleted(model, labels)
+        if len(labels):
+            self._dirty.add(model)
+        return len(labels)
+
+    def _drop(self, model):
+        """Needs the write lock."""
+        self._indexes.pop(model, None)
+        self._id_maps.pop(model, None)
+        self._dirty.discard(model)
+        for suffix in (".bin", ".ids"):
+            path = self._path(model, suffix)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def mul_add(self, datas: List[VectorData], model=None):
+        if not datas:
+            return
+        vectors = np.array([data.data for data in datas], dtype="float32").reshape(len(datas), -1)
+        ids = [data.id for data in datas]
+        seq = None
+        with self._lock.gen_wlock():
+            if self._wal is not None:
+                seq = self._wal.append_add(model, ids, vectors)
+            self._mul_add(model, vectors, ids)
+        if seq is not None:
+            self._wal.wait(seq)
+
+    def search(self, data: np.ndarray, top_k: int = -1, model=None):
+        return self.search_many(np.asarray(data).reshape(1, -1), top_k=top_k, model=model)[0]
+
+    def search_many(self, datas: np.ndarray, top_k: int = -1, model=None):
+        if top_k == -1:
+            top_k = self._top_k
+        queries = np.array(datas, dtype="float32").reshape(len(datas), -1)
+        if model not in self._indexes and not os.path.isfile(self._path(model, ".bin")):
+            return [[] for _ in range(len(queries))]  # Nothing stored for this model
+        self._ensure_loaded(model)
+        with self._lock.gen_rlock():
+            if model not in self._indexes:
+                return [[] for _ in range(len(queries))]  # Dropped by rebuild_col meanwhile
+            index = self._indexes[model]
+            id_map = self._id_maps[model]
+            k = min(top_k, len(id_map))
+            if k == 0:
+                return [[] for _ in range(len(queries))]
+            while True:
+                try:
+                    labels, dist = index.knn_query(queries, k=k)
+                    break
+                except RuntimeError:
+                    # Too few live neighbours reachable for k results; ask for fewer
+                    if k == 1:
+                        return [[] for _ in range(len(queries))]
+                    k = max(1, k // 2)
+
+            results = []
+            for row_labels, row_dist in zip(labels, dist):
+                row = []
+                for label, d in zip(row_labels, row_dist):
+                    _id = id_map.external(label)
+                    if _id is not None:
+                        score = 1.0 - float(d) if self._cosine else float(d)
+                        row.append((score, _id))
+                results.append(row)
+        return results
+
+    def rebuild(self, ids=None):
+        return True
+
+    def delete(self, ids, model=None):
+        seq = None
+        with self._lock.gen_wlock():
+            models = [model] if model is not None else list(self._indexes)
+            count = 0
+            for m in models:
+                if self._wal is not None:
+                    seq = self._wal.append_delete(m, ids)
+                count += self._delete(m, ids)
+        if seq is not None:
+            self._wal.wait(seq)
+        return count
+
+    def rebuild_col(self, model):
+        try:
+            seq = None
+            # Waits for a running checkpoint, which could otherwise write the dropped model back
+            with self._flush_lock, self._lock.gen_wlock():
+                if self._wal is not None:
+                    seq = self._wal.append_drop(model)
+                self._drop(model)
+            if seq is not None:
+                self._wal.wait(seq)
+        except Exception as e:
+            return f"An error occurred during index rebuild: {e}"
+
+    def _write_snapshot(self, model, index, id_map_data):
+        index_path = self._path(model, ".bin")
+        # Write aside and rename so a crash never leaves a truncated index behind
+        index.save_index(index_path + ".tmp")
+        with open(index_path + ".tmp", "rb") as f:
+            os.fsync(f.fileno())  # The snapshot must be on disk before the log is emptied
+        os.replace(index_path + ".tmp", index_path)
+        IdMap.write(self._path(model, ".ids"), id_map_data)
+
+    def flush(self):
+        """
+        Checkpoint the models changed since the last one.
+
+        Writers are held off only while the log is rotated and while each
+        changed index is copied in memory, one model at a time; searches go on
+        throughout. The copies are saved and fsynced without the lock, after
+        which the sealed log segments they cover are deleted.
+        """
+        with self._flush_lock:
+            # The read lock keeps writers, and so new log records, out of the rotation
+            with self._lock.gen_rlock():
+                dirty, self._dirty = self._dirty, set()
+                segment = self._wal.rotate() if self._wal is not None else None
+            try:
+                for model in list(dirty):
+                    with self._lock.gen_rlock():
+                        index = self._indexes.get(model)
+                        if index is not None:
+                            index, id_map_data = copy.deepcopy(index), self._id_maps[model].dumps()
+                    if index is not None:
+                        self._write_snapshot(model, index, id_map_data)
+                    dirty.discard(model)
+            except Exception:
+                # Saved again by the next checkpoint; the sealed segments stay until then
+                with self._lock.gen_wlock():
+                    self._dirty |= dirty
+                raise
+            if segment is not None:
+                self._wal.remove_sealed(segment)
+
+    def close(self):
+        self.flush()
+        if self._wal is not None:
+            self._wal.close()
+
+    def count(self, model=None):
+        if model is not None:
+            self._ensure_loaded(model)
+            return len(self._id_maps[model])
+        return sum(len(id_map) for id_map in self._id_maps.values())
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class IdMap:
+    """
+    Map cache ids to the dense int64 ids used inside in-process vector indexes.
+
+    Scalar storages hand out string UUIDs (MySQL) or arbitrary integers
+    (SQLite, Elasticsearch); indexes such as Faiss only accept int64 labels.
+    Internal ids are never reused, so an internal id that no longer maps back
+    to a cache id marks a deleted vector still present in the index.
+    """
+
+    def __init__(self):
+        self._to_internal: Dict[Any, int] = {}
+        self._to_external: Dict[int, Any] = {}
+        self._next_id = 0
+
+    @staticmethod
+    def _external(_id):
+        # numpy integers are not JSON serializable and hash differently from str ids
+        return int(_id) if isinstance(_id, np.integer) else _id
+
+    def assign(self, ids: Iterable[Any]) -> np.ndarray:
+        """Give each cache id a fresh internal id; ids already mapped drop their old internal id."""
+        internal_ids = []
+        for _id in ids:
+            _id = self._external(_id)
+            old = self._to_internal.get(_id)
+            if old is not None:
+                del self._to_external[old]
+            self._to_internal[_id] = self._next_id
+            self._to_external[self._next_id] = _id
+            internal_ids.append(self._next_id)
+            self._next_id += 1
+        return np.array(internal_ids, dtype=np.int64)
+
+    def internal(self, ids: Iterable[Any]) -> np.ndarray:
+        """Internal ids of the mapped cache ids, skipping unknown ones."""
+        internal_ids = [self._to_internal.get(self._external(_id)) for _id in ids]
+        return np.array([i for i in internal_ids if i is not None], dtype=np.int64)
+
+    def external(self, internal_id: int) -> Optional[Any]:
+        return self._to_external.get(int(internal_id))
+
+    def remove(self, ids: Iterable[Any]) -> np.ndarray:
+        """Forget the cache ids, returning the internal ids they had."""
+        removed = []
+        for _id in ids:
+            internal_id = self._to_internal.pop(self._external(_id), None)
+            if internal_id is not None:
+                del self._to_external[internal_id]
+                removed.append(internal_id)
+        return np.array(removed, dtype=np.int64)
+
+    def external_ids(self) -> List[Any]:
+        return list(self._to_internal)
+
+    def __len__(self):
+        return len(self._to_internal)
+
+    def __contains__(self, _id):
+        return self._external(_id) in self._to_internal
+
+    def dumps(self) -> str:
+        """The map as saved, for writing later with write() while the map keeps changing."""
+        return json.dumps({"next_id": self._next_id, "ids": list(self._to_internal.items())})
+
+    @staticmethod
+    def write(path: str, data: str):
+        # Write aside and rename so a crash never leaves a truncated map behind
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def save(self, path: str):
+        self.write(path, self.dumps())
+
+    @classmethod
+    def load(cls, path: str) -> "IdMap":
+        id_map = cls()
+        if not os.path.isfile(path):
+            return id_map
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        id_map._next_id = state["next_id"]
+        for _id, internal_id in state["ids"]:
+            id_map._to_internal[_id] = internal_id
+            id_map._to_external[internal_id] = _id
+        return id_map
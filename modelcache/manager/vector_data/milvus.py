@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import logging
+import re
 from typing import List
 from uuid import uuid4
 import numpy as np
@@ -22,8 +24,35 @@ from pymilvus import (  # pylint: disable=C0413
     MilvusException,
 )
 
+# Query-time parameters of each Milvus index type; anything else is searched without extra params
+SEARCH_PARAMS = {
+    "IVF_FLAT": {"nprobe": 10},
+    "IVF_SQ8": {"nprobe": 10},
+    "IVF_PQ": {"nprobe": 10},
+    "HNSW": {"ef": 10},
+    "RHNSW_FLAT": {"ef": 10},
+    "RHNSW_SQ": {"ef": 10},
+    "RHNSW_PQ": {"ef": 10},
+    "IVF_HNSW": {"nprobe": 10, "ef": 10},
+    "ANNOY": {"search_k": 10},
+    "AUTOINDEX": {},
+}
+
 
 class Milvus(VectorStorage):
+    """
+    Milvus vector store.
+
+    By default every model gets its own collection named <collection_name>_<model>.
+    With partition_per_model, all models share the collection <collection_name>
+    and each model is a partition of it, so only one collection is loaded no
+    matter how many models there are (Milvus caps partitions per collection,
+    see rootCoord.maxPartitionNum).
+
+    Searches send the parameters of the index actually built on the collection:
+    search_params entries such as {"ef": 64} or {"nprobe": 16} override the
+    defaults in SEARCH_PARAMS for the index types that use them.
+    """
 
     def __init__(
         self,
@@ -40,6 +69,7 @@ class Milvus(VectorStorage):
         local_mode: bool = False,
         local_data: str = "./milvus_data",
         metric_type: MetricType = MetricType.COSINE,
+        partition_per_model: bool = False,
     ):
         if dimension <= 0:
             raise ValueError(
@@ -53,24 +83,23 @@ class Milvus(VectorStorage):
             self._create_local(port, local_data)
         self._connect(host, port, user, password, secure)
         self.collection_name = collection_name
+        self.metric_type = metric_type
         self.search_params = {
-            "IVF_FLAT": {"metric_type": metric_type.value, "params": {"nprobe": 10}},
-            "IVF_SQ8": {"metric_type": metric_type.value, "params": {"nprobe": 10}},
-            "IVF_PQ": {"metric_type": metric_type.value, "params": {"nprobe": 10}},
-            "HNSW": {"metric_type": metric_type.value, "params": {"ef": 10}},
-            "RHNSW_FLAT": {"metric_type": metric_type.value, "params": {"ef": 10}},
-            "RHNSW_SQ": {"metric_type": metric_type.value, "params": {"ef": 10}},
-            "RHNSW_PQ": {"metric_type": metric_type.value, "params": {"ef": 10}},
-            "IVF_HNSW": {"metric_type": metric_type.value, "params": {"nprobe": 10, "ef": 10}},
-            "ANNOY": {"metric_type": metric_type.value, "params": {"search_k": 10}},
-            "AUTOINDEX": {"metric_type": metric_type.value, "params": {}},
+            index_type: {
+                name: (search_params or {}).get(name, default) for name, default in params.items()
+            }
+            for index_type, params in SEARCH_PARAMS.items()
         }
-        self.index_params ={
+        self.index_params = index_params or {
             "metric_type": metric_type.value,
             "index_type": "HNSW",
             "params": {"M": 16, "efConstruction": 64},
         }
+        self.partition_per_model = partition_per_model
         self.collections = dict()
+        # Search param of each collection, derived from the index built on it
+        self._search_param = dict()
+        self._partitions = set()
 
 
     def _connect(self, host, port, user, password, secure):
@@ -122,22 +151,25 @@ class Milvus(VectorStorage):
                 collection_name, consistency_level="Session", using=self.alias
             )
 
-        self.collections[collection_name] = new_collection
-
         if len(new_collection.indexes) == 0:
             try:
                 modelcache_log.info("Attempting creation of Milvus index.")
-                new_collection.create_index("embedding", index_params=self.index_params)
+                index_params = self.index_params
+                new_collection.create_index("embedding", index_params=index_params)
                 modelcache_log.info("Creation of Milvus index successful.")
             except MilvusException as e:
                 modelcache_log.warning("Error with building index: %s, and attempting creation of default index.", e)
-                i_p = {"metric_type": "L2", "index_type": "AUTOINDEX", "params": {}}
-                new_collection.create_index("embedding", index_params=i_p)
-                self.index_params = i_p
+                index_params = {"metric_type": "L2", "index_type": "AUTOINDEX", "params": {}}
+                new_collection.create_index("embedding", index_params=index_params)
         else:
-            self.index_params = new_collection.indexes[0].to_dict()["index_param"]
+            index_params = new_collection.indexes[0].to_dict()["index_param"]
 
         new_collection.load()
+        self._search_param[collection_name] = {
+            "metric_type": index_params.get("metric_type", self.metric_type.value),
+            "params": self.search_params.get(index_params.get("index_type"), {}),
+        }
+        self.collections[collection_name] = new_collection
 
 
     def _get_collection(self, collection_name):
@@ -145,45 +177,86 @@ class Milvus(VectorStorage):
             self._create_collection(collection_name)
         return self.collections[collection_name]
 
+    @staticmethod
+    def _partition_name(model):
+        # Partition names only allow letters, digits and underscores; the hash keeps sanitized names apart
+        digest = hashlib.md5(str(model).encode("utf-8")).hexdigest()[:8]
+        return f"m_{re.sub(r'[^0-9A-Za-z_]', '_', str(model))[:200]}_{digest}"
+
+    def _target(self, model, create=True):
+        """
+        Collection holding the model's vectors, with the partition to restrict
+        operations to (None outside partition_per_model mode).
+        """
+        if not self.partition_per_model:
+            return self._get_collection(self.collection_name + '_' + model), None
+        col = self._get_collection(self.collection_name)
+        partition_name = self._partition_name(model)
+        if partition_name not in self._partitions:
+            if not col.has_partition(partition_name):
+                if not create:
+                    return col, None
+                col.create_partition(partition_name)
+            self._partitions.add(partition_name)
+        return col, partition_name
+
     def mul_add(self, datas: List[VectorData], model=None):
-        collection_name_model = self.collection_name + '_' + model
-        col = self._get_collection(collection_name_model)
-        data_array, id_array = map(list, zip(*((data.data, data.id) for data in datas)))
-        np_data = np.array(data_array).astype("float32")
+        col, partition_name = self._target(model)
+        id_array = [data.id for data in datas]
+        np_data = np.asarray([data.data for data in datas], dtype=np.float32).reshape(len(datas), -1)
         entities = [id_array, np_data]
-        col.insert(entities)
-
+        col.insert(entities, partition_name=partition_name)
 
     def search(self, data: np.ndarray, top_k: int = -1, model=None):
+        return self.search_many(np.asarray(data).reshape(1, -1), top_k=top_k, model=model)[0]
+
+    def search_many(self, datas: np.ndarray, top_k: int = -1, model=None):
         if top_k == -1:
             top_k = self.top_k
-        collection_name_model = self.collection_name + '_' + model
-        col = self._get_collection(collection_name_model)
+        datas = np.asarray(datas, dtype=np.float32).reshape(len(datas), -1)
+        col, partition_name = self._target(model, create=False)
+        if self.partition_per_model and partition_name is None:
+            return [[] for _ in range(len(datas))]  # Nothing stored for this model
+        # One RPC for all rows; pymilvus packs float32 ndarray rows without a Python list round trip
         search_result = col.search(
-            data=data.reshape(1, -1).tolist(),
+            data=datas,
             anns_field="embedding",
-            param=self.search_params,
+            param=self._search_param[col.name],
             limit=top_k,
+            partition_names=[partition_name] if partition_name is not None else None,
         )
-        return list(zip(search_result[0].distances, search_result[0].ids))
-
+        return [list(zip(hits.distances, hits.ids)) for hits in search_result]
 
     def delete(self, ids, model=None):
-        collection_name_model = self.collection_name + '_' + model
-        col = self._get_collection(collection_name_model)
+        col, partition_name = self._target(model, create=False)
+        if self.partition_per_model and partition_name is None:
+            return 0
 
         del_ids = ",".join([f'"{x}"' for x in ids])
-        resp = col.delete(f"id in [{del_ids}]")
+        resp = col.delete(f"id in [{del_ids}]", partition_name=partition_name)
         delete_count = resp.delete_count
         return delete_count
 
     def rebuild_col(self, model):
+        if self.partition_per_model:
+            col = self._get_collection(self.collection_name)
+            partition_name = self._partition_name(model)
+            if not col.has_partition(partition_name):
+                return 'model partition not found, please check!'
+            # A loaded partition cannot be dropped
+            col.partition(partition_name).release()
+            col.drop_partition(partition_name)
+            self._partitions.discard(partition_name)
+            col.create_partition(partition_name)  # Partitions of a loaded collection load on creation
+            self._partitions.add(partition_name)
+            return
         collection_name_model = self.collection_name + '_' + model
 
         # if col exist, drop col
         if not utility.has_collection(collection_name_model, using=self.alias):
             return 'model collection not found, please check!'
         utility.drop_collection(collection_name_model, using=self.alias)
+        self.collections.pop(collection_name_model, None)
         try:
             self._create_collection(collection_name_model)
         except Exception as e:
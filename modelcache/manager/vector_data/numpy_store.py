@@ -0,0 +1,695 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+import numpy as np
+from readerwriterlock import rwlock
+from modelcache.embedding import MetricType
+from modelcache.manager.vector_data.base import VectorStorage, VectorData
+from modelcache.utils.error import ParamError
+from modelcache.manager.vector_data.quantization import (
+    dequantize,
+    fit_dimension_scales,
+    quantize_per_dimension,
+    quantize_per_vector,
+)
+from modelcache.manager.vector_data.wal import WriteAheadLog, OP_ADD, OP_DELETE, OP_DROP
+
+# Rows scored per matrix product; keeps each block's score matrix cache-sized
+BLOCK_ROWS = 16384
+# Deleted rows a matrix may keep before they are compacted away
+COMPACT_MIN_TOMBSTONES = 1024
+QUANTIZATIONS = ("none", "int8")
+QUANTIZATION_SCALES = ("vector", "dimension")
+
+
+def _gather_originals(positions: np.ndarray, disk, pending_matrix, dimension: int) -> np.ndarray:
+    """float32 originals at the given positions, numbered through disk and then pending_matrix."""
+    out = np.empty((len(positions), dimension), dtype=np.float32)
+    disk_rows = 0 if disk is None else len(disk)
+    on_disk = positions < disk_rows
+    if on_disk.any():
+        out[on_disk] = disk[positions[on_disk]]
+    if not on_disk.all():
+        out[~on_disk] = pending_matrix[positions[~on_disk] - disk_rows]
+    return out
+
+
+class _Matrix:
+    """Growable float32 matrix of one model's vectors, with their cache ids and a tombstone bitmap."""
+
+    def __init__(
+            self,
+            dimension: int,
+            capacity: int,
+            vectors: Optional[np.ndarray] = None,
+            ids: List[Any] = None,
+            with_norms: bool = True,
+    ):
+        self.dimension = dimension
+        if vectors is None:
+            vectors = np.empty((capacity, dimension), dtype=np.float32)
+            ids = []
+        self.vectors = vectors  # May be a read-only memmap until the first write
+        self.size = len(ids)
+        self.ids: List[Any] = list(ids)
+        self.alive = np.ones(len(vectors), dtype=bool)
+        # Squared row norms for L2 scoring, worked out block by block when a search first needs them,
+        # so loading never reads a memory-mapped file through; cosine scoring does without them
+        self.with_norms = with_norms
+        self.sq_norms = np.empty(len(vectors), dtype=np.float32) if with_norms else None
+        self.norms_known = np.zeros(len(vectors), dtype=bool) if with_norms else None
+        self.row_of: Dict[Any, int] = {_id: row for row, _id in enumerate(self.ids)}
+
+    @property
+    def live_count(self):
+        return len(self.row_of)
+
+    def products(self, queries: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """Dot products of the queries with rows [start, stop)."""
+        return queries @ self.vectors[start:stop].T
+
+    def block_sq_norms(self, start: int, stop: int) -> np.ndarray:
+        """Squared norms of rows [start, stop). Concurrent searches may both fill a block, with the same values."""
+        known = self.norms_known[start:stop]
+        if not known.all():
+            block = self.vectors[start:stop]
+            self.sq_norms[start:stop] = np.einsum("ij,ij->i", block, block)
+            known[:] = True
+        return self.sq_norms[start:stop]
+
+    @property
+    def tombstones(self):
+        return self.size - self.live_count
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        writable = isinstance(self.vectors, np.ndarray) and not isinstance(self.vectors, np.memmap)
+        if writable and needed <= len(self.vectors):
+            return
+        capacity = max(needed, 2 * len(self.vectors), 1)
+        vectors = np.empty((capacity, self.dimension), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.vectors, self.alive = vectors, alive
+        if self.with_norms:
+            sq_norms = np.empty(capacity, dtype=np.float32)
+            sq_norms[:self.size] = self.sq_norms[:self.size]
+            norms_known = np.zeros(capacity, dtype=bool)
+            norms_known[:self.size] = self.norms_known[:self.size]
+            self.sq_norms, self.norms_known = sq_norms, norms_known
+
+    def add(self, vectors: np.ndarray, ids: List[Any]):
+        if len(set(ids)) != len(ids):
+            # The last vector given for an id wins
+            keep = sorted({_id: i for i, _id in enumerate(ids)}.values())
+            vectors, ids = vectors[keep], [ids[i] for i in keep]
+        self.delete(ids)
+        self._reserve(len(ids))
+        rows = slice(self.size, self.size + len(ids))
+        self.vectors[rows] = vectors
+        if self.with_norms:
+            self.sq_norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+            self.norms_known[rows] = True
+        self.alive[rows] = True
+        for offset, _id in enumerate(ids):
+            self.row_of[_id] = self.size + offset
+        self.ids.extend(ids)
+        self.size += len(ids)
+
+    def delete(self, ids: List[Any]) -> int:
+        count = 0
+        for _id in ids:
+            row = self.row_of.pop(_id, None)
+            if row is not None:
+                self.alive[row] = False
+                count += 1
+        return count
+
+    def compact(self):
+        """Drop tombstoned rows, keeping the live ones in insertion order."""
+        keep = np.flatnonzero(self.alive[:self.size])
+        ids = [self.ids[row] for row in keep]
+        capacity = max(len(keep) * 2, 1)
+        vectors = np.empty((capacity, self.dimension), dtype=np.float32)
+        vectors[:len(keep)] = self.vectors[keep]
+        self.__init__(self.dimension, capacity, vectors, ids, self.with_norms)
+
+
+class _Int8Matrix(_Matrix):
+    """
+    One model's vectors as int8 codes for scoring, with the float32 originals kept for reranking.
+
+    Originals already flushed are read through a memmap of <model>.npy; newer
+    ones stay in memory until the next flush rewrites the file. Each row points
+    at its original through origin, so compaction only moves the codes.
+    """
+
+    def __init__(self, dimension: int, capacity: int, per_dimension: bool):
+        self.dimension = dimension
+        self.per_dimension = per_dimension
+        self.codes = np.empty((capacity, dimension), dtype=np.int8)
+        self.scales = np.ones(capacity, dtype=np.float32)  # Per-row scales, left at one with per_dimension
+        self.dim_scales: Optional[np.ndarray] = None  # Fitted on the first batch with per_dimension
+        self.sq_norms = np.empty(capacity, dtype=np.float32)  # Of the dequantized rows
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.origin = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+        self.ids: List[Any] = []
+        self.row_of: Dict[Any, int] = {}
+        self.disk: Optional[np.ndarray] = None  # Flushed originals
+        self.pending: List[np.ndarray] = []  # Originals added since, in origin order
+        self._pending_rows = 0
+        self._pending_matrix: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_originals(cls, dimension, per_dimension, disk, ids, codes=None, scales=None):
+        """A matrix over flushed originals, quantizing them unless their codes are given."""
+        matrix = cls(dimension, max(len(ids), 1), per_dimension)
+        matrix.disk = disk
+        if codes is None:
+            if per_dimension and len(ids):
+                matrix.dim_scales = fit_dimension_scales(np.asarray(disk[:BLOCK_ROWS], dtype=np.float32))
+            for start in range(0, len(ids), BLOCK_ROWS):
+                matrix._set_codes(start, np.asarray(disk[start:min(start + BLOCK_ROWS, len(ids))], dtype=np.float32))
+        else:
+            matrix.codes[:len(ids)] = codes
+            if per_dimension:
+                matrix.dim_scales = scales if scales.size else None
+            else:
+                matrix.scales[:len(ids)] = scales
+            approx = matrix._dequantized(0, len(ids))
+            matrix.sq_norms[:len(ids)] = np.einsum("ij,ij->i", approx, approx)
+        matrix.alive[:len(ids)] = True
+        matrix.origin[:len(ids)] = np.arange(len(ids))
+        matrix.size = len(ids)
+        matrix.ids = list(ids)
+        matrix.row_of = {_id: row for row, _id in enumerate(matrix.ids)}
+        return matrix
+
+    @property
+    def disk_rows(self):
+        return 0 if self.disk is None else len(self.disk)
+
+    def _dequantized(self, start, stop):
+        if self.per_dimension:
+            return dequantize(self.codes[start:stop], self.dim_scales, per_dimension=True)
+        return dequantize(self.codes[start:stop], self.scales[start:stop])
+
+    def _set_codes(self, start, vectors):
+        stop = start + len(vectors)
+        if self.per_dimension:
+            if self.dim_scales is None:
+                self.dim_scales = fit_dimension_scales(vectors)
+            self.codes[start:stop] = quantize_per_dimension(vectors, self.dim_scales)
+        else:
+            self.codes[start:stop], self.scales[start:stop] = quantize_per_vector(vectors)
+        approx = self._dequantized(start, stop)
+        self.sq_norms[start:stop] = np.einsum("ij,ij->i", approx, approx)
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        if needed <= len(self.codes):
+            return
+        capacity = max(needed, 2 * len(self.codes), 1)
+        for name in ("codes", "scales", "sq_norms", "alive", "origin"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, vectors: np.ndarray, ids: List[Any]):
+        if len(set(ids)) != len(ids):
+            # The last vector given for an id wins
+            keep = sorted({_id: i for i, _id in enumerate(ids)}.values())
+            vectors, ids = vectors[keep], [ids[i] for i in keep]
+        self.delete(ids)
+        self._reserve(len(ids))
+        rows = slice(self.size, self.size + len(ids))
+        self._set_codes(self.size, vectors)
+        self.alive[rows] = True
+        self.origin[rows] = np.arange(len(ids)) + self.disk_rows + self._pending_rows
+        self.pending.append(np.array(vectors, dtype=np.float32))
+        self._pending_rows += len(ids)
+        self._pending_matrix = None
+        for offset, _id in enumerate(ids):
+            self.row_of[_id] = self.size + offset
+        self.ids.extend(ids)
+        self.size += len(ids)
+
+    def block_sq_norms(self, start: int, stop: int) -> np.ndarray:
+        return self.sq_norms[start:stop]
+
+    def products(self, queries: np.ndarray, start: int, stop: int) -> np.ndarray:
+        codes = self.codes[start:stop].T.astype(np.float32)
+        if self.per_dimension:
+            # q . (c * s) == (q * s) . c
+            return (queries * self.dim_scales) @ codes
+        return (queries @ codes) * self.scales[start:stop]
+
+    def originals(self, rows: np.ndarray) -> np.ndarray:
+        """float32 originals of the given rows."""
+        positions = self.origin[rows]
+        if self._pending_matrix is None and (positions >= self.disk_rows).any():
+            self._pending_matrix = np.concatenate(self.pending)
+        return _gather_originals(positions, self.disk, self._pending_matrix, self.dimension)
+
+    def compact(self):
+        """Drop tombstoned rows; their originals stay behind until the next flush."""
+        keep = np.flatnonzero(self.alive[:self.size])
+        for name in ("codes", "scales", "sq_norms", "origin"):
+            array = getattr(self, name)
+            array[:len(keep)] = array[keep]
+        self.alive[:len(keep)] = True
+        self.alive[len(keep):] = False
+        self.ids = [self.ids[row] for row in keep]
+        self.row_of = {_id: row for row, _id in enumerate(self.ids)}
+        self.size = len(keep)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        What a flush writes: the live rows in order, with their codes, scales, ids and the positions
+        of their originals. Copies what later writes change in place. Needs the read lock.
+        """
+        keep = np.flatnonzero(self.alive[:self.size])
+        if self.per_dimension:
+            scales = np.empty((1, 0), dtype=np.float32) if self.dim_scales is None else self.dim_scales[None, :].copy()
+        else:
+            scales = self.scales[keep]
+        return {
+            "ids": [self.ids[row] for row in keep],
+            "codes": self.codes[keep],
+            "scales": scales,
+            "origin": self.origin[keep],
+            "disk": self.disk,
+            # Originals added later only ever append, so the arrays are shared rather than copied
+            "pending": list(self.pending),
+            "positions": self.disk_rows + self._pending_rows,
+        }
+
+    def attach(self, disk: np.ndarray, snapshot: Dict[str, Any]):
+        """
+        Switch to originals just flushed from snapshot: disk holds, in row order, the originals that were
+        at snapshot["origin"]. Originals added since the snapshot stay pending, numbered after them.
+        """
+        flushed_origin, flushed_positions = snapshot["origin"], snapshot["positions"]
+        remap = np.zeros(max(flushed_positions, 1), dtype=np.int64)
+        remap[flushed_origin] = np.arange(len(flushed_origin))
+        # Rows alive now with an origin in the snapshot's range were alive, and so flushed, then
+        origin = self.origin[:self.size]
+        flushed = origin < flushed_positions
+        origin[flushed] = remap[origin[flushed]]
+        origin[~flushed] += len(flushed_origin) - flushed_positions
+        self.disk = disk
+        self.pending = self.pending[len(snapshot["pending"]):]
+        self._pending_rows = sum(len(vectors) for vectors in self.pending)
+        self._pending_matrix = None
+
+
+class NumpyStore(VectorStorage):
+    """
+    In-process exact search over one float32 matrix per model.
+
+    Queries are scored against blocks of BLOCK_ROWS rows with one matrix
+    product per block, keeping a running top-k with argpartition. Deleted
+    rows are tombstoned and compacted away once they pile up. Each model is
+    persisted as <index_dir>/<model>.npy plus a JSON list of its cache ids,
+    and can be loaded as a read-only memmap that is copied on first write.
+    An optional write-ahead log holds the changes since the last snapshot.
+
+    With quantization="int8" only int8 codes (plus one scale per vector, or
+    per dimension) stay in memory: queries score rerank_factor * top_k
+    candidates on the codes and rerank them against the float32 originals,
+    which are memory-mapped from <model>.npy once flushed.
+    """
+
+    def __init__(
+            self,
+            index_dir: str,
+            dimension: int,
+            top_k: int,
+            metric_type: MetricType = MetricType.L2,
+            initial_capacity: int = 1024,
+            mmap: bool = False,
+            wal: bool = False,
+            wal_fsync: bool = True,
+            checkpoint_interval: float = 300.0,
+            quantization: str = "none",
+            quantization_scale: str = "vector",
+            rerank_factor: int = 4,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ParamError(f"Unsupported quantization: {quantization}, expected one of {QUANTIZATIONS}.")
+        if quantization_scale not in QUANTIZATION_SCALES:
+            raise ParamError(
+                f"Unsupported quantization scale: {quantization_scale}, expected one of {QUANTIZATION_SCALES}.")
+        self._index_dir = index_dir
+        self._dimension = dimension
+        self._top_k = top_k
+        # Cosine similarity is the dot product of L2-normalized vectors
+        self._cosine = metric_type == MetricType.COSINE
+        self._initial_capacity = initial_capacity
+        self._mmap = mmap
+        self._int8 = quantization == "int8"
+        self._per_dimension = quantization_scale == "dimension"
+        self._rerank_factor = max(1, rerank_factor)
+
+        self._matrices: Dict[str, _Matrix] = {}
+        # Models changed since the last checkpoint started
+        self._dirty = set()
+        self._lock = rwlock.RWLockWrite()
+        self._flush_lock = threading.Lock()
+        os.makedirs(self._index_dir, exist_ok=True)
+
+        # Inserts and deletes since the last snapshot are replayed from the write-ahead log
+        self._wal = None
+        if wal:
+            # Hold the write lock so no checkpoint can empty the log before it is replayed
+            with self._lock.gen_wlock():
+                self._wal = WriteAheadLog(
+                    os.path.join(self._index_dir, "wal.log"),
+                    fsync=wal_fsync,
+                    checkpoint_func=self.flush,
+                    checkpoint_interval=checkpoint_interval,
+                )
+                self._wal.replay(self._apply_wal_record, self._dimension)
+
+    def _path(self, model, suffix):
+        return os.path.join(self._index_dir, quote(str(model), safe="") + suffix)
+
+    def _load(self, model):
+        """Make the model's matrix available in memory, reading it from disk if present. Needs the write lock."""
+        if model in self._matrices:
+            return
+        vectors_path = self._path(model, ".npy")
+        if os.path.isfile(vectors_path):
+            with open(self._path(model, ".ids.json"), "r", encoding="utf-8") as f:
+                ids = json.load(f)
+            if self._int8:
+                self._matrices[model] = self._load_int8(model, np.load(vectors_path, mmap_mode="r"), ids)
+                return
+            vectors = np.load(vectors_path, mmap_mode="r" if self._mmap else None)
+            self._matrices[model] = _Matrix(self._dimension, len(ids), vectors, ids, with_norms=not self._cosine)
+        elif self._int8:
+            self._matrices[model] = _Int8Matrix(self._dimension, self._initial_capacity, self._per_dimension)
+        else:
+            self._matrices[model] = _Matrix(self._dimension, self._initial_capacity, with_norms=not self._cosine)
+
+    def _load_int8(self, model, disk, ids):
+        codes = scales = None
+        codes_path, scales_path = self._path(model, ".codes.npy"), self._path(model, ".scales.npy")
+        if os.path.isfile(codes_path) and os.path.isfile(scales_path):
+            codes, scales = np.load(codes_path), np.load(scales_path)
+            # Per-dimension scales are saved as one (1, dimension) row; codes saved under the other mode are redone
+            if (scales.ndim == 2) != self._per_dimension or len(codes) != len(ids):
+                codes = scales = None
+            elif self._per_dimension:
+                scales = scales[0]
+        matrix = _Int8Matrix.from_originals(self._dimension, self._per_dimension, disk, ids, codes, scales)
+        if codes is None:
+            # Saved right away, so only the first load after switching to int8 quantizes the whole file
+            for path in self._write_codes(model, matrix.snapshot()):
+                os.replace(path + ".tmp", path)
+        return matrix
+
+    def _ensure_loaded(self, model):
+        if model in self._matrices:
+            return
+        with self._lock.gen_wlock():
+            self._load(model)
+
+    def _prepare(self, datas) -> np.ndarray:
+        vectors = np.array(datas, dtype=np.float32).reshape(len(datas), self._dimension)
+        if self._cosine:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        return vectors
+
+    def create(self, model=None):
+        if model in self._matrices or os.path.isfile(self._path(model, ".npy")):
+            return 'already_exists'
+        self._ensure_loaded(model)
+        return 'create_success'
+
+    def _apply_wal_record(self, op, model, ids, vectors):
+        # Logged vectors are already normalized
+        if op == OP_ADD:
+            self._load(model)
+            self._matrices[model].add(vectors, ids)
+            self._dirty.add(model)
+        elif op == OP_DELETE:
+            self._delete(model, ids)
+        elif op == OP_DROP:
+            self._drop(model)
+
+    def _delete(self, model, ids):
+        """Needs the write lock."""
+        self._load(model)
+        matrix = self._matrices[model]
+        count = matrix.delete(ids)
+        if count:
+            self._dirty.add(model)
+        if matrix.tombstones > max(matrix.live_count, COMPACT_MIN_TOMBSTONES):
+            matrix.compact()
+        return count
+
+    def _drop(self, model):
+        """Needs the write lock."""
+        self._matrices.pop(model, None)
+        self._dirty.discard(model)
+        for suffix in (".npy", ".ids.json", ".codes.npy", ".scales.npy"):
+            path = self._path(model, suffix)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def mul_add(self, datas: List[VectorData], model=None):
+        if not datas:
+            return
+        vectors = self._prepare([data.data for data in datas])
+        ids = [int(data.id) if isinstance(data.id, np.integer) else data.id for data in datas]
+        seq = None
+        with self._lock.gen_wlock():
+            if self._wal is not None:
+                seq = self._wal.append_add(model, ids, vectors)
+            self._load(model)
+            self._matrices[model].add(vectors, ids)
+            self._dirty.add(model)
+        if seq is not None:
+            self._wal.wait(seq)
+
+    def search(self, data: np.ndarray, top_k: int = -1, model=None):
+        return self.search_many(np.asarray(data).reshape(1, -1), top_k=top_k, model=model)[0]
+
+    def search_many(self, datas: np.ndarray, top_k: int = -1, model=None):
+        if top_k == -1:
+            top_k = self._top_k
+        queries = self._prepare(datas)
+        if model not in self._matrices and not os.path.isfile(self._path(model, ".npy")):
+            return [[] for _ in range(len(queries))]  # Nothing stored for this model
+        self._ensure_loaded(model)
+        with self._lock.gen_rlock():
+            matrix = self._matrices.get(model)
+            if matrix is None or matrix.live_count == 0:
+                return [[] for _ in range(len(queries))]
+            k = min(top_k, matrix.live_count)
+            if isinstance(matrix, _Int8Matrix):
+                candidates = min(k * self._rerank_factor, matrix.live_count)
+                _, candidate_rows = self._blocked_top_k(matrix, queries, candidates)
+                best_scores, best_rows = self._rerank(matrix, queries, candidate_rows, k)
+            else:
+                best_scores, best_rows = self._blocked_top_k(matrix, queries, k)
+            return [
+                [(float(score), matrix.ids[row]) for score, row in zip(row_scores, row_rows)]
+                for row_scores, row_rows in zip(best_scores, best_rows)
+            ]
+
+    def _blocked_top_k(self, matrix: _Matrix, queries: np.ndarray, k: int):
+        """
+        Top-k rows per query, scanning the matrix block by block.
+        Scores are similarities (higher first) for cosine and squared L2 distances (lower first) otherwise.
+        """
+        n = len(queries)
+        # Work with "lower is better" keys so one argpartition serves both metrics
+        best_keys = np.full((n, 0), np.inf, dtype=np.float32)
+        best_rows = np.empty((n, 0), dtype=np.int64)
+        q_sq_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        for start in range(0, matrix.size, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, matrix.size)
+            products = matrix.products(queries, start, stop)
+            if self._cosine:
+                keys = -products
+            else:
+                keys = q_sq_norms - 2 * products + matrix.block_sq_norms(start, stop)
+            keys[:, ~matrix.alive[start:stop]] = np.inf
+
+            keys = np.concatenate([best_keys, keys], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, stop), (n, stop - start))], axis=1)
+            if keys.shape[1] > k:
+                part = np.argpartition(keys, k - 1, axis=1)[:, :k]
+                keys = np.take_along_axis(keys, part, axis=1)
+                rows = np.take_along_axis(rows, part, axis=1)
+            best_keys, best_rows = keys, rows
+
+        order = np.argsort(best_keys, axis=1, kind="stable")
+        best_keys = np.take_along_axis(best_keys, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        if not self._cosine:
+            np.maximum(best_keys, 0, out=best_keys)  # Rounding can push a distance slightly below zero
+        return (-best_keys if self._cosine else best_keys), best_rows
+
+    def _rerank(self, matrix: "_Int8Matrix", queries: np.ndarray, rows: np.ndarray, k: int):
+        """Exact top-k among each query's candidate rows, scored against the float32 originals."""
+        originals = matrix.originals(rows.ravel()).reshape(rows.shape + (self._dimension,))
+        if self._cosine:
+            keys = -np.einsum("nkd,nd->nk", originals, queries)
+        else:
+            diff = originals - queries[:, None, :]
+            keys = np.einsum("nkd,nkd->nk", diff, diff)
+        order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+        keys = np.take_along_axis(keys, order, axis=1)
+        rows = np.take_along_axis(rows, order, axis=1)
+        return (-keys if self._cosine else keys), rows
+
+    def rebuild(self, ids=None):
+        return True
+
+    def delete(self, ids, model=None):
+        ids = [int(_id) if isinstance(_id, np.integer) else _id for _id in ids]
+        seq = None
+        with self._lock.gen_wlock():
+            models = [model] if model is not None else list(self._matrices)
+            count = 0
+            for m in models:
+                if self._wal is not None:
+                    seq = self._wal.append_delete(m, ids)
+                count += self._delete(m, ids)
+        if seq is not None:
+            self._wal.wait(seq)
+        return count
+
+    def rebuild_col(self, model):
+        try:
+            seq = None
+            # Waits for a running checkpoint, which could otherwise write the dropped model back
+            with self._flush_lock, self._lock.gen_wlock():
+                if self._wal is not None:
+                    seq = self._wal.append_drop(model)
+                self._drop(model)
+            if seq is not None:
+                self._wal.wait(seq)
+        except Exception as e:
+            return f"An error occurred during index rebuild: {e}"
+
+    @staticmethod
+    def _write_aside(path, write, mode="wb"):
+        """Write a file next to path and fsync it, so a rename can later swap it in whole."""
+        with open(path + ".tmp", mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_rows(self, path, count: int, rows):
+        """Write count float32 rows aside of path as .npy, fetching them block by block with rows(start, stop)."""
+        if count == 0:
+            self._write_aside(path, lambda f: np.save(f, np.empty((0, self._dimension), dtype=np.float32)))
+            return
+        # Block by block, so the rows never all sit in memory at once
+        out = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=np.float32, shape=(count, self._dimension))
+        for start in range(0, count, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, count)
+            out[start:stop] = rows(start, stop)
+        out.flush()
+        del out
+        with open(path + ".tmp", "rb") as f:
+            os.fsync(f.fileno())
+
+    def _write_codes(self, model, snapshot) -> List[str]:
+        """Write an int8 snapshot's codes and scales aside of their paths, returned for the rename."""
+        paths = []
+        for suffix, array in ((".codes.npy", snapshot["codes"]), (".scales.npy", snapshot["scales"])):
+            paths.append(self._path(model, suffix))
+            self._write_aside(paths[-1], lambda f, array=array: np.save(f, array))
+        return paths
+
+    def _snapshot(self, model):
+        """What a checkpoint writes for the model, unaffected by later writes, or None if it was dropped. Needs the read lock."""
+        matrix = self._matrices.get(model)
+        if matrix is None:
+            return None
+        if isinstance(matrix, _Int8Matrix):
+            return matrix.snapshot()
+        keep = np.flatnonzero(matrix.alive[:matrix.size])
+        # Rows below size are never overwritten (writes append or reallocate), so the array is shared, not copied
+        return {"vectors": matrix.vectors, "keep": keep, "ids": [matrix.ids[row] for row in keep]}
+
+    def _write_snapshot(self, model, snapshot):
+        vectors_path = self._path(model, ".npy")
+        paths = [vectors_path]
+        if "codes" in snapshot:
+            origin, disk = snapshot["origin"], snapshot["disk"]
+            pending_matrix = np.concatenate(snapshot["pending"]) if snapshot["pending"] else None
+            self._write_rows(vectors_path, len(origin), lambda start, stop: _gather_originals(
+                origin[start:stop], disk, pending_matrix, self._dimension))
+            paths.extend(self._write_codes(model, snapshot))
+        else:
+            vectors, keep = snapshot["vectors"], snapshot["keep"]
+            self._write_rows(vectors_path, len(keep), lambda start, stop: vectors[keep[start:stop]])
+        paths.append(self._path(model, ".ids.json"))
+        self._write_aside(paths[-1], lambda f: json.dump(snapshot["ids"], f), mode="w")
+        # Renamed over the old files, so a memmap of the previous ones stays valid
+        for path in paths:
+            os.replace(path + ".tmp", path)
+        if "codes" in snapshot:
+            disk = np.load(vectors_path, mmap_mode="r")
+            with self._lock.gen_wlock():
+                matrix = self._matrices.get(model)
+                if isinstance(matrix, _Int8Matrix):
+                    matrix.attach(disk, snapshot)
+        else:
+            for suffix in (".codes.npy", ".scales.npy"):
+                if os.path.isfile(self._path(model, suffix)):
+                    os.remove(self._path(model, suffix))  # Stale codes of an earlier int8 run
+
+    def flush(self):
+        """
+        Checkpoint the models changed since the last one.
+
+        Writers are held off only while the log is rotated and while each
+        changed model's live rows are listed, one model at a time; searches go
+        on throughout. Vectors are written and fsynced without the lock, after
+        which the sealed log segments they cover are deleted. Int8 matrices
+        then switch their originals to the new file under a brief write lock.
+        """
+        with self._flush_lock:
+            # The read lock keeps writers, and so new log records, out of the rotation
+            with self._lock.gen_rlock():
+                dirty, self._dirty = self._dirty, set()
+                segment = self._wal.rotate() if self._wal is not None else None
+            try:
+                for model in list(dirty):
+                    with self._lock.gen_rlock():
+                        snapshot = self._snapshot(model)
+                    if snapshot is not None:
+                        self._write_snapshot(model, snapshot)
+                    dirty.discard(model)
+            except Exception:
+                # Saved again by the next checkpoint; the sealed segments stay until then
+                with self._lock.gen_wlock():
+                    self._dirty |= dirty
+                raise
+            if segment is not None:
+                self._wal.remove_sealed(segment)
+
+    def close(self):
+        self.flush()
+        if self._wal is not None:
+            self._wal.close()
+
+    def count(self, model=None):
+        if model is not None:
+            self._ensure_loaded(model)
+            return self._matrices[model].live_count
+        return sum(matrix.live_count for matrix in self._matrices.values())
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from typing import Tuple
+
+import numpy as np
+
+# Codes use the symmetric range [-127, 127] so that negating a vector negates its codes
+INT8_MAX = 127
+
+
+def fit_dimension_scales(vectors: np.ndarray) -> np.ndarray:
+    """Per-dimension scales mapping the largest magnitude seen in each dimension to INT8_MAX."""
+    scales = np.abs(vectors).max(axis=0).astype(np.float32) / INT8_MAX
+    # A dimension that is zero in every sample gets the largest scale rather than dividing by zero
+    fallback = scales.max() if scales.max() > 0 else np.float32(1.0 / INT8_MAX)
+    return np.where(scales > 0, scales, fallback).astype(np.float32)
+
+
+def quantize_per_vector(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 codes of each row, with one scale per row: vector ~= code * scale."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / INT8_MAX
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None])
+    return np.clip(codes, -INT8_MAX, INT8_MAX).astype(np.int8), scales.astype(np.float32)
+
+
+def quantize_per_dimension(vectors: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """int8 codes of each row under fixed per-dimension scales: vector ~= code * scales; values out of range clip."""
+    codes = np.rint(np.asarray(vectors, dtype=np.float32) / scales)
+    return np.clip(codes, -INT8_MAX, INT8_MAX).astype(np.int8)
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray, per_dimension: bool = False) -> np.ndarray:
+    """float32 approximation of the codes, given one scale per row or, with per_dimension, one per dimension."""
+    if per_dimension:
+        return codes.astype(np.float32) * scales
+    return codes.astype(np.float32) * scales[:, None]
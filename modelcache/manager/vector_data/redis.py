@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 from typing import List
 import numpy as np
-from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+try:
+    from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+except ImportError:  # Renamed in redis-py 6
+    from redis.commands.search.index_definition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
 from redis.commands.search.field import TagField, VectorField, NumericField
 from redis.client import Redis
 
+from modelcache.embedding import MetricType
 from modelcache.manager.vector_data.base import VectorStorage, VectorData
 from modelcache.utils import import_redis
 from modelcache.utils.log import modelcache_log
@@ -13,8 +17,28 @@ from modelcache.utils.index_util import get_index_name
 from modelcache.utils.index_util import get_index_prefix
 import_redis()
 
+# Commands sent per pipeline round trip by mul_add and delete
+BATCH_SIZE = 1000
+# Element types RediSearch accepts for vector fields, and how they are packed
+VECTOR_TYPES = {"FLOAT32": np.float32, "FLOAT16": np.float16}
+
 
 class RedisVectorStore(VectorStorage):
+    """
+    RediSearch vector store with one HNSW index per model over the hashes under its key prefix.
+
+    Writes go through non-transactional pipelines of batch_size commands and
+    deletes through one multi-key DEL per batch_size keys, so bulk changes
+    cost one round trip per batch.
+    With async_client, asearch queries through redis.asyncio instead of a
+    worker thread.
+
+    The HNSW parameters (m, ef_construction, initial_cap), the metric and the
+    vector type only apply to indexes created by this store; ef_runtime is sent
+    with every query. Cosine results are returned as similarities, L2 results
+    as squared distances.
+    """
+
     def __init__(
         self,
         host: str = "localhost",
@@ -24,18 +48,48 @@ class RedisVectorStore(VectorStorage):
         dimension: int = 0,
         top_k: int = 1,
         namespace: str = "",
+        batch_size: int = BATCH_SIZE,
+        async_client: bool = False,
+        metric_type: MetricType = MetricType.L2,
+        vector_type: str = "FLOAT32",
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_runtime: int = 10,
+        initial_cap: int = 1000,
     ):
         if dimension <= 0:
             raise ValueError(
                 f"invalid `dim` param: {dimension} in the Redis vector store."
             )
+        if batch_size <= 0:
+            raise ValueError(
+                f"invalid `batch_size` param: {batch_size} in the Redis vector store."
+            )
+        if vector_type not in VECTOR_TYPES:
+            raise ValueError(
+                f"invalid `vector_type` param: {vector_type} in the Redis vector store, "
+                f"expected one of {list(VECTOR_TYPES)}."
+            )
         self._client = Redis(
             host=host, port=int(port), username=username, password=password
         )
+        self._aclient = None
+        if async_client:
+            from redis.asyncio import Redis as AsyncRedis
+            self._aclient = AsyncRedis(
+                host=host, port=int(port), username=username, password=password
+            )
         self.top_k = top_k
         self.dimension = dimension
         self.namespace = namespace
-        self.doc_prefix = f"{self.namespace}doc:"
+        self.batch_size = batch_size
+        self.metric_type = metric_type
+        self.vector_type = vector_type
+        self._dtype = VECTOR_TYPES[vector_type]
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_runtime = ef_runtime
+        self.initial_cap = initial_cap
 
     def _check_index_exists(self, index_name: str) -> bool:
         """Check if Redis index exists."""
@@ -61,10 +115,12 @@ class RedisVectorStore(VectorStorage):
             id = NumericField(name=id_field_name)
             embedding = VectorField(embedding_field_name,
                                     "HNSW", {
-                                        "TYPE": "FLOAT32",
+                                        "TYPE": self.vector_type,
                                         "DIM": dimension,
-                                        "DISTANCE_METRIC": "L2",
-                                        "INITIAL_CAP": 1000,
+                                        "DISTANCE_METRIC": self.metric_type.value,
+                                        "INITIAL_CAP": self.initial_cap,
+                                        "M": self.m,
+                                        "EF_CONSTRUCTION": self.ef_construction,
                                     }
                                     )
             fields = [id, embedding]
@@ -77,35 +133,59 @@ class RedisVectorStore(VectorStorage):
             return 'create_success'
 
     def mul_add(self, datas: List[VectorData], model=None):
-        # pipe = self._client.pipeline()
-        for data in datas:
-            id: int = data.id
-            embedding = data.data.astype(np.float32).tobytes()
-            id_field_name = "data_id"
-            embedding_field_name = "data_vector"
-            obj = {id_field_name: id, embedding_field_name: embedding}
-            index_prefix = get_index_prefix(model)
-            self._client.hset(f"{index_prefix}{id}", mapping=obj)
+        index_prefix = get_index_prefix(model)
+        id_field_name = "data_id"
+        embedding_field_name = "data_vector"
+        for start in range(0, len(datas), self.batch_size):
+            # No MULTI/EXEC: the batch only needs one round trip, not atomicity
+            pipe = self._client.pipeline(transaction=False)
+            for data in datas[start:start + self.batch_size]:
+                embedding = np.asarray(data.data, dtype=self._dtype).tobytes()
+                obj = {id_field_name: data.id, embedding_field_name: embedding}
+                pipe.hset(f"{index_prefix}{data.id}", mapping=obj)
+            pipe.execute()
 
-    def search(self, data: np.ndarray, top_k: int = -1, model=None):
-        index_name = get_index_name(model)
+    def _knn_query(self, data: np.ndarray, top_k: int):
+        if top_k == -1:
+            top_k = self.top_k
         id_field_name = "data_id"
         embedding_field_name = "data_vector"
-        base_query = f'*=>[KNN 2 @{embedding_field_name} $vector AS distance]'
+        base_query = f'*=>[KNN $k @{embedding_field_name} $vector EF_RUNTIME $ef_runtime AS distance]'
         query = (
             Query(base_query)
             .sort_by("distance")
             .return_fields(id_field_name, "distance")
+            .paging(0, top_k)  # FT.SEARCH returns at most 10 documents otherwise
             .dialect(2)
         )
+        query_params = {
+            "vector": np.asarray(data, dtype=self._dtype).tobytes(),
+            "k": top_k,
+            "ef_runtime": self.ef_runtime,
+        }
+        return query, query_params
+
+    def _to_results(self, docs):
+        if self.metric_type == MetricType.COSINE:
+            # RediSearch reports the cosine distance, 1 - similarity
+            return [(1.0 - float(doc.distance), int(doc.data_id)) for doc in docs]
+        return [(float(doc.distance), int(doc.data_id)) for doc in docs]
 
-        query_params = {"vector": data.astype(np.float32).tobytes()}
+    def search(self, data: np.ndarray, top_k: int = -1, model=None):
+        query, query_params = self._knn_query(data, top_k)
         results = (
-            self._client.ft(index_name)
+            self._client.ft(get_index_name(model))
             .search(query, query_params=query_params)
             .docs
         )
-        return [(float(result.distance), int(getattr(result, id_field_name))) for result in results]
+        return self._to_results(results)
+
+    async def asearch(self, data: np.ndarray, top_k: int = -1, model=None):
+        if self._aclient is None:
+            return await super().asearch(data, top_k=top_k, model=model)
+        query, query_params = self._knn_query(data, top_k)
+        results = await self._aclient.ft(get_index_name(model)).search(query, query_params=query_params)
+        return self._to_results(results.docs)
 
     def rebuild(self, ids=None) -> bool:
         pass
@@ -124,11 +204,26 @@ class RedisVectorStore(VectorStorage):
             raise ValueError(str(e))
         # return 'rebuild success'
 
-    def delete(self, ids) -> None:
-        pipe = self._client.pipeline()
-        for data_id in ids:
-            pipe.delete(f"{self.doc_prefix}{data_id}")
-        pipe.execute()
+    def _models(self):
+        """Models that have an index, for deletes that do not name one."""
+        index_names = self._client.execute_command("FT._LIST")
+        prefix = get_index_name("")
+        models = []
+        for index_name in index_names:
+            if isinstance(index_name, bytes):
+                index_name = index_name.decode("utf-8")
+            if index_name.startswith(prefix):
+                models.append(index_name[len(prefix):])
+        return models
+
+    def delete(self, ids, model=None) -> int:
+        prefixes = [get_index_prefix(m) for m in ([model] if model is not None else self._models())]
+        keys = [f"{prefix}{data_id}" for prefix in prefixes for data_id in ids]
+        count = 0
+        for start in range(0, len(keys), self.batch_size):
+            # One multi-key DEL per batch; it returns how many of the keys existed
+            count += self._client.delete(*keys[start:start + self.batch_size])
+        return count
 
     def create(self, model=None):
         index_name = get_index_name(model)
@@ -137,3 +232,10 @@ class RedisVectorStore(VectorStorage):
 
     def get_index_by_name(self, index_name):
         pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._client.close()
+        self._aclient = None  # Its connections belong to the event loop that used them
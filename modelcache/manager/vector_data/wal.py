@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from modelcache.utils.log import modelcache_log
+
+OP_ADD = 1
+OP_DELETE = 2
+OP_DROP = 3
+
+# Frame: payload length, payload crc32; payload: op, meta length, JSON meta, raw float32 vectors
+_FRAME = struct.Struct("<II")
+_HEADER = struct.Struct("<BI")
+
+
+class WriteAheadLog:
+    """
+    Append-only log of vector store mutations, replayed on top of the last snapshot.
+
+    Records are (op, model, ids, vectors) frames protected by a crc32, so a
+    torn tail left by a crash is detected and cut off on replay. Appends only
+    write to the file buffer; a background thread fsyncs whatever accumulated
+    since its last sync (group commit) and wait() blocks until a record is
+    durable.
+
+    A second thread calls checkpoint_func once the active segment grows past
+    checkpoint_bytes or checkpoint_interval seconds have passed since the last
+    checkpoint. A checkpoint calls rotate() while it keeps writers out, which
+    seals the active segment as <path>.<n> and starts an empty one; it then
+    writes its snapshots without blocking writers and calls remove_sealed(n)
+    once they are durable. Sealed segments left by a failed checkpoint stay
+    and are replayed before the active one, in order.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            fsync: bool = True,
+            checkpoint_func: Optional[Callable[[], None]] = None,
+            checkpoint_interval: float = 300.0,
+            checkpoint_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.path = path
+        self.fsync = fsync
+        self.checkpoint_func = checkpoint_func
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_bytes = checkpoint_bytes
+
+        self._file = open(path, "ab")
+        sealed = self._sealed_segments()
+        self._next_segment = sealed[-1][0] + 1 if sealed else 1
+        self._lock = threading.Lock()
+        # Held around fsyncs of the active segment, so rotate() never closes it mid-sync
+        self._fsync_lock = threading.Lock()
+        self._synced_cond = threading.Condition(self._lock)
+        self._appended = 0  # Sequence number of the last appended record
+        self._synced = 0  # Sequence number of the last durable record
+        self._sync_error: Optional[Exception] = None
+        self._closed = False
+        self._last_checkpoint = time.monotonic()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+        self._sync_thread = threading.Thread(target=self._sync_loop, name="vector-wal-sync", daemon=True)
+        self._sync_thread.start()
+        self._checkpoint_thread = None
+        if checkpoint_func is not None:
+            self._checkpoint_thread = threading.Thread(
+                target=self._checkpoint_loop, name="vector-wal-checkpoint", daemon=True)
+            self._checkpoint_thread.start()
+
+    # ----------- writing -----------
+
+    @staticmethod
+    def _encode(op: int, model, ids: List[Any], vectors: Optional[np.ndarray]) -> bytes:
+        meta = json.dumps({
+            "model": model,
+            "ids": [int(_id) if isinstance(_id, np.integer) else _id for _id in ids],
+        }).encode("utf-8")
+        payload = _HEADER.pack(op, len(meta)) + meta
+        if vectors is not None:
+            payload += np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+        return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def append(self, op: int, model, ids: List[Any], vectors: Optional[np.ndarray] = None) -> int:
+        """Buffer one record and return its sequence number for wait()."""
+        frame = self._encode(op, model, ids, vectors)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("write-ahead log is closed")
+            self._file.write(frame)
+            self._appended += 1
+            seq = self._appended
+        self._wakeup.set()
+        return seq
+
+    def append_add(self, model, ids: List[Any], vectors: np.ndarray) -> int:
+        return self.append(OP_ADD, model, ids, vectors)
+
+    def append_delete(self, model, ids: List[Any]) -> int:
+        return self.append(OP_DELETE, model, ids)
+
+    def append_drop(self, model) -> int:
+        return self.append(OP_DROP, model, [])
+
+    def wait(self, seq: int):
+        """Block until the record with this sequence number is on disk."""
+        with self._synced_cond:
+            while self._synced < seq:
+                if self._sync_error is not None:
+                    raise self._sync_error
+                self._synced_cond.wait()
+
+    def _sync_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            error = None
+            with self._lock:
+                target = self._appended
+                segment = self._file
+                if target > self._synced:
+                    try:
+                        segment.flush()
+                    except Exception as e:  # pylint: disable=W0703
+                        error = e
+                closed = self._closed
+            if target > self._synced and error is None and self._sync_error is None:
+                # fsync outside the lock so appends keep buffering into the next group
+                try:
+                    with self._fsync_lock:
+                        # A segment sealed meanwhile was fsynced by rotate()
+                        if self.fsync and not segment.closed:
+                            os.fsync(segment.fileno())
+                except Exception as e:  # pylint: disable=W0703
+                    error = e
+            with self._synced_cond:
+                if error is not None:
+                    # The batch is not durable: its waiters raise instead of returning
+                    self._sync_error = error
+                elif self._sync_error is None:
+                    self._synced = max(self._synced, target)
+                self._synced_cond.notify_all()
+            if closed:
+                return
+
+    # ----------- replay and checkpoint -----------
+
+    def _sealed_segments(self) -> List[Tuple[int, str]]:
+        """(number, path) of the sealed segments, oldest first."""
+        directory, name = os.path.split(self.path)
+        segments = []
+        for entry in os.listdir(directory or "."):
+            suffix = entry[len(name) + 1:]
+            if entry.startswith(name + ".") and suffix.isdigit():
+                segments.append((int(suffix), os.path.join(directory, entry)))
+        return sorted(segments)
+
+    def replay(self, apply_func: Callable[[int, Any, List[Any], Optional[np.ndarray]], None], dimension: int) -> int:
+        """
+        Apply every intact record to apply_func(op, model, ids, vectors), sealed segments first;
+        cut off a torn tail of the active segment.
+        """
+        count = 0
+        for _, path in self._sealed_segments():
+            with open(path, "rb") as f:
+                data = f.read()
+            applied, good_offset = self._replay_data(data, apply_func, dimension)
+            count += applied
+            if good_offset < len(data):
+                # Sealed segments were fsynced before they were renamed, so this is damage, not a crash
+                modelcache_log.error(f"write-ahead log {path}: skipping {len(data) - good_offset} corrupt bytes.")
+        with open(self.path, "rb") as f:
+            data = f.read()
+        applied, good_offset = self._replay_data(data, apply_func, dimension)
+        count += applied
+        if good_offset < len(data):
+            modelcache_log.warning(f"write-ahead log {self.path}: dropping {len(data) - good_offset} torn bytes.")
+            with self._lock:
+                self._file.truncate(good_offset)
+        return count
+
+    @staticmethod
+    def _replay_data(data: bytes, apply_func, dimension: int) -> Tuple[int, int]:
+        """Apply the intact records at the start of data; return their count and the offset they end at."""
+        count = 0
+        good_offset = 0
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            length, crc = _FRAME.unpack_from(data, offset)
+            payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            op, meta_length = _HEADER.unpack_from(payload)
+            meta = json.loads(payload[_HEADER.size:_HEADER.size + meta_length])
+            vectors = None
+            if op == OP_ADD:
+                vectors = np.frombuffer(payload, dtype=np.float32, offset=_HEADER.size + meta_length)
+                vectors = vectors.reshape(len(meta["ids"]), dimension)
+            apply_func(op, meta["model"], meta["ids"], vectors)
+            count += 1
+            offset += _FRAME.size + length
+            good_offset = offset
+        return count, good_offset
+
+    def _sync_directory(self):
+        # Makes renames and unlinks of segments durable
+        fd = os.open(os.path.dirname(self.path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def rotate(self) -> int:
+        """
+        Seal the active segment and start an empty one, returning the sealed segment's number.
+        Callers must keep appends out meanwhile, so the snapshot they take next covers every sealed record.
+        """
+        with self._fsync_lock, self._synced_cond:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            # Everything appended so far is durable in the sealed segment; release its waiters,
+            # unless an earlier fsync failed, which may have lost records this one cannot bring back
+            if self._sync_error is None:
+                self._synced = self._appended
+            self._synced_cond.notify_all()
+            self._file.close()
+            segment = self._next_segment
+            self._next_segment += 1
+            os.replace(self.path, f"{self.path}.{segment}")
+            self._file = open(self.path, "ab")
+            if self.fsync:
+                self._sync_directory()
+            self._last_checkpoint = time.monotonic()
+        return segment
+
+    def remove_sealed(self, upto: int):
+        """Delete the sealed segments up to and including number upto, once a snapshot covers them."""
+        for segment, path in self._sealed_segments():
+            if segment <= upto:
+                os.remove(path)
+        if self.fsync:
+            self._sync_directory()
+
+    def truncate(self):
+        """Empty the log, sealed segments included, once a snapshot covers all of it. Callers must keep appends out meanwhile."""
+        with self._lock:
+            self._file.flush()
+            self._file.truncate(0)
+            self._file.seek(0)
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._last_checkpoint = time.monotonic()
+        self.remove_sealed(self._next_segment - 1)
+
+    def size(self) -> int:
+        """Bytes in the active segment."""
+        with self._lock:
+            return self._file.tell()
+
+    def _checkpoint_due(self) -> bool:
+        size = self.size()
+        if size == 0:
+            return False
+        return size >= self.checkpoint_bytes or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+
+    def _checkpoint_loop(self):
+        poll = min(1.0, self.checkpoint_interval)
+        while not self._stop.wait(poll):
+            if self._checkpoint_due():
+                try:
+                    self.checkpoint_func()
+                except Exception as e:  # pylint: disable=W0703
+                    modelcache_log.error(f"write-ahead log checkpoint failed: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        self._wakeup.set()
+        self._sync_thread.join()
+        if self._checkpoint_thread is not None:
+            self._checkpoint_thread.join()
+        self._file.close()
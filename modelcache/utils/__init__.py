@@ -29,6 +29,18 @@ def import_pymysql():
     _check_library("pymysql")
 
 
+def import_aiomysql():
+    _check_library("aiomysql")
+
+
+def import_lmdb():
+    _check_library("lmdb")
+
+
+def import_zstandard():
+    _check_library("zstandard")
+
+
 def import_sql_client(db_name):
     if db_name in ["mysql"]:
         import_pymysql()
@@ -46,6 +58,10 @@ def import_faiss():
     _check_library("faiss", package="faiss-cpu")
 
 
+def import_hnswlib():
+    _check_library("hnswlib")
+
+
 def import_torch():
     _check_library("torch")
 
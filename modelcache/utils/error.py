@@ -28,3 +28,10 @@ class PipInstallError(CacheError):
     """Raise when failed to install package."""
     def __init__(self, package):
         super().__init__(f"Ran into error installing {package}.")
+
+
+class HitCountUpdateError(CacheError):
+    """Raise when only part of a batched hit count update was applied; failed holds the {id: count} left to retry."""
+    def __init__(self, failed):
+        super().__init__(f"{len(failed)} hit count updates failed")
+        self.failed = failed
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls sharing a key into one in-flight coroutine.
+
+    The first caller for a key starts the work; callers arriving while it runs
+    await the same result. Once it finishes, the next call for the key starts fresh.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(func(*args, **kwargs))
+            self._flights[key] = flight
+
+            def forget(done):
+                if self._flights.get(key) is done:
+                    del self._flights[key]
+            flight.add_done_callback(forget)
+        # Shield the shared flight so a cancelled caller does not cancel it for everyone else
+        return await asyncio.shield(flight)
+
+    def __len__(self):
+        return len(self._flights)
@@ -17,3 +17,21 @@ def time_cal(func, func_name=None, report_func=None, **kwargs):
 
     return inner
 
+
+
+def async_time_cal(func, func_name=None, report_func=None, **kwargs):
+    """time_cal for coroutine functions, timing until the awaited result."""
+    cache = kwargs.pop("cache_obj")
+    async def inner(*args, **kwargs):
+        time_start = time.time()
+        res = await func(*args, **kwargs)
+        delta_time = time.time() - time_start
+        if cache.log_time_func:
+            cache.log_time_func(
+                func.__name__ if func_name is None else func_name, delta_time
+            )
+        if report_func is not None:
+            report_func(delta_time)
+        return res
+
+    return inner
@@ -13,9 +13,31 @@ CREATE TABLE IF NOT EXISTS `modelcache_llm_answer` (
   `model` varchar(1000) NOT NULL comment 'model',
   `embedding_data` blob NOT NULL comment 'embedding_data',
   `is_deleted` tinyint(1) NOT NULL DEFAULT '0' COMMENT 'delete state(0 Not deleted,-1 deleted)',
-  PRIMARY KEY(`id`)
+  `answer_id` bigint(20) unsigned DEFAULT NULL comment 'modelcache_answer_blob id, set when answer_storage = zstd',
+  PRIMARY KEY(`id`),
+  KEY `idx_answer_id` (`answer_id`)
 ) AUTO_INCREMENT = 1 DEFAULT CHARSET = utf8mb4 COMMENT = 'cache_codegpt_answer';
 
+CREATE TABLE IF NOT EXISTS `modelcache_answer_blob` (
+  `id` bigint(20) unsigned NOT NULL AUTO_INCREMENT comment '主键',
+  `content_hash` char(64) NOT NULL comment 'sha256 of model and answer',
+  `model` varchar(1000) NOT NULL comment 'model',
+  `codec` tinyint(4) NOT NULL comment '0 raw, 1 zstd',
+  `dict_id` bigint(20) unsigned NOT NULL DEFAULT '0' comment 'modelcache_answer_dict id, 0 without dictionary',
+  `data` mediumblob NOT NULL comment 'answer',
+  PRIMARY KEY(`id`),
+  UNIQUE KEY `uk_content_hash` (`content_hash`),
+  KEY `idx_model` (`model`(255))
+) AUTO_INCREMENT = 1 DEFAULT CHARSET = utf8mb4 COMMENT = 'modelcache_answer_blob';
+
+CREATE TABLE IF NOT EXISTS `modelcache_answer_dict` (
+  `id` bigint(20) unsigned NOT NULL AUTO_INCREMENT comment '主键',
+  `model` varchar(1000) NOT NULL comment 'model',
+  `data` mediumblob NOT NULL comment 'zstd dictionary',
+  PRIMARY KEY(`id`),
+  KEY `idx_model` (`model`(255))
+) AUTO_INCREMENT = 1 DEFAULT CHARSET = utf8mb4 COMMENT = 'modelcache_answer_dict';
+
 CREATE TABLE IF NOT EXISTS `modelcache_query_log` (
   `id` bigint(20) unsigned NOT NULL AUTO_INCREMENT comment '主键',
   `gmt_create` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP comment '创建时间',
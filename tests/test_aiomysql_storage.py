@@ -0,0 +1,162 @@
+import asyncio
+import configparser
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+pytest.importorskip("aiomysql")
+pytest.importorskip("pymysql")
+
+from modelcache.manager.scalar_data import sql_storage_aiomysql  # noqa: E402
+from modelcache.manager.scalar_data.base import CacheStorage  # noqa: E402
+from modelcache.manager.scalar_data.embedding_codec import encode_embedding  # noqa: E402
+from modelcache.manager.scalar_data.sql_storage_aiomysql import AsyncSQLStorage  # noqa: E402
+
+
+class FakeContext:
+    def __init__(self, value):
+        self.value = value
+
+    async def __aenter__(self):
+        return self.value
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def make_config(**options):
+    config = configparser.ConfigParser()
+    config.read_dict({"mysql": {"host": "localhost", "port": "3306", "username": "u", "password": "p",
+                                "database": "db", **options}})
+    return config
+
+
+@pytest.fixture()
+def cursor():
+    cursor = MagicMock()
+    cursor.execute = AsyncMock()
+    cursor.executemany = AsyncMock()
+    cursor.fetchone = AsyncMock()
+    cursor.fetchall = AsyncMock()
+    cursor.rowcount = 0
+    return cursor
+
+
+@pytest.fixture()
+def create_pool(cursor):
+    conn = MagicMock()
+    conn.cursor.side_effect = lambda: FakeContext(cursor)
+    pool = MagicMock()
+    pool.acquire.side_effect = lambda: FakeContext(conn)
+    pool.wait_closed = AsyncMock()
+    with patch.object(sql_storage_aiomysql.aiomysql, "create_pool", AsyncMock(return_value=pool)) as create_pool:
+        yield create_pool
+
+
+def test_pool_is_sized_from_config_and_created_once(create_pool, cursor):
+    store = AsyncSQLStorage(config=make_config(async_pool_minsize="2", async_pool_maxsize="20"))
+    cursor.fetchone.return_value = None
+
+    async def run():
+        await asyncio.gather(*(store.aget_data_by_id(i) for i in range(5)))
+
+    asyncio.run(run())
+    create_pool.assert_awaited_once()
+    kwargs = create_pool.call_args.kwargs
+    assert (kwargs["minsize"], kwargs["maxsize"], kwargs["autocommit"]) == (2, 20, True)
+
+
+def test_invalid_pool_size_is_rejected():
+    with pytest.raises(ValueError):
+        AsyncSQLStorage(config=make_config(), pool_minsize=5, pool_maxsize=2)
+
+
+def test_batch_insert_is_one_executemany(create_pool, cursor):
+    store = AsyncSQLStorage(config=make_config())
+    rows = [("A", "a", np.ones(4, dtype=np.float32), "m"), ("B", "b", np.zeros(4, dtype=np.float32), "m")]
+    ids = asyncio.run(store.abatch_insert(rows))
+    cursor.executemany.assert_awaited_once()
+    sql, values = cursor.executemany.call_args.args
+    assert "INSERT INTO modelcache_llm_answer" in sql
+    assert [v[0] for v in values] == ids
+    assert [v[1:3] for v in values] == [("a", "A"), ("b", "B")]
+
+
+def test_getters_decode_rows(create_pool, cursor):
+    store = AsyncSQLStorage(config=make_config())
+    blob = encode_embedding(np.arange(4, dtype=np.float32))
+    cursor.fetchone.return_value = ("A", "a", blob, "m", None, None, None)
+    cursor.fetchall.return_value = [("x", "A", "a", None, "m", None, None, None)]
+
+    async def run():
+        return await store.aget_data_by_id("x", with_embedding=True), await store.aget_data_by_ids(["x", "y"])
+
+    single, many = asyncio.run(run())
+    np.testing.assert_array_equal(single[2], np.arange(4))
+    assert many == {"x": ("A", "a", None, "m")}
+    sql, args = cursor.execute.call_args.args
+    assert "IN (%s,%s)" in sql and "NULL" in sql and args == ["x", "y"]
+
+
+def test_mark_deleted_and_query_log(create_pool, cursor):
+    store = AsyncSQLStorage(config=make_config())
+    cursor.rowcount = 2
+
+    async def run():
+        await store.ainsert_query_resp({"errorCode": 0, "cacheHit": True}, model="m", query="q", delta_time=0.1)
+        return await store.amark_deleted(["x", "y"]), await store.amark_deleted([])
+
+    assert asyncio.run(run()) == (2, 0)
+    log_sql, log_args = cursor.execute.call_args_list[0].args
+    assert "modelcache_query_log" in log_sql and log_args[3] == "m"
+    assert "is_deleted=1" in cursor.execute.call_args_list[1].args[0]
+    assert cursor.execute.await_count == 2
+
+
+def test_close_releases_the_pool(create_pool, cursor):
+    store = AsyncSQLStorage(config=make_config())
+    asyncio.run(store.aget_data_by_id("x"))
+    pool = create_pool.return_value
+    store.close()
+    pool.terminate.assert_called_once()
+
+
+def test_factory_selects_the_async_store():
+    with patch.object(sql_storage_aiomysql.aiomysql, "create_pool"):
+        assert isinstance(CacheStorage.get("mysql", config=make_config(async_client="true")), AsyncSQLStorage)
+        assert not isinstance(CacheStorage.get("mysql", config=make_config()), AsyncSQLStorage)
+
+
+def test_zstd_answers_are_read_from_the_blob_table(create_pool, cursor):
+    pytest.importorskip("zstandard")
+    store = AsyncSQLStorage(config=make_config(answer_storage="zstd"))
+    cursor.fetchone.return_value = ("", "a", None, "m", 0, 0, b"A")
+    assert asyncio.run(store.aget_data_by_id("x")) == ("A", "a", None, "m")
+    sql = cursor.execute.call_args.args[0]
+    assert "LEFT JOIN modelcache_answer_blob" in sql
+
+
+def test_plain_mode_reads_answers_stored_compressed(create_pool, cursor):
+    zstandard = pytest.importorskip("zstandard")
+    samples = [f"answer {i}: open Settings, then Security, then Reset password".encode() * 4 for i in range(64)]
+    zstd_dict = zstandard.train_dictionary(1024, samples)
+    data = zstandard.ZstdCompressor(dict_data=zstd_dict).compress(samples[0])
+    store = AsyncSQLStorage(config=make_config())
+    # The dictionary is fetched through the async pool, never by the blocking pymysql one
+    cursor.fetchone.side_effect = [("", "a", None, "m", 1, 7, data), (zstd_dict.as_bytes(),)]
+    store.load_answer_dict = MagicMock(side_effect=AssertionError("blocking dictionary load"))
+
+    answer, question, _, _ = asyncio.run(store.aget_data_by_id("x"))
+    assert str(answer) == samples[0].decode() and question == "a"
+    row_sql, dict_sql = [call.args[0] for call in cursor.execute.call_args_list]
+    assert "LEFT JOIN modelcache_answer_blob" in row_sql
+    assert "modelcache_answer_dict" in dict_sql and cursor.execute.call_args.args[1] == (7,)
+
+
+def test_deduplicated_blobs_are_locked_until_the_insert_commits():
+    store = AsyncSQLStorage(config=make_config(answer_storage="zstd"))
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [("h", 3)]
+    assert store._blob_ids(cursor, ["h"]) == {"h": 3}
+    assert cursor.execute.call_args.args[0].rstrip().endswith("LOCK IN SHARE MODE")
@@ -0,0 +1,148 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+pytest.importorskip("zstandard")
+
+from modelcache.manager.scalar_data.answer_codec import (  # noqa: E402
+    CODEC_RAW,
+    CODEC_ZSTD,
+    AnswerCodec,
+    LazyAnswer,
+    check_answer_storage,
+    resolve_answer,
+)
+from modelcache.manager.scalar_data.base import CacheStorage  # noqa: E402
+from modelcache.manager.scalar_data.sql_storage_sqlite import SQLStorage  # noqa: E402
+from modelcache.utils.error import ParamError  # noqa: E402
+
+
+class DictStore:
+    def __init__(self):
+        self.dicts = {}
+
+    def load_answer_dict(self, dict_id):
+        return self.dicts[dict_id][1]
+
+    def latest_answer_dict(self, model):
+        found = [(dict_id, data) for dict_id, (m, data) in self.dicts.items() if m == model]
+        return found[-1] if found else None
+
+    def save_answer_dict(self, model, data):
+        dict_id = len(self.dicts) + 1
+        self.dicts[dict_id] = (model, data)
+        return dict_id
+
+
+def answer(i):
+    return (f"To reset the password of account {i}, open Settings, choose Security, "
+            f"click 'Reset password' and follow the link sent to user{i}@example.com. ") * 2
+
+
+@pytest.fixture()
+def store(tmp_path):
+    store = SQLStorage(url=str(tmp_path / "cache.db"), answer_storage="zstd")
+    store.create()
+    yield store
+    store.close()
+
+
+def rows(answers, model="m"):
+    return [(a, f"question{i}", np.ones(4, dtype=np.float32), model) for i, a in enumerate(answers)]
+
+
+def test_codec_round_trip_and_dictionary_training():
+    dicts = DictStore()
+    codec = AnswerCodec(dicts, train_samples=64, dict_size=4096)
+    first = codec.compress("m", answer(0))
+    assert first[:2] == (CODEC_ZSTD, 0)
+    for i in range(1, 64):
+        codec.compress("m", answer(i))
+    assert list(dicts.dicts) == [1]
+    trained = codec.compress("m", answer(100))
+    assert trained[:2] == (CODEC_ZSTD, 1)
+    assert len(trained[2]) < len(first[2])
+    # A new codec on the same store picks the dictionary up again
+    assert AnswerCodec(dicts).decompress(trained[1], trained[2]) == answer(100)
+    assert codec.compress("m", "ok") == (CODEC_RAW, 0, b"ok")
+
+
+def test_lazy_answer_decompresses_on_use():
+    codec = AnswerCodec(DictStore())
+    lazy = codec.decode(*codec.compress("m", answer(1)))
+    assert isinstance(lazy, LazyAnswer)
+    assert lazy == answer(1) and resolve_answer(lazy) == answer(1)
+    assert resolve_answer("plain") == "plain"
+    with pytest.raises(ParamError):
+        check_answer_storage("gzip")
+
+
+def test_decode_loads_the_dictionary_up_front():
+    dicts = DictStore()
+    codec = AnswerCodec(dicts, train_samples=64, dict_size=4096)
+    for i in range(64):
+        codec.compress("m", answer(i))
+    stored = codec.compress("m", answer(100))
+    lazy = AnswerCodec(dicts).decode(*stored)
+    # Reading the answer later, e.g. on the event loop, never goes back to the store
+    dicts.dicts.clear()
+    assert str(lazy) == answer(100)
+
+
+def test_identical_answers_are_stored_once(store):
+    ids = store.batch_insert(rows([answer(1), answer(2), answer(1)]))
+    ids += store.batch_insert(rows([answer(1)]) + rows([answer(1)], model="other"))
+    conn = store._connection()
+    assert conn.execute("SELECT COUNT(*) FROM modelcache_answer_blob").fetchone()[0] == 3
+    assert conn.execute("SELECT COUNT(DISTINCT answer) FROM modelcache_llm_answer").fetchone()[0] == 1
+    data = store.get_data_by_ids(ids)
+    assert [resolve_answer(data[i][0]) for i in ids] == [answer(1), answer(2), answer(1), answer(1), answer(1)]
+    assert isinstance(store.get_data_by_id(ids[0])[0], LazyAnswer)
+
+
+def test_rows_from_either_mode_read_back(tmp_path):
+    url = str(tmp_path / "cache.db")
+    plain = SQLStorage(url=url)
+    plain.create()
+    plain_id = plain.batch_insert(rows(["plain answer"]))[0]
+    plain.close()
+    zstd = SQLStorage(url=url, answer_storage="zstd")
+    zstd.create()
+    zstd_id = zstd.batch_insert(rows([answer(3)]))[0]
+    zstd.close()
+    plain = CacheStorage.get("sqlite", sql_url=url)
+    assert plain.get_data_by_id(plain_id)[0] == "plain answer"
+    assert resolve_answer(plain.get_data_by_id(zstd_id)[0]) == answer(3)
+    plain.close()
+
+
+def test_legacy_table_gains_the_answer_id_column(tmp_path):
+    url = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(url)
+    conn.execute("""CREATE TABLE modelcache_llm_answer (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        gmt_create TEXT DEFAULT CURRENT_TIMESTAMP, gmt_modified TEXT DEFAULT CURRENT_TIMESTAMP,
+        question TEXT NOT NULL, answer TEXT NOT NULL, answer_type INTEGER NOT NULL,
+        hit_count INTEGER NOT NULL DEFAULT 0, model VARCHAR(1000) NOT NULL, embedding_data BLOB NOT NULL)""")
+    conn.execute("INSERT INTO modelcache_llm_answer (question, answer, answer_type, model, embedding_data) "
+                 "VALUES ('q', 'old answer', 0, 'm', x'00')")
+    conn.commit()
+    conn.close()
+    store = SQLStorage(url=url, answer_storage="zstd")
+    store.create()
+    assert store.get_data_by_id(1)[0] == "old answer"
+    new_id = store.batch_insert(rows([answer(4)]))[0]
+    assert resolve_answer(store.get_data_by_id(new_id)[0]) == answer(4)
+    store.close()
+
+
+def test_deletes_drop_unused_blobs(store):
+    ids = store.batch_insert(rows([answer(1), answer(2), answer(2)]))
+    store.batch_insert(rows([answer(1)], model="other"))
+    store.mark_deleted(ids[:2])
+    assert store.clear_deleted_data() == 2
+    conn = store._connection()
+    assert conn.execute("SELECT COUNT(*) FROM modelcache_answer_blob").fetchone()[0] == 2
+    assert resolve_answer(store.get_data_by_id(ids[2])[0]) == answer(2)
+    assert store.model_deleted("m") == 1
+    assert conn.execute("SELECT model FROM modelcache_answer_blob").fetchall() == [("other",)]
@@ -0,0 +1,140 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+# The adapters import the reranker at module level
+pytest.importorskip("FlagEmbedding")
+
+from modelcache.cache import Cache  # noqa: E402
+from modelcache.embedding import MetricType  # noqa: E402
+from modelcache.manager.data_manager import SSDataManager  # noqa: E402
+from modelcache.manager.vector_data.numpy_store import NumpyStore  # noqa: E402
+from modelcache.processor.post import first  # noqa: E402
+from modelcache.processor.pre import insert_multi_splicing, query_multi_splicing  # noqa: E402
+from modelcache.report import Report  # noqa: E402
+from tests.test_data_manager import FakeCacheStorage  # noqa: E402
+
+DIM = 4
+# Texts the fake embedding knows, each an orthogonal unit vector
+TEXTS = ["user###hi", "user###bye", "user###thanks"]
+
+
+class Embedder:
+    """Async embedding_func counting its calls; unknown texts fail."""
+
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+
+    async def __call__(self, text):
+        self.calls.append(text)
+        await asyncio.sleep(self.delay)
+        if text not in TEXTS:
+            raise ValueError(f"cannot embed {text}")
+        return np.eye(DIM, dtype=np.float32)[TEXTS.index(text)]
+
+
+@pytest.fixture()
+def cache(tmp_path):
+    vector_storage = NumpyStore(str(tmp_path / "numpy"), DIM, top_k=1, metric_type=MetricType.COSINE)
+    data_manager = SSDataManager(FakeCacheStorage(), vector_storage, None, max_size=100, clean_size=1,
+                                 normalize=False, policy="LRU")
+    cache = Cache(
+        embedding_model=None,
+        similarity_metric_type=MetricType.COSINE,
+        data_manager=data_manager,
+        query_pre_embedding_func=query_multi_splicing,
+        insert_pre_embedding_func=insert_multi_splicing,
+        embedding_func=Embedder(),
+        report=Report(),
+        similarity_evaluation=None,
+        post_process_messages_func=first,
+        similarity_threshold=0.9,
+    )
+    eye = np.eye(DIM, dtype=np.float32)
+    data_manager.import_data(["hi", "bye"], ["hello from a", "goodbye from a"], [eye[0], eye[1]], model="a")
+    data_manager.import_data(["hi"], ["hello from b"], [eye[0]], model="b")
+    yield cache
+    data_manager.close()
+
+
+def item(content, model=None):
+    query = {"query": [{"role": "user", "content": content}]}
+    if model is not None:
+        query["scope"] = {"model": model}
+    return query
+
+
+def batch(cache, items, model="a"):
+    return asyncio.run(cache.handle_request({"type": "batch_query", "scope": {"model": model}, "queries": items}))
+
+
+def test_batch_results_follow_item_order_across_models(cache):
+    response = batch(cache, [item("bye"), item("hi", model="b"), item("thanks"), item("hi")])
+    assert response["errorCode"] == 0
+    results = response["results"]
+    assert [r["answer"] for r in results] == ["goodbye from a", "hello from b", "", "hello from a"]
+    assert [r["cacheHit"] for r in results] == [True, True, False, True]
+    # One embedding per item, submitted together
+    assert sorted(cache.embedding_func.calls) == sorted(["user###bye", "user###hi", "user###thanks", "user###hi"])
+
+
+def test_batch_item_errors_stay_with_their_item(cache):
+    response = batch(cache, [
+        item("hi"),
+        "not a dict",
+        {"query": [{"role": "user", "content": "hi"}], "scope": "a"},
+        item("hi", model="DI_COPILOT_LAB"),
+        item("unknown"),
+        item("bye"),
+    ])
+    assert response["errorCode"] == 0
+    codes = [r["errorCode"] for r in response["results"]]
+    assert codes == [0, 104, 104, 105, 201, 0]
+    assert "cannot embed" in response["results"][4]["errorDesc"]
+    assert [response["results"][i]["answer"] for i in (0, 5)] == ["hello from a", "goodbye from a"]
+
+
+def test_empty_batch_is_rejected(cache):
+    assert batch(cache, [])["errorCode"] == 104
+
+
+def query(cache, content, model="a"):
+    return cache.handle_request({"type": "query", "scope": {"model": model},
+                                 "query": [{"role": "user", "content": content}]})
+
+
+def test_identical_concurrent_queries_share_one_lookup(cache):
+    cache.embedding_func.delay = 0.05  # Keeps the first lookup in flight while the others arrive
+
+    async def run():
+        return await asyncio.gather(*(query(cache, "hi") for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert cache.embedding_func.calls == ["user###hi"]
+    assert [r["answer"] for r in results] == ["hello from a"] * 5
+    # Every caller still counts as a hit
+    assert cache.report.hint_cache_count == 5
+
+
+def test_different_models_and_queries_are_not_merged(cache):
+    cache.embedding_func.delay = 0.05
+
+    async def run():
+        return await asyncio.gather(query(cache, "hi"), query(cache, "hi", model="b"), query(cache, "bye"))
+
+    results = asyncio.run(run())
+    assert sorted(cache.embedding_func.calls) == ["user###bye", "user###hi", "user###hi"]
+    assert [r["answer"] for r in results] == ["hello from a", "hello from b", "goodbye from a"]
+
+
+def test_queries_are_not_shared_with_coalescing_off(cache):
+    cache.embedding_func.delay = 0.05
+    cache.query_flights = None
+
+    async def run():
+        return await asyncio.gather(*(query(cache, "hi") for _ in range(3)))
+
+    asyncio.run(run())
+    assert cache.embedding_func.calls == ["user###hi"] * 3
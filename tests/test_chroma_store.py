@@ -0,0 +1,84 @@
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from modelcache.manager.vector_data import chroma as chroma_store  # noqa: E402
+from modelcache.manager.vector_data.base import VectorData  # noqa: E402
+from modelcache.manager.vector_data.chroma import Chromadb  # noqa: E402
+
+DIM = 4
+
+
+def make_collection(name, count=0):
+    collection = MagicMock()
+    collection.name = name
+    collection.count.return_value = count
+    collection.query.side_effect = lambda query_embeddings, n_results, include: {
+        "distances": [[0.1]] * len(query_embeddings),
+        "ids": [["7"]] * len(query_embeddings),
+    }
+    collection.get.side_effect = lambda ids, include: {"ids": [i for i in ids if i == "7"]}
+    return collection
+
+
+@pytest.fixture()
+def collections():
+    return {}
+
+
+@pytest.fixture()
+def client(collections):
+    client = MagicMock()
+    client.get_or_create_collection.side_effect = lambda name: collections.setdefault(name, make_collection(name))
+    client.list_collections.side_effect = lambda: list(collections)
+    client.delete_collection.side_effect = collections.pop
+    with patch.object(chroma_store.chromadb, "PersistentClient", return_value=client):
+        yield client
+
+
+def add(store, ids, model="m"):
+    store.mul_add([VectorData(id=i, data=np.ones(DIM)) for i in ids], model=model)
+
+
+def test_collection_handle_and_count_are_fetched_once(client, collections):
+    store = Chromadb()
+    add(store, [7])
+    store.search(np.ones(DIM), model="m")
+    store.search_many(np.ones((2, DIM)), model="m")
+    assert client.get_or_create_collection.call_count == 1
+    assert collections["modelcache_m"].count.call_count == 1
+
+
+def test_empty_collection_is_not_queried(client, collections):
+    store = Chromadb()
+    assert store.search_many(np.ones((2, DIM)), model="m") == [[], []]
+    collections["modelcache_m"].query.assert_not_called()
+
+    add(store, [7])
+    assert store.search(np.ones(DIM), model="m") == [(0.1, 7)]
+    assert store.delete([7, 8], model="m") == 1
+    assert store.search(np.ones(DIM), model="m") == []
+
+
+def test_batch_query_passes_one_float32_array(client, collections):
+    store = Chromadb(top_k=3)
+    add(store, [7])
+    results = store.search_many(np.ones((3, DIM)), model="m")
+    collection = collections["modelcache_m"]
+    assert collection.query.call_count == 1
+    embeddings = collection.query.call_args.kwargs["query_embeddings"]
+    assert isinstance(embeddings, np.ndarray) and embeddings.dtype == np.float32 and embeddings.shape == (3, DIM)
+    assert results == [[(0.1, 7)]] * 3
+    added = collection.add.call_args.kwargs
+    assert isinstance(added["embeddings"], np.ndarray) and added["ids"] == ["7"]
+
+
+def test_rebuild_col_drops_the_cached_handle(client, collections):
+    store = Chromadb()
+    add(store, [7])
+    store.rebuild_col("m")
+    assert store.search(np.ones(DIM), model="m") == []
+    assert client.get_or_create_collection.call_count == 2
@@ -0,0 +1,325 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from modelcache.manager.data_manager import SSDataManager
+from modelcache.manager.scalar_data.base import CacheStorage
+from modelcache.manager.vector_data.base import VectorStorage
+
+
+class FakeCacheStorage(CacheStorage):
+    """In-memory scalar storage recording every call that reaches the backend."""
+
+    def __init__(self):
+        self.rows = {}
+        self.next_id = 1
+        self.calls = []
+
+    def create(self):
+        pass
+
+    def insert_query_resp(self, query_resp, **kwargs):
+        self.calls.append(("insert_query_resp", query_resp))
+
+    def batch_insert_query_resp(self, rows):
+        self.calls.append(("batch_insert_query_resp", [query_resp for query_resp, _ in rows]))
+
+    def get_data_by_id(self, key, with_embedding=False):
+        self.calls.append(("get_data_by_id", key))
+        return self.rows.get(key)
+
+    def get_data_by_ids(self, keys, with_embedding=False):
+        self.calls.append(("get_data_by_ids", list(keys)))
+        return {k: self.rows[k] for k in keys if k in self.rows}
+
+    def mark_deleted(self, keys):
+        self.calls.append(("mark_deleted", list(keys)))
+        return len([self.rows.pop(k) for k in keys if k in self.rows])
+
+    def model_deleted(self, model):
+        ids = [k for k, row in self.rows.items() if row[3] == model]
+        for k in ids:
+            del self.rows[k]
+        return len(ids)
+
+    def clear_deleted_data(self):
+        pass
+
+    def get_ids(self, deleted=True):
+        return list(self.rows)
+
+    def count(self):
+        return len(self.rows)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def batch_insert(self, all_data):
+        ids = []
+        for answer, question, embedding_data, model in all_data:
+            self.rows[self.next_id] = (answer, question, embedding_data, model)
+            ids.append(self.next_id)
+            self.next_id += 1
+        return ids
+
+    def update_hit_count_by_id(self, primary_id):
+        self.calls.append(("update_hit_count_by_id", primary_id))
+
+    def update_hit_counts(self, counts):
+        self.calls.append(("update_hit_counts", dict(counts)))
+
+
+class FakeVectorStorage(VectorStorage):
+    """Brute-force L2 search over a dict of vectors per model."""
+
+    def __init__(self):
+        self.vectors = {}
+        self.searches = 0
+
+    def mul_add(self, datas, model=None):
+        for data in datas:
+            self.vectors.setdefault(model, {})[data.id] = data.data
+
+    def search(self, data, top_k=1, model=None):
+        self.searches += 1
+        vectors = self.vectors.get(model, {})
+        scored = sorted((float(np.sum((v - data) ** 2)), k) for k, v in vectors.items())
+        return scored[:max(top_k, 1)]
+
+    def rebuild(self, ids=None):
+        return True
+
+    def delete(self, ids, model=None):
+        return len([self.vectors.get(model, {}).pop(i, None) for i in ids])
+
+    def rebuild_col(self, model):
+        self.vectors.pop(model, None)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture()
+def scalar_storage():
+    return FakeCacheStorage()
+
+
+@pytest.fixture()
+def vector_storage():
+    return FakeVectorStorage()
+
+
+def make_manager(scalar_storage, vector_storage, **kwargs):
+    return SSDataManager(scalar_storage, vector_storage, None, max_size=100, clean_size=1,
+                         normalize=False, policy="LRU", **kwargs)
+
+
+def vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+# ----------- exact-match tier -----------
+
+def test_exact_match_disabled_by_default(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage)
+    manager.import_data(["user: hi"], ["hello"], [vec(1, 0)], model="m")
+    assert manager.exact_match("user: hi", model="m") is None
+
+
+def test_rows_the_storage_failed_to_write_are_not_indexed(scalar_storage, vector_storage):
+    batch_insert = scalar_storage.batch_insert
+
+    def lose_second_row(all_data):
+        ids = batch_insert(all_data)
+        ids[1] = None
+        return ids
+
+    scalar_storage.batch_insert = lose_second_row
+    manager = make_manager(scalar_storage, vector_storage, exact_match=True)
+    manager.import_data(["q1", "q2", "q3"], ["a1", "a2", "a3"], [vec(1, 0), vec(0, 1), vec(1, 1)], model="m")
+    # Later rows keep their own ids instead of shifting onto the failed one
+    assert {_id: list(v) for _id, v in vector_storage.vectors["m"].items()} == {1: [1, 0], 3: [1, 1]}
+    assert manager.exact_match("q3", model="m") == 3
+    assert manager.exact_match("q2", model="m") is None
+
+
+def test_exact_match_populated_on_import(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage, exact_match=True)
+    manager.import_data(["user: hi", "user: bye"], ["hello", "goodbye"], [vec(1, 0), vec(0, 1)], model="m")
+    _id = manager.exact_match("user: bye", model="m")
+    assert _id == 2
+    assert manager.get_scalar_data((1.0, _id), model="m")[0] == "goodbye"
+    assert manager.exact_match("user: bye", model="other") is None
+
+
+def test_exact_match_invalidated_by_delete(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage, exact_match=True)
+    manager.import_data(["user: hi"], ["hello"], [vec(1, 0)], model="m")
+    _id = manager.exact_match("user: hi", model="m")
+    assert manager.delete([_id], model="m")["status"] == "success"
+    assert manager.exact_match("user: hi", model="m") is None
+
+
+def test_exact_match_invalidated_by_truncate(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage, exact_match=True)
+    manager.import_data(["user: hi"], ["hello"], [vec(1, 0)], model="m")
+    assert manager.truncate("m")["status"] == "success"
+    assert manager.exact_match("user: hi", model="m") is None
+
+
+# ----------- multi-vector search -----------
+
+def test_search_many_returns_one_result_list_per_query(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage)
+    manager.import_data(["a", "b"], ["A", "B"], [vec(1, 0), vec(0, 1)], model="m")
+    results = manager.search_many([vec(0.9, 0), vec(0, 0.9), vec(1, 0)], model="m", top_k=1)
+    assert [r[0][1] for r in results] == [1, 2, 1]
+
+
+def test_search_many_matches_single_search(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage)
+    manager.import_data(["a", "b", "c"], ["A", "B", "C"], [vec(1, 0), vec(0, 1), vec(1, 1)], model="m")
+    queries = [vec(0.2, 0.8), vec(0.7, 0.6)]
+    batched = manager.search_many(queries, model="m", top_k=2)
+    single = [manager.search(q, model="m", top_k=2) for q in queries]
+    assert [[i for _, i in r] for r in batched] == [[i for _, i in r] for r in single]
+
+
+def test_asearch_matches_search(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage)
+    manager.import_data(["a", "b"], ["A", "B"], [vec(1, 0), vec(0, 1)], model="m")
+    result = asyncio.run(manager.asearch(vec(0.1, 1), model="m"))
+    assert result == manager.search(vec(0.1, 1), model="m")
+
+
+def test_search_many_normalizes_rows(scalar_storage):
+    class Recording(FakeVectorStorage):
+        def search_many(self, datas, top_k, model):
+            self.datas = datas
+            return [[] for _ in datas]
+
+    storage = Recording()
+    manager = SSDataManager(scalar_storage, storage, None, max_size=10, clean_size=1, normalize=True)
+    manager.search_many([vec(3, 4), vec(0, 2)], model="m")
+    np.testing.assert_allclose(np.linalg.norm(storage.datas, axis=1), [1, 1])
+
+
+# ----------- multi-get scalar data -----------
+
+def test_get_scalar_data_many_preserves_order_and_misses(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage)
+    manager.import_data(["a", "b"], ["A", "B"], [vec(1, 0), vec(0, 1)], model="m")
+    manager.eviction_base.clear("m")
+    rets = manager.get_scalar_data_many([(0.1, 2), (0.2, 99), (0.3, 1)], model="m")
+    assert [r[0] if r else None for r in rets] == ["B", None, "A"]
+
+
+def test_get_scalar_data_many_fetches_only_misses_in_one_call(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage)
+    manager.import_data(["a", "b", "c"], ["A", "B", "C"], [vec(1, 0), vec(0, 1), vec(1, 1)], model="m")
+    manager.eviction_base.clear("m")
+    manager.get_scalar_data((0.0, 1), model="m")  # warm the memory cache with id 1
+    scalar_storage.calls.clear()
+
+    rets = manager.get_scalar_data_many([(0.0, 1), (0.0, 2), (0.0, 3), (0.0, 2)], model="m")
+    assert [r[0] for r in rets] == ["A", "B", "C", "B"]
+    assert scalar_storage.calls == [("get_data_by_ids", [2, 3])]
+
+    scalar_storage.calls.clear()
+    manager.get_scalar_data_many([(0.0, 2), (0.0, 3)], model="m")
+    assert scalar_storage.calls == []
+
+
+# ----------- async storage path -----------
+
+class FakeAsyncCacheStorage(FakeCacheStorage):
+    """Scalar storage with native coroutines, which the data manager must await directly."""
+
+    async def abatch_insert(self, all_data):
+        self.calls.append(("abatch_insert", len(all_data)))
+        return self.batch_insert(all_data)
+
+    async def aget_data_by_id(self, key, with_embedding=False):
+        self.calls.append(("aget_data_by_id", key))
+        return self.rows.get(key)
+
+    async def aget_data_by_ids(self, keys, with_embedding=False):
+        self.calls.append(("aget_data_by_ids", list(keys)))
+        return {k: self.rows[k] for k in keys if k in self.rows}
+
+    async def amark_deleted(self, keys):
+        self.calls.append(("amark_deleted", list(keys)))
+        return len([self.rows.pop(k) for k in keys if k in self.rows])
+
+
+def test_async_path_awaits_native_storage_coroutines(vector_storage):
+    scalar_storage = FakeAsyncCacheStorage()
+    manager = make_manager(scalar_storage, vector_storage, exact_match=True)
+
+    async def run():
+        await manager.asave(["a", "b"], ["A", "B"], [vec(1, 0), vec(0, 1)], model="m")
+        manager.eviction_base.clear("m")
+        single = await manager.aget_scalar_data((0.0, 1), model="m")
+        many = await manager.aget_scalar_data_many([(0.0, 1), (0.0, 2), (0.0, 9)], model="m")
+        deleted = await manager.adelete([2], model="m")
+        return single, many, deleted
+
+    single, many, deleted = asyncio.run(run())
+    assert single[0] == "A"
+    assert [r[0] if r else None for r in many] == ["A", "B", None]
+    assert deleted == {'status': 'success', 'milvus': 'delete_count: 1', 'mysql': 'delete_count: 1'}
+    assert scalar_storage.calls == [
+        ("abatch_insert", 2), ("aget_data_by_id", 1), ("aget_data_by_ids", [2, 9]), ("amark_deleted", [2])]
+    assert manager.exact_match("a", model="m") == 1
+    assert manager.exact_match("b", model="m") is None
+    assert [i for _, i in manager.search(vec(0, 1), model="m", top_k=2)] == [1]
+
+
+def test_async_path_falls_back_to_blocking_storage(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage)
+
+    async def run():
+        await manager.asave(["a"], ["A"], [vec(1, 0)], model="m")
+        manager.eviction_base.clear("m")
+        return await manager.aget_scalar_data_many([(0.0, 1)], model="m")
+
+    assert asyncio.run(run())[0][0] == "A"
+    assert scalar_storage.calls == [("get_data_by_ids", [1])]
+
+
+# ----------- batched hit counts -----------
+
+def test_hit_counts_are_batched_until_flush(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage, hit_count_flush_interval=60)
+    for _ in range(3):
+        manager.update_hit_count(1, model="m")
+    manager.update_hit_count(2, model="m")
+    assert scalar_storage.calls == []
+    manager.flush()
+    assert scalar_storage.calls == [("update_hit_counts", {1: 3, 2: 1})]
+
+
+def test_close_drains_hit_counts(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage, hit_count_flush_interval=60)
+    manager.update_hit_count(5, model="m")
+    manager.close()
+    assert scalar_storage.calls == [("update_hit_counts", {5: 1})]
+
+
+# ----------- buffered query log -----------
+
+def test_query_log_rows_are_written_together_on_close(scalar_storage, vector_storage):
+    manager = make_manager(scalar_storage, vector_storage)
+    manager.save_query_resp({"errorCode": 0}, model="m", query="q1", delta_time=0.1)
+    manager.save_query_resp({"errorCode": 1}, model="m", query="q2", delta_time=0.2)
+    manager.close()
+    inserted = [rows for name, rows in scalar_storage.calls if name == "batch_insert_query_resp"]
+    assert [row for rows in inserted for row in rows] == [{"errorCode": 0}, {"errorCode": 1}]
+    assert manager.query_log.flushed == 2
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from modelcache.manager.scalar_data.embedding_codec import decode_embedding, encode_embedding
+from modelcache.manager.scalar_data.sql_storage_sqlite import SQLStorage
+from modelcache.utils.error import ParamError
+
+DIM = 64
+
+
+@pytest.fixture()
+def vector():
+    return np.random.default_rng(0).standard_normal(DIM).astype(np.float32)
+
+
+@pytest.mark.parametrize("storage, atol, size", [
+    ("full", 0, DIM * 4),
+    ("float16", 1e-2, 4 + DIM * 2),
+    ("int8", 5e-2, 8 + DIM),
+])
+def test_round_trip(vector, storage, atol, size):
+    blob = encode_embedding(vector, storage)
+    assert len(blob) == size
+    decoded = decode_embedding(blob)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vector, atol=atol)
+
+
+def test_none_stores_nothing(vector):
+    assert encode_embedding(vector, "none") == b""
+    assert decode_embedding(b"") is None
+    assert decode_embedding(None) is None
+
+
+def test_legacy_float32_blobs_still_decode(vector):
+    np.testing.assert_array_equal(decode_embedding(vector.tobytes()), vector)
+
+
+def test_unknown_storage_is_rejected(tmp_path):
+    with pytest.raises(ParamError):
+        SQLStorage(db_type="sqlite", url=str(tmp_path / "cache.db"), embedding_storage="bf16")
+
+
+def insert(store, vector):
+    return store.batch_insert([("answer", "question", vector, "m")])[0]
+
+
+def test_sqlite_skips_the_embedding_unless_asked(tmp_path, vector):
+    store = SQLStorage(db_type="sqlite", url=str(tmp_path / "cache.db"), embedding_storage="float16")
+    key = insert(store, vector)
+    answer, question, embedding, model = store.get_data_by_id(key)
+    assert (answer, question, embedding, model) == ("answer", "question", None, "m")
+    assert store.get_data_by_ids([key])[key][2] is None
+
+    embedding = store.get_data_by_id(key, with_embedding=True)[2]
+    np.testing.assert_allclose(embedding, vector, atol=1e-2)
+    np.testing.assert_array_equal(store.get_data_by_ids([key], with_embedding=True)[key][2], embedding)
+
+
+def test_sqlite_without_embeddings(tmp_path, vector):
+    store = SQLStorage(db_type="sqlite", url=str(tmp_path / "cache.db"), embedding_storage="none")
+    key = insert(store, vector)
+    assert store.get_data_by_id(key, with_embedding=True) == ("answer", "question", None, "m")
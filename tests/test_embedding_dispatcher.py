@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+pytest.importorskip("psutil")
+
+from modelcache.embedding.base import BaseEmbedding
+from modelcache.embedding.embedding_dispatcher import (
+    gather_batch, embed_batch, slot_array, write_result, attach_shared_memory
+)
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Embeds a string as its length and records every forward pass."""
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+
+    def to_embeddings(self, data, **kwargs):
+        if data == self.fail_on:
+            raise ValueError(f"cannot embed {data}")
+        return [len(data)]
+
+    def to_embeddings_batch(self, data_list, **kwargs):
+        self.calls.append(list(data_list))
+        return [self.to_embeddings(data) for data in data_list]
+
+    @property
+    def dimension(self):
+        return 1
+
+
+@pytest.fixture()
+def task_queue():
+    return queue.Queue()
+
+
+# ----------- gather_batch -----------
+
+def test_gather_batch_collects_queued_tasks(task_queue):
+    """All tasks already waiting in the queue end up in one batch."""
+    for i in range(5):
+        task_queue.put((i, str(i)))
+    batch = gather_batch(task_queue, max_batch_size=32, max_wait_ms=0)
+    assert batch == [(i, str(i)) for i in range(5)]
+
+
+def test_gather_batch_respects_max_batch_size(task_queue):
+    """A batch never grows past max_batch_size; the rest stays queued."""
+    for i in range(10):
+        task_queue.put((i, str(i)))
+    batch = gather_batch(task_queue, max_batch_size=4, max_wait_ms=50)
+    assert len(batch) == 4
+    assert task_queue.qsize() == 6
+
+
+def test_gather_batch_waits_for_late_tasks(task_queue):
+    """Tasks arriving within max_wait_ms of the first one join its batch."""
+    task_queue.put((0, "a"))
+
+    def late_put():
+        time.sleep(0.01)
+        task_queue.put((1, "b"))
+
+    t = threading.Thread(target=late_put)
+    t.start()
+    batch = gather_batch(task_queue, max_batch_size=8, max_wait_ms=500)
+    t.join()
+    assert [job_id for job_id, _ in batch][:2] == [0, 1]
+
+
+def test_gather_batch_returns_after_deadline(task_queue):
+    """A lone task is dispatched once max_wait_ms elapses."""
+    task_queue.put((0, "a"))
+    start = time.monotonic()
+    batch = gather_batch(task_queue, max_batch_size=8, max_wait_ms=20)
+    assert batch == [(0, "a")]
+    assert time.monotonic() - start < 1
+
+
+# ----------- embed_batch -----------
+
+def test_embed_batch_single_forward_pass():
+    """A batch is embedded with one to_embeddings_batch call, results keep input order."""
+    embedding = FakeEmbedding()
+    results = embed_batch(embedding, ["a", "bb", "ccc"])
+    assert embedding.calls == [["a", "bb", "ccc"]]
+    assert results == [[1], [2], [3]]
+
+
+def test_embed_batch_isolates_failing_input():
+    """One bad input fails only its own job, not the whole batch."""
+    embedding = FakeEmbedding(fail_on="bad")
+    results = embed_batch(embedding, ["a", "bad", "ccc"])
+    assert results[0] == [1]
+    assert isinstance(results[1], ValueError)
+    assert results[2] == [3]
+
+
+def test_default_to_embeddings_batch_loops():
+    """The base class falls back to one to_embeddings call per input."""
+    class Single(BaseEmbedding):
+        def to_embeddings(self, data, **kwargs):
+            return data.upper()
+
+        @property
+        def dimension(self):
+            return 1
+
+    assert Single().to_embeddings_batch(["a", "b"]) == ["A", "B"]
+
+
+# ----------- shared memory result slots -----------
+
+@pytest.fixture()
+def shm():
+    block = shared_memory.SharedMemory(create=True, size=4 * 3 * 4)
+    yield block
+    block.close()
+    block.unlink()
+
+
+def test_write_result_goes_through_slot(shm):
+    """A vector of the right shape is written into its slot and not sent back."""
+    slots = slot_array(shm, 4, 3)
+    vector = np.array([1.0, 2.0, 3.0], dtype=np.float32)
+    assert write_result(slots, 2, vector) is None
+    np.testing.assert_array_equal(slots[2], vector)
+
+
+def test_write_result_visible_from_other_attachment(shm):
+    """Another attachment to the same block sees the written vector without copying."""
+    writer = attach_shared_memory(shm.name)
+    try:
+        write_result(slot_array(writer, 4, 3), 1, np.array([4.0, 5.0, 6.0]))
+        np.testing.assert_array_equal(slot_array(shm, 4, 3)[1], [4.0, 5.0, 6.0])
+    finally:
+        writer.close()
+
+
+@pytest.mark.parametrize("slot, result", [
+    (None, np.zeros(3)),
+    (0, ValueError("boom")),
+    (0, np.zeros(5)),
+])
+def test_write_result_falls_back_to_queue(shm, slot, result):
+    """Missing slots, exceptions and wrong-sized vectors are returned for the result queue."""
+    assert write_result(slot_array(shm, 4, 3), slot, result) is result
@@ -0,0 +1,132 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from modelcache.embedding.base import EmbeddingModel
+from modelcache.embedding.embedding_memo import EmbeddingMemo
+
+
+class FakeDispatcher:
+    """Resolves every embed call on the next loop iteration and counts the calls."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def embed(self, data):
+        self.calls.append(data)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self.fail:
+            loop.call_soon(future.set_exception, ValueError(data))
+        else:
+            loop.call_soon(future.set_result, np.array([len(data), 1.0], dtype=np.float32))
+        return future
+
+
+def make_memo(dispatcher, policy="ARC", max_size=8):
+    return EmbeddingMemo(dispatcher.embed, EmbeddingModel.HUGGINGFACE_ALL_MPNET_BASE_V2,
+                         policy=policy, max_size=max_size)
+
+
+@pytest.mark.parametrize("policy", ["ARC", "WTINYLFU", "LRU"])
+def test_repeat_query_skips_inference(policy):
+    """The second request for the same text is served from the memo."""
+    dispatcher = FakeDispatcher()
+    memo = make_memo(dispatcher, policy=policy)
+
+    async def run():
+        first = await memo.embed("user: hello")
+        second = await memo.embed("user: hello")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert dispatcher.calls == ["user: hello"]
+    np.testing.assert_array_equal(first, second)
+
+
+def test_concurrent_identical_requests_share_one_future():
+    """Identical requests in flight at the same time trigger one embedding."""
+    dispatcher = FakeDispatcher()
+    memo = make_memo(dispatcher)
+
+    async def run():
+        return await asyncio.gather(*(memo.embed("same") for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert dispatcher.calls == ["same"]
+    assert len(results) == 10
+
+
+def test_different_texts_are_not_shared():
+    dispatcher = FakeDispatcher()
+    memo = make_memo(dispatcher)
+
+    async def run():
+        return await asyncio.gather(memo.embed("a"), memo.embed("bb"))
+
+    a, bb = asyncio.run(run())
+    assert sorted(dispatcher.calls) == ["a", "bb"]
+    assert a[0] == 1 and bb[0] == 2
+
+
+def test_failures_are_not_memoized():
+    """A failed embedding is retried on the next request."""
+    dispatcher = FakeDispatcher(fail=True)
+    memo = make_memo(dispatcher)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await memo.embed("x")
+
+    asyncio.run(run())
+    assert dispatcher.calls == ["x", "x"]
+
+
+def test_cancelled_caller_does_not_cancel_shared_future():
+    """Cancelling one waiter leaves the shared embedding running for the others."""
+    dispatcher = FakeDispatcher()
+    memo = make_memo(dispatcher)
+
+    async def run():
+        waiter = asyncio.ensure_future(memo.embed("q"))
+        other = memo.embed("q")
+        await asyncio.sleep(0)
+        waiter.cancel()
+        return await other
+
+    result = asyncio.run(run())
+    assert result[0] == 1
+
+
+def test_memoized_embedding_is_read_only():
+    """The shared array cannot be mutated by one caller behind another's back."""
+    memo = make_memo(FakeDispatcher())
+
+    async def run():
+        await memo.embed("x")
+        return await memo.embed("x")
+
+    result = asyncio.run(run())
+    with pytest.raises(ValueError):
+        result[0] = 42
+
+
+def test_memo_is_bounded():
+    """Entries beyond max_size are evicted and re-embedded."""
+    dispatcher = FakeDispatcher()
+    memo = make_memo(dispatcher, policy="LRU", max_size=2)
+
+    async def run():
+        for text in ["a", "b", "c", "a"]:
+            await memo.embed(text)
+
+    asyncio.run(run())
+    assert dispatcher.calls == ["a", "b", "c", "a"]
+
+
+def test_key_is_stable_for_str_and_bytes():
+    assert EmbeddingMemo.key("abc") == EmbeddingMemo.key(b"abc")
+    assert EmbeddingMemo.key("abc") != EmbeddingMemo.key("abd")
@@ -0,0 +1,119 @@
+import configparser
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+try:
+    import elasticsearch  # noqa: F401
+except ImportError:
+    # Old clients fail to import on newer Pythons with an ImportError rather than ModuleNotFoundError
+    pytest.skip("elasticsearch client is not importable", allow_module_level=True)
+pytest.importorskip("snowflake")
+
+from modelcache.manager.scalar_data import sql_storage_es  # noqa: E402
+from modelcache.manager.scalar_data.sql_storage_es import SQLStorage  # noqa: E402
+from modelcache.utils.error import HitCountUpdateError, ParamError  # noqa: E402
+
+
+# _id -> status of the bulk item that fails for it
+FAILED_STATUS = {101: 404, 102: 429, 103: "N/A"}
+
+
+def make_config(**options):
+    config = configparser.ConfigParser()
+    config.read_dict({"elasticsearch": {"host": "localhost", "port": "9200", **options}})
+    return config
+
+
+@pytest.fixture()
+def client():
+    client = MagicMock()
+    client.indices.exists.return_value = True
+    with patch.object(sql_storage_es, "Elasticsearch", return_value=client):
+        yield client
+
+
+@pytest.fixture()
+def bulk_calls():
+    calls = []
+
+    def streaming_bulk(client, actions, chunk_size, raise_on_error, raise_on_exception, refresh):
+        actions = list(actions)
+        calls.append({"actions": actions, "chunk_size": chunk_size, "refresh": refresh,
+                      "raise_on_exception": raise_on_exception})
+        for action in actions:
+            status = FAILED_STATUS.get(action.get("_id"))
+            if action.get("_source", {}).get("answer") == "bad":
+                status = 400
+            yield status is None, {"index": {"_id": action.get("_id"), "status": status or 200}}
+
+    with patch.object(sql_storage_es.helpers, "streaming_bulk", side_effect=streaming_bulk):
+        yield calls
+
+
+def rows(*answers):
+    return [(answer, "question", np.ones(4, dtype=np.float32), "m") for answer in answers]
+
+
+def test_batch_insert_is_one_bulk_stream_without_forced_refresh(client, bulk_calls):
+    store = SQLStorage(config=make_config(bulk_chunk_size="2"))
+    ids = store.batch_insert(rows("a", "b", "c"))
+    assert len(bulk_calls) == 1
+    call = bulk_calls[0]
+    assert call["chunk_size"] == 2 and call["refresh"] == "false"
+    assert [action["_id"] for action in call["actions"]] == ids
+    assert len(set(ids)) == 3
+    client.index.assert_not_called()
+    client.indices.refresh.assert_not_called()
+
+
+def test_failed_documents_keep_their_position_as_none(client, bulk_calls):
+    store = SQLStorage(config=make_config())
+    ids = store.batch_insert(rows("a", "bad", "c"))
+    sent = [action["_id"] for action in bulk_calls[0]["actions"]]
+    assert ids == [sent[0], None, sent[2]]
+    assert store._insert(rows("bad")[0]) is None
+
+
+def test_refresh_policy_is_configurable(client, bulk_calls):
+    store = SQLStorage(config=make_config(refresh="wait_for"))
+    store.batch_insert(rows("a"))
+    store.batch_insert_query_resp([({"errorCode": 0}, {"model": "m"})])
+    assert [call["refresh"] for call in bulk_calls] == ["wait_for", "false"]
+    with pytest.raises(ParamError):
+        SQLStorage(config=make_config(), refresh="sometimes")
+
+
+def test_query_log_goes_through_bulk(client, bulk_calls):
+    store = SQLStorage(config=make_config())
+    store.insert_query_resp({"errorCode": 0, "hit_query": ["q"]}, model="m", query="q", delta_time=0.1)
+    client.index.assert_not_called()
+    source = bulk_calls[0]["actions"][0]["_source"]
+    assert bulk_calls[0]["actions"][0]["_index"] == "modelcache_query_log"
+    assert source["model"] == "m" and source["hit_query"] == '["q"]'
+
+
+def test_snowflake_ids_wait_out_an_exhausted_millisecond(client, bulk_calls):
+    store = SQLStorage(config=make_config())
+    store.snowflake_id = iter([1, None, None, 2, 3])
+    with patch.object(sql_storage_es.time, "sleep") as sleep:
+        assert store._next_ids(3) == [1, 2, 3]
+    assert sleep.call_count == 2
+
+
+def test_mark_deleted_counts_successful_updates(client, bulk_calls):
+    store = SQLStorage(config=make_config())
+    assert store.mark_deleted([1, 2]) == 2
+    assert [action["doc"] for action in bulk_calls[0]["actions"]] == [{"is_deleted": 1}] * 2
+
+
+def test_hit_counts_retry_only_failed_updates(client, bulk_calls):
+    store = SQLStorage(config=make_config())
+    with pytest.raises(HitCountUpdateError) as e:
+        store.update_hit_counts({100: 1, 101: 2, 102: 3, 103: 4})
+    # 100 went through and 101 no longer exists; neither is sent again
+    assert e.value.failed == {102: 3, 103: 4}
+    assert bulk_calls[0]["raise_on_exception"] is False
+    assert [action["script"]["params"]["count"] for action in bulk_calls[0]["actions"]] == [1, 2, 3, 4]
+    store.update_hit_counts({100: 1})
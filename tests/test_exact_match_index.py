@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from modelcache.manager.exact_match_index import ExactMatchIndex
+from modelcache.manager.scalar_data.base import Question
+
+
+@pytest.fixture()
+def index():
+    return ExactMatchIndex(max_size=3)
+
+
+def test_put_and_get(index):
+    index.put("user: hello", "id-1", model="m")
+    assert index.get("user: hello", model="m") == "id-1"
+
+
+def test_lookup_is_per_model(index):
+    index.put("user: hello", "id-1", model="m1")
+    assert index.get("user: hello", model="m2") is None
+
+
+def test_normalization_ignores_surrounding_whitespace(index):
+    index.put("  user: hello\n", "id-1", model="m")
+    assert index.get("user: hello", model="m") == "id-1"
+    assert index.get("user: Hello", model="m") is None
+
+
+def test_question_objects_use_their_content(index):
+    index.put(Question("user: hi"), "id-1", model="m")
+    assert index.get("user: hi", model="m") == "id-1"
+
+
+def test_reinsert_replaces_id(index):
+    index.put("q", "old", model="m")
+    index.put("q", "new", model="m")
+    assert index.get("q", model="m") == "new"
+    index.remove(["old"], model="m")
+    assert index.get("q", model="m") == "new"
+
+
+def test_remove_by_id(index):
+    index.put("a", 1, model="m")
+    index.put("b", 2, model="m")
+    index.remove([1, 99], model="m")
+    assert index.get("a", model="m") is None
+    assert index.get("b", model="m") == 2
+
+
+def test_clear_model(index):
+    index.put("a", 1, model="m1")
+    index.put("a", 2, model="m2")
+    index.clear("m1")
+    assert index.get("a", model="m1") is None
+    assert index.get("a", model="m2") == 2
+
+
+def test_least_recently_used_entry_is_evicted(index):
+    for i, q in enumerate("abc"):
+        index.put(q, i, model="m")
+    index.get("a", model="m")  # refresh "a"
+    index.put("d", 3, model="m")
+    assert index.get("b", model="m") is None
+    assert index.get("a", model="m") == 0
+    assert len(index) == 3
+
+
+def test_invalid_max_size():
+    with pytest.raises(ValueError):
+        ExactMatchIndex(max_size=0)
+
+
+def test_concurrent_put_and_get():
+    index = ExactMatchIndex(max_size=100)
+
+    def writer(offset):
+        for i in range(200):
+            index.put(f"q{offset + i}", offset + i, model="m")
+            index.get(f"q{offset + i}", model="m")
+
+    threads = [threading.Thread(target=writer, args=(n * 1000,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(index) == 100
@@ -0,0 +1,182 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from modelcache.embedding import MetricType
+from modelcache.manager.vector_data.base import VectorData
+from modelcache.manager.vector_data import faiss as faiss_module
+from modelcache.manager.vector_data.faiss import Faiss
+from modelcache.manager.vector_data.id_map import IdMap
+
+DIM = 16
+
+needs_ifc = pytest.mark.skipif(not hasattr(faiss, "IO_FLAG_MMAP_IFC"), reason="faiss < 1.11 cannot map flat codes")
+
+
+def random_vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, DIM), dtype=np.float32)
+
+
+def add(store, vectors, ids, model="m"):
+    store.mul_add([VectorData(id=i, data=v) for i, v in zip(ids, vectors)], model=model)
+
+
+@pytest.fixture()
+def index_dir(tmp_path):
+    return str(tmp_path / "faiss")
+
+
+def test_string_ids_round_trip(index_dir):
+    store = Faiss(index_dir, DIM, top_k=1)
+    vectors = random_vectors(10)
+    ids = [f"uuid-{i}" for i in range(10)]
+    add(store, vectors, ids)
+    assert [r[0][1] for r in store.search_many(vectors, top_k=1, model="m")] == ids
+
+
+def test_models_are_isolated(index_dir):
+    store = Faiss(index_dir, DIM, top_k=5)
+    add(store, random_vectors(5, seed=1), [1, 2, 3, 4, 5], model="a")
+    add(store, random_vectors(5, seed=2), [6, 7, 8, 9, 10], model="b")
+    hits = store.search(random_vectors(1, seed=3)[0], top_k=5, model="a")
+    assert {_id for _, _id in hits} == {1, 2, 3, 4, 5}
+    assert store.search(random_vectors(1)[0], model="unknown") == []
+
+
+def test_cosine_scores_are_similarities(index_dir):
+    store = Faiss(index_dir, DIM, top_k=1, metric_type=MetricType.COSINE)
+    vectors = random_vectors(4)
+    add(store, vectors, [1, 2, 3, 4])
+    score, _id = store.search(vectors[2] * 3, model="m")[0]
+    assert _id == 3
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_delete_and_readd(index_dir):
+    store = Faiss(index_dir, DIM, top_k=1)
+    vectors = random_vectors(3)
+    add(store, vectors, [1, 2, 3])
+    assert store.delete([2, 99], model="m") == 1
+    assert store.search(vectors[1], top_k=3, model="m") and all(
+        _id != 2 for _, _id in store.search(vectors[1], top_k=3, model="m"))
+    add(store, vectors[:1], [2])  # re-add id 2 with another vector
+    assert store.search(vectors[0], top_k=2, model="m")[0][1] in (1, 2)
+    assert store.count("m") == 3
+
+
+def test_hnsw_delete_uses_tombstones(index_dir):
+    store = Faiss(index_dir, DIM, top_k=2, index_factory="HNSW16", search_params="efSearch=32")
+    vectors = random_vectors(50)
+    add(store, vectors, list(range(50)))
+    store.delete([7], model="m")
+    hits = store.search(vectors[7], top_k=2, model="m")
+    assert len(hits) == 2
+    assert 7 not in [_id for _, _id in hits]
+
+
+def test_ivf_trains_after_train_size(index_dir):
+    store = Faiss(index_dir, DIM, top_k=1, index_factory="IVF4,Flat", train_size=64, search_params="nprobe=4")
+    vectors = random_vectors(100)
+    add(store, vectors[:40], list(range(40)))
+    # Not trained yet: searches are served by the staging index
+    assert store.search(vectors[5], model="m")[0][1] == 5
+    add(store, vectors[40:], list(range(40, 100)))
+    assert "m" not in store._staging
+    assert [r[0][1] for r in store.search_many(vectors, model="m")] == list(range(100))
+
+
+def test_per_model_files_survive_reopen(index_dir):
+    store = Faiss(index_dir, DIM, top_k=1, index_factory="IVF4,Flat", train_size=32)
+    vectors = random_vectors(40)
+    add(store, vectors[:20], [f"a{i}" for i in range(20)], model="a/1")  # staged, untrained
+    add(store, vectors, list(range(40)), model="b")  # trained
+    store.close()
+
+    reopened = Faiss(index_dir, DIM, top_k=1, index_factory="IVF4,Flat", train_size=32)
+    assert reopened.search(vectors[3], model="a/1")[0][1] == "a3"
+    assert reopened.search(vectors[30], model="b")[0][1] == 30
+    assert reopened.count("a/1") == 20
+
+
+def test_rebuild_col_drops_model(index_dir):
+    store = Faiss(index_dir, DIM, top_k=1)
+    add(store, random_vectors(3), [1, 2, 3])
+    store.flush()
+    assert store.rebuild_col("m") is None
+    assert store.search(random_vectors(1)[0], model="m") == []
+    assert store.create("m") == "create_success"
+    assert store.create("m") == "already_exists"
+
+
+def test_id_map_persistence(tmp_path):
+    id_map = IdMap()
+    internal = id_map.assign(["x", 5, np.int64(6)])
+    id_map.remove([5])
+    path = str(tmp_path / "ids.json")
+    id_map.save(path)
+    loaded = IdMap.load(path)
+    assert len(loaded) == 2
+    assert loaded.external(internal[0]) == "x"
+    assert loaded.external(internal[2]) == 6
+    assert loaded.assign(["y"])[0] == 3
+
+
+def vector_storage(index):
+    """The faiss vectors holding the bulk of an index: its codes, graph links or inverted lists."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        return vector_storage(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return [index.hnsw.neighbors] + vector_storage(index.storage)
+    if isinstance(index, faiss.IndexFlatCodes):
+        return [index.codes]
+    invlists = faiss.downcast_InvertedLists(faiss.extract_index_ivf(index).invlists)
+    return [invlists.codes.at(i) for i in range(invlists.nlist) if invlists.list_size(i)]
+
+
+@needs_ifc
+@pytest.mark.parametrize("factory", ["Flat", "HNSW16", "IVF4,Flat"])
+def test_mmap_snapshot_is_served_and_copied_on_write(index_dir, factory):
+    vectors = random_vectors(200)
+    writer = Faiss(index_dir, DIM, top_k=1, index_factory=factory, train_size=100)
+    add(writer, vectors[:150], list(range(150)))
+    writer.flush()
+
+    mapped = Faiss(index_dir, DIM, top_k=1, index_factory=factory, train_size=100, mmap=True)
+    assert mapped.search(vectors[10], model="m")[0][1] == 10
+    # Views into the mapped file, not copies read into memory
+    storage = vector_storage(mapped._indexes["m"])
+    assert storage and not any(vector.is_owned for vector in storage)
+    assert "m" in mapped._mapped
+
+    # The writer replaces the snapshot while it is mapped elsewhere
+    add(writer, vectors[150:], list(range(150, 200)))
+    writer.flush()
+    assert mapped.search(vectors[20], model="m")[0][1] == 20
+
+    mapped.close()  # Unchanged, so nothing is written back
+
+    # The first write reads the mapped index into memory
+    mapped = Faiss(index_dir, DIM, top_k=1, index_factory=factory, train_size=100, mmap=True)
+    add(mapped, vectors[:1], ["x"])
+    assert "m" not in mapped._mapped
+    assert {_id for _, _id in mapped.search(vectors[0], top_k=2, model="m")} == {0, "x"}
+    mapped.close()
+    assert Faiss(index_dir, DIM, top_k=1, index_factory=factory).count("m") == 201
+
+
+def test_unmappable_index_is_read_into_memory_with_a_warning(index_dir, monkeypatch, caplog):
+    vectors = random_vectors(20)
+    writer = Faiss(index_dir, DIM, top_k=1, index_factory="HNSW16")
+    add(writer, vectors, list(range(20)))
+    writer.flush()
+
+    # IO_FLAG_MMAP alone, as on faiss < 1.11, reads HNSW indexes into memory
+    monkeypatch.setattr(faiss_module, "MMAP_FLAG", faiss.IO_FLAG_MMAP)
+    with caplog.at_level("WARNING", logger="modelcache"):
+        loaded = Faiss(index_dir, DIM, top_k=1, index_factory="HNSW16", mmap=True)
+        assert loaded.search(vectors[3], model="m")[0][1] == 3
+    assert "cannot memory-map" in caplog.text
+    assert "m" not in loaded._mapped
+    assert all(vector.is_owned for vector in vector_storage(loaded._indexes["m"]))
@@ -0,0 +1,147 @@
+import threading
+
+import pytest
+
+from modelcache.manager.hit_count_aggregator import HitCountAggregator
+from modelcache.manager.scalar_data.base import CacheStorage
+from modelcache.utils.error import HitCountUpdateError
+
+
+class Recorder:
+    """flush_func collecting every batch it receives."""
+
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+        self.flushed = threading.Event()
+
+    def __call__(self, counts):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("storage unavailable")
+        self.batches.append(dict(counts))
+        self.flushed.set()
+
+    def total(self):
+        totals = {}
+        for batch in self.batches:
+            for k, v in batch.items():
+                totals[k] = totals.get(k, 0) + v
+        return totals
+
+
+def test_increments_are_summed_into_one_batch():
+    recorder = Recorder()
+    aggregator = HitCountAggregator(recorder, flush_interval=60)
+    for _ in range(5):
+        aggregator.add(1, model="m")
+    aggregator.add(2, model="m")
+    assert len(aggregator) == 2
+    aggregator.flush()
+    assert recorder.batches == [{1: 5, 2: 1}]
+    assert len(aggregator) == 0
+    aggregator.close()
+
+
+def test_flush_on_timer():
+    recorder = Recorder()
+    aggregator = HitCountAggregator(recorder, flush_interval=0.01)
+    aggregator.add(7)
+    assert recorder.flushed.wait(2)
+    assert recorder.batches == [{7: 1}]
+    aggregator.close()
+
+
+def test_flush_when_size_threshold_is_reached():
+    recorder = Recorder()
+    aggregator = HitCountAggregator(recorder, flush_interval=60, max_pending=3)
+    for i in range(3):
+        aggregator.add(i)
+    assert recorder.flushed.wait(2)
+    assert recorder.total() == {0: 1, 1: 1, 2: 1}
+    aggregator.close()
+
+
+def test_close_drains_pending_counts():
+    recorder = Recorder()
+    aggregator = HitCountAggregator(recorder, flush_interval=60)
+    aggregator.add(1, model="a")
+    aggregator.add(1, model="a")
+    aggregator.close()
+    assert recorder.batches == [{1: 2}]
+    with pytest.raises(RuntimeError):
+        aggregator.add(1)
+
+
+def test_failed_flush_keeps_counts_for_next_flush():
+    recorder = Recorder(fail_times=1)
+    aggregator = HitCountAggregator(recorder, flush_interval=60)
+    aggregator.add(1)
+    aggregator.flush()
+    assert recorder.batches == []
+    aggregator.add(1)
+    aggregator.close()
+    assert recorder.batches == [{1: 2}]
+
+
+def test_partly_failed_flush_retries_only_the_failed_increments():
+    batches = []
+
+    def flush(counts):
+        batches.append(dict(counts))
+        if len(batches) == 1:
+            raise HitCountUpdateError({2: 3})
+
+    aggregator = HitCountAggregator(flush, flush_interval=60)
+    aggregator.add(1)
+    aggregator.add(2, model="a", count=2)
+    aggregator.add(2, model="b", count=2)
+    aggregator.flush()
+    assert len(aggregator) == 2
+    aggregator.close()
+    assert batches == [{1: 1, 2: 4}, {2: 3}]
+
+
+def test_default_update_hit_counts_reports_what_is_left():
+    applied = []
+
+    class Storage:
+        update_hit_counts = CacheStorage.update_hit_counts
+        fail_after = 3
+
+        def update_hit_count_by_id(self, primary_id):
+            if len(applied) >= self.fail_after:
+                raise ConnectionError("storage unavailable")
+            applied.append(primary_id)
+
+    with pytest.raises(HitCountUpdateError) as e:
+        Storage().update_hit_counts({1: 2, 2: 3, 3: 1})
+    assert applied == [1, 1, 2]
+    assert e.value.failed == {2: 2, 3: 1}
+    # Nothing applied: the original error goes through and the caller retries everything
+    with pytest.raises(ConnectionError):
+        Storage().update_hit_counts({2: 1})
+
+
+def test_concurrent_adds_are_not_lost():
+    recorder = Recorder()
+    aggregator = HitCountAggregator(recorder, flush_interval=0.001, max_pending=5)
+
+    def hit():
+        for i in range(500):
+            aggregator.add(i % 10, model="m")
+
+    threads = [threading.Thread(target=hit) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    aggregator.close()
+    assert recorder.total() == {i: 200 for i in range(10)}
+
+
+def test_invalid_params():
+    with pytest.raises(ValueError):
+        HitCountAggregator(Recorder(), flush_interval=0)
+    with pytest.raises(ValueError):
+        HitCountAggregator(Recorder(), max_pending=0)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("hnswlib")
+
+from modelcache.embedding import MetricType
+from modelcache.manager.vector_data.base import VectorData, VectorStorage
+from modelcache.manager.vector_data.hnswlib_store import Hnswlib
+
+DIM = 16
+
+
+def random_vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, DIM), dtype=np.float32)
+
+
+def add(store, vectors, ids, model="m"):
+    store.mul_add([VectorData(id=i, data=v) for i, v in zip(ids, vectors)], model=model)
+
+
+@pytest.fixture()
+def index_dir(tmp_path):
+    return str(tmp_path / "hnswlib")
+
+
+def test_get_builds_hnswlib_store(index_dir):
+    store = VectorStorage.get("hnswlib", dimension=DIM, index_path=index_dir)
+    assert isinstance(store, Hnswlib)
+
+
+def test_string_ids_round_trip(index_dir):
+    store = Hnswlib(index_dir, DIM, top_k=1)
+    vectors = random_vectors(20)
+    ids = [f"uuid-{i}" for i in range(20)]
+    add(store, vectors, ids)
+    assert [r[0][1] for r in store.search_many(vectors, model="m")] == ids
+
+
+def test_models_are_isolated(index_dir):
+    store = Hnswlib(index_dir, DIM, top_k=5)
+    add(store, random_vectors(5, seed=1), [1, 2, 3, 4, 5], model="a")
+    add(store, random_vectors(5, seed=2), [6, 7, 8, 9, 10], model="b")
+    hits = store.search(random_vectors(1, seed=3)[0], top_k=10, model="a")
+    assert {_id for _, _id in hits} == {1, 2, 3, 4, 5}
+    assert store.search(random_vectors(1)[0], model="unknown") == []
+
+
+def test_auto_resize_past_max_elements(index_dir):
+    store = Hnswlib(index_dir, DIM, top_k=1, max_elements=8)
+    vectors = random_vectors(50)
+    for start in range(0, 50, 10):
+        add(store, vectors[start:start + 10], list(range(start, start + 10)))
+    assert store.count("m") == 50
+    assert store.search(vectors[42], model="m")[0][1] == 42
+
+
+def test_delete_marks_deleted_and_reuses_slots(index_dir):
+    store = Hnswlib(index_dir, DIM, top_k=3, max_elements=10)
+    vectors = random_vectors(10)
+    add(store, vectors, list(range(10)))
+    assert store.delete([4, 99], model="m") == 1
+    assert 4 not in [_id for _, _id in store.search(vectors[4], top_k=3, model="m")]
+    add(store, random_vectors(1, seed=5), ["new"])
+    assert store._indexes["m"].get_max_elements() == 10  # took over the deleted slot
+    assert store.count("m") == 10
+
+
+def test_cosine_scores_are_similarities(index_dir):
+    store = Hnswlib(index_dir, DIM, top_k=1, metric_type=MetricType.COSINE)
+    vectors = random_vectors(4)
+    add(store, vectors, [1, 2, 3, 4])
+    score, _id = store.search(vectors[2] * 2, model="m")[0]
+    assert _id == 3
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_persistence(index_dir):
+    store = Hnswlib(index_dir, DIM, top_k=1)
+    vectors = random_vectors(10)
+    add(store, vectors, [f"id{i}" for i in range(10)], model="team/a")
+    store.delete(["id3"], model="team/a")
+    store.close()
+
+    reopened = Hnswlib(index_dir, DIM, top_k=1)
+    assert reopened.count("team/a") == 9
+    assert reopened.search(vectors[7], model="team/a")[0][1] == "id7"
+    assert reopened.search(vectors[3], model="team/a")[0][1] != "id3"
+
+
+def test_rebuild_col_drops_model(index_dir):
+    store = Hnswlib(index_dir, DIM, top_k=1)
+    add(store, random_vectors(3), [1, 2, 3])
+    store.flush()
+    assert store.rebuild_col("m") is None
+    assert store.search(random_vectors(1)[0], model="m") == []
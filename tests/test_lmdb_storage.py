@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("lmdb")
+
+from modelcache.manager.eviction_manager import EvictionManager  # noqa: E402
+from modelcache.manager.scalar_data.base import CacheStorage  # noqa: E402
+from modelcache.manager.scalar_data.sql_storage_lmdb import SQLStorage  # noqa: E402
+
+
+@pytest.fixture()
+def store(tmp_path):
+    store = SQLStorage(path=str(tmp_path / "cache"), map_size=64 * 1024 ** 2)
+    yield store
+    store.close()
+
+
+def rows(n, model="m"):
+    return [(f"answer{i}", f"question{i}", np.full(4, i, dtype=np.float32), model) for i in range(n)]
+
+
+def test_round_trip_and_embedding_on_request(store):
+    ids = store.batch_insert(rows(3) + [("答案", "问题", np.ones(4), "other")])
+    assert ids == [1, 2, 3, 4]
+    assert store.get_data_by_id(2) == ("answer1", "question1", None, "m")
+    np.testing.assert_array_equal(store.get_data_by_id(2, with_embedding=True)[2], np.full(4, 1))
+    assert store.get_data_by_id(4)[:2] == ("答案", "问题")
+    assert store.get_data_by_id(99) is None
+    assert set(store.get_data_by_ids([1, 4, 99])) == {1, 4}
+
+
+def test_ids_continue_after_reopen(tmp_path):
+    path = str(tmp_path / "cache")
+    store = SQLStorage(path=path)
+    store.batch_insert(rows(2))
+    store.close()
+    store = SQLStorage(path=path)
+    assert store.batch_insert(rows(1)) == [3]
+    assert store.get_data_by_id(1)[0] == "answer0"
+    store.close()
+
+
+def test_soft_delete_counts_and_clear(store):
+    ids = store.batch_insert(rows(5))
+    assert store.mark_deleted([ids[0], ids[1], ids[1], 99]) == 2
+    assert store.get_data_by_id(ids[0]) is None
+    assert set(store.get_data_by_ids(ids)) == set(ids[2:])
+    assert (store.count(state=1), store.count(state=0), store.count(is_all=True)) == (2, 3, 5)
+    assert store.get_ids(deleted=True) == ids[:2]
+    assert store.get_ids(deleted=False) == ids[2:]
+    assert store.clear_deleted_data() == 2
+    assert (store.count(state=1), store.count(is_all=True)) == (0, 3)
+
+
+def test_model_deleted_uses_the_model_index(store):
+    store.batch_insert(rows(3, model="a") + rows(2, model="ab"))
+    store.batch_insert_query_resp([({"errorCode": 0}, {"model": "a"}), ({"errorCode": 0}, {"model": "ab"})])
+    assert store.model_deleted("a") == 3
+    assert store.get_ids(deleted=False) == [4, 5]
+    with store.env.begin(db=store._logs) as txn:
+        assert txn.stat(store._logs)["entries"] == 1
+
+
+def test_hit_counts_accumulate(store):
+    key = store.batch_insert(rows(1))[0]
+    store.update_hit_count_by_id(key)
+    store.update_hit_counts({key: 4})
+    with store.env.begin(db=store._hits) as txn:
+        assert int.from_bytes(txn.get(key.to_bytes(8, "big")), "little") == 5
+
+
+def test_concurrent_readers_and_writer(store):
+    store.batch_insert(rows(10))
+    errors = []
+
+    def read():
+        try:
+            for _ in range(200):
+                assert store.get_data_by_id(5)[0] == "answer4"
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for _ in range(20):
+        store.batch_insert(rows(5))
+    for thread in readers:
+        thread.join()
+    assert errors == []
+    assert store.count(is_all=True) == 110
+
+
+def test_async_reads_run_inline(store, monkeypatch):
+    store.batch_insert(rows(2))
+    monkeypatch.setattr(asyncio, "to_thread", None)
+
+    async def run():
+        return await store.aget_data_by_id(1), await store.aget_data_by_ids([2])
+
+    single, many = asyncio.run(run())
+    assert single[0] == "answer0" and many[2][0] == "answer1"
+
+
+def test_eviction_manager_runs_on_lmdb(store):
+    ids = store.batch_insert(rows(10))
+
+    class Vectors:
+        def delete(self, ids, model):
+            self.deleted = ids
+
+    vectors = Vectors()
+    manager = EvictionManager(store, vectors)
+    manager.soft_evict(ids[:2])
+    assert manager.check_evict()
+    manager.delete("m")
+    assert vectors.deleted == ids[:2]
+    assert store.count(is_all=True) == 8
+
+
+def test_factory_builds_from_kwargs(tmp_path):
+    store = CacheStorage.get("lmdb", path=str(tmp_path / "cache"), embedding_storage="float16", sync="false")
+    assert isinstance(store, SQLStorage) and store.embedding_storage == "float16"
+    store.close()
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pymilvus")
+
+from modelcache.embedding import MetricType  # noqa: E402
+from modelcache.manager.vector_data import milvus as milvus_store  # noqa: E402
+from modelcache.manager.vector_data.base import VectorData  # noqa: E402
+from modelcache.manager.vector_data.milvus import Milvus  # noqa: E402
+
+DIM = 4
+
+
+def make_collection(name, index_type="HNSW"):
+    col = MagicMock()
+    col.name = name
+    col.indexes = [MagicMock()]
+    col.indexes[0].to_dict.return_value = {"index_param": {"metric_type": "COSINE", "index_type": index_type}}
+    col.search.side_effect = lambda data, **kwargs: [
+        SimpleNamespace(distances=[0.9], ids=[str(i)]) for i in range(len(data))
+    ]
+    partitions = set()
+    col.has_partition.side_effect = lambda name: name in partitions
+    col.create_partition.side_effect = partitions.add
+    col.drop_partition.side_effect = partitions.discard
+    return col
+
+
+@pytest.fixture()
+def collections():
+    collections = {}
+
+    def collection(name, **kwargs):
+        return collections.setdefault(name, make_collection(name))
+
+    with patch.object(milvus_store, "Collection", side_effect=collection), \
+            patch.object(milvus_store, "utility") as utility, \
+            patch.object(milvus_store, "connections") as connections:
+        utility.has_collection.return_value = True
+        connections.list_connections.return_value = []
+        yield collections
+
+
+def make_store(**kwargs):
+    return Milvus(dimension=DIM, top_k=2, metric_type=MetricType.COSINE, **kwargs)
+
+
+def test_search_many_sends_one_rpc_with_a_float32_array(collections):
+    store = make_store()
+    results = store.search_many(np.ones((3, DIM)), model="m")
+    col = collections["modelcache_m"]
+    assert col.search.call_count == 1
+    data = col.search.call_args.kwargs["data"]
+    assert isinstance(data, np.ndarray) and data.dtype == np.float32 and data.shape == (3, DIM)
+    assert results == [[(0.9, "0")], [(0.9, "1")], [(0.9, "2")]]
+
+
+def test_search_params_follow_the_index_type(collections):
+    collections["modelcache_ivf"] = make_collection("modelcache_ivf", index_type="IVF_FLAT")
+    store = make_store(search_params={"ef": 64, "nprobe": 32})
+    store.search(np.ones(DIM), model="m")
+    store.search(np.ones(DIM), model="ivf")
+    assert collections["modelcache_m"].search.call_args.kwargs["param"] == {
+        "metric_type": "COSINE", "params": {"ef": 64}}
+    assert collections["modelcache_ivf"].search.call_args.kwargs["param"] == {
+        "metric_type": "COSINE", "params": {"nprobe": 32}}
+
+
+def test_partition_per_model_shares_one_collection(collections):
+    store = make_store(partition_per_model=True)
+    store.mul_add([VectorData(id="a", data=np.ones(DIM))], model="gpt-4")
+    store.mul_add([VectorData(id="b", data=np.ones(DIM))], model="other")
+    assert list(collections) == ["modelcache"]
+    col = collections["modelcache"]
+    partitions = [call.kwargs["partition_name"] for call in col.insert.call_args_list]
+    assert len(set(partitions)) == 2
+    assert all(name.replace("_", "").isalnum() for name in partitions)
+
+    store.search(np.ones(DIM), model="gpt-4")
+    assert col.search.call_args.kwargs["partition_names"] == [partitions[0]]
+    store.delete(["a"], model="gpt-4")
+    assert col.delete.call_args.kwargs["partition_name"] == partitions[0]
+
+
+def test_partition_mode_skips_unknown_models(collections):
+    store = make_store(partition_per_model=True)
+    assert store.search_many(np.ones((2, DIM)), model="missing") == [[], []]
+    assert store.delete(["a"], model="missing") == 0
+    collections["modelcache"].create_partition.assert_not_called()
+
+
+def test_partition_mode_rebuild_drops_only_the_partition(collections):
+    store = make_store(partition_per_model=True)
+    store.mul_add([VectorData(id="a", data=np.ones(DIM))], model="m")
+    col = collections["modelcache"]
+    assert store.rebuild_col("m") is None
+    col.drop_partition.assert_called_once()
+    assert col.create_partition.call_count == 2
+    milvus_store.utility.drop_collection.assert_not_called()
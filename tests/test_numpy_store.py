@@ -0,0 +1,215 @@
+import numpy as np
+import pytest
+
+from modelcache.embedding import MetricType
+from modelcache.manager.vector_data import numpy_store
+from modelcache.manager.vector_data.base import VectorData, VectorStorage
+from modelcache.manager.vector_data.numpy_store import NumpyStore
+from modelcache.utils.error import ParamError
+
+DIM = 8
+
+
+def random_vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, DIM), dtype=np.float32)
+
+
+def add(store, vectors, ids, model="m"):
+    store.mul_add([VectorData(id=i, data=v) for i, v in zip(ids, vectors)], model=model)
+
+
+def brute_force_l2(vectors, query, k):
+    dist = np.sum((vectors - query) ** 2, axis=1)
+    return list(np.argsort(dist, kind="stable")[:k])
+
+
+@pytest.fixture()
+def index_dir(tmp_path):
+    return str(tmp_path / "numpy")
+
+
+def test_get_builds_numpy_store(index_dir):
+    assert isinstance(VectorStorage.get("numpy", dimension=DIM, index_path=index_dir), NumpyStore)
+
+
+def test_l2_top_k_matches_brute_force_across_blocks(index_dir, monkeypatch):
+    monkeypatch.setattr(numpy_store, "BLOCK_ROWS", 7)
+    store = NumpyStore(index_dir, DIM, top_k=5, initial_capacity=4)
+    vectors = random_vectors(100)
+    add(store, vectors, list(range(100)))
+    queries = random_vectors(6, seed=1)
+    results = store.search_many(queries, model="m")
+    for query, hits in zip(queries, results):
+        assert [_id for _, _id in hits] == brute_force_l2(vectors, query, 5)
+        distances = [d for d, _ in hits]
+        assert distances == sorted(distances)
+        assert distances[0] == pytest.approx(float(np.sum((vectors[hits[0][1]] - query) ** 2)), rel=1e-4)
+
+
+def test_cosine_scores_are_similarities(index_dir):
+    store = NumpyStore(index_dir, DIM, top_k=2, metric_type=MetricType.COSINE)
+    vectors = random_vectors(10)
+    add(store, vectors, [f"id{i}" for i in range(10)])
+    hits = store.search(vectors[4] * 5, model="m")
+    assert hits[0][1] == "id4"
+    assert hits[0][0] == pytest.approx(1.0, abs=1e-5)
+    assert hits[0][0] >= hits[1][0]
+
+
+def test_top_k_larger_than_store(index_dir):
+    store = NumpyStore(index_dir, DIM, top_k=10)
+    add(store, random_vectors(3), [1, 2, 3])
+    assert len(store.search(random_vectors(1)[0], model="m")) == 3
+    assert store.search(random_vectors(1)[0], model="other") == []
+
+
+def test_delete_tombstones_and_compaction(index_dir, monkeypatch):
+    monkeypatch.setattr(numpy_store, "COMPACT_MIN_TOMBSTONES", 2)
+    store = NumpyStore(index_dir, DIM, top_k=3)
+    vectors = random_vectors(6)
+    add(store, vectors, list(range(6)))
+    assert store.delete([1, 42], model="m") == 1
+    assert 1 not in [_id for _, _id in store.search(vectors[1], model="m")]
+    assert store._matrices["m"].tombstones == 1
+
+    store.delete([0, 2, 3, 4], model="m")  # tombstones now outnumber live rows
+    matrix = store._matrices["m"]
+    assert matrix.tombstones == 0
+    assert matrix.ids == [5]
+    assert store.search(vectors[0], model="m")[0][1] == 5
+
+
+def test_readd_replaces_vector(index_dir):
+    store = NumpyStore(index_dir, DIM, top_k=1)
+    vectors = random_vectors(3)
+    add(store, vectors[:2], ["a", "b"])
+    add(store, vectors[2:], ["a"])
+    assert store.count("m") == 2
+    assert store.search(vectors[2], model="m")[0] == (pytest.approx(0.0, abs=1e-5), "a")
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_persistence(index_dir, mmap):
+    store = NumpyStore(index_dir, DIM, top_k=1)
+    vectors = random_vectors(20)
+    add(store, vectors, list(range(20)), model="team/a")
+    store.delete([3], model="team/a")
+    store.close()
+
+    reopened = NumpyStore(index_dir, DIM, top_k=1, mmap=mmap)
+    assert reopened.count("team/a") == 19
+    assert reopened.search(vectors[7], model="team/a")[0][1] == 7
+    if mmap:
+        assert isinstance(reopened._matrices["team/a"].vectors, np.memmap)
+    # Writes copy the memmap into a growable array
+    add(reopened, random_vectors(1, seed=9), [99], model="team/a")
+    assert reopened.count("team/a") == 20
+    reopened.close()
+    assert NumpyStore(index_dir, DIM, top_k=1).count("team/a") == 20
+
+
+@pytest.mark.parametrize("metric", [MetricType.L2, MetricType.COSINE])
+def test_loading_reads_no_rows_for_norms(index_dir, metric):
+    store = NumpyStore(index_dir, DIM, top_k=1, metric_type=metric)
+    vectors = random_vectors(20)
+    add(store, vectors, list(range(20)))
+    store.close()
+
+    reopened = NumpyStore(index_dir, DIM, top_k=1, metric_type=metric, mmap=True)
+    reopened.count("m")
+    matrix = reopened._matrices["m"]
+    if metric == MetricType.COSINE:
+        assert matrix.sq_norms is None
+    else:
+        assert not matrix.norms_known.any()
+    assert reopened.search(vectors[7], model="m")[0][1] == 7
+    if metric == MetricType.L2:
+        assert matrix.norms_known[:20].all()
+        np.testing.assert_allclose(matrix.sq_norms[:20], np.sum(vectors ** 2, axis=1), rtol=1e-5)
+
+
+def test_rebuild_col_drops_model(index_dir):
+    store = NumpyStore(index_dir, DIM, top_k=1)
+    add(store, random_vectors(3), [1, 2, 3])
+    store.flush()
+    assert store.rebuild_col("m") is None
+    assert store.search(random_vectors(1)[0], model="m") == []
+
+
+def recall_at_k(store, vectors, queries, k):
+    hits = 0
+    for query, result in zip(queries, store.search_many(queries, top_k=k, model="m")):
+        hits += len(set(brute_force_l2(vectors, query, k)) & {_id for _, _id in result})
+    return hits / (len(queries) * k)
+
+
+@pytest.mark.parametrize("scale", ["vector", "dimension"])
+def test_int8_recall_with_rerank(index_dir, scale):
+    vectors = np.random.default_rng(0).standard_normal((2000, 32)).astype(np.float32)
+    queries = np.random.default_rng(1).standard_normal((50, 32)).astype(np.float32)
+    store = NumpyStore(index_dir, 32, top_k=10, quantization="int8", quantization_scale=scale, rerank_factor=4)
+    add(store, vectors, list(range(2000)))
+    assert recall_at_k(store, vectors, queries, 10) >= 0.98
+    # Reranked distances are exact
+    hit = store.search(queries[0], model="m")[0]
+    assert hit[0] == pytest.approx(float(np.sum((vectors[hit[1]] - queries[0]) ** 2)), rel=1e-4)
+
+
+def test_int8_cosine_scores_are_similarities(index_dir):
+    store = NumpyStore(index_dir, DIM, top_k=2, metric_type=MetricType.COSINE, quantization="int8")
+    vectors = random_vectors(10)
+    add(store, vectors, list(range(10)))
+    hits = store.search(vectors[4] * 5, model="m")
+    assert hits[0][1] == 4
+    assert hits[0][0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_int8_keeps_only_codes_in_memory_after_flush(index_dir, monkeypatch):
+    monkeypatch.setattr(numpy_store, "COMPACT_MIN_TOMBSTONES", 1)
+    store = NumpyStore(index_dir, DIM, top_k=3, quantization="int8")
+    vectors = random_vectors(20)
+    add(store, vectors, list(range(20)))
+    store.delete(list(range(12)), model="m")  # compacts the codes before anything is on disk
+    store.flush()
+    matrix = store._matrices["m"]
+    assert matrix.codes.dtype == np.int8
+    assert matrix.pending == [] and isinstance(matrix.disk, np.memmap)
+    assert store.search(vectors[15], model="m")[0][1] == 15
+
+    add(store, vectors[:2], [100, 101])
+    reopened = NumpyStore(index_dir, DIM, top_k=3, quantization="int8")
+    assert reopened.count("m") == 8
+    store.flush()
+    reopened = NumpyStore(index_dir, DIM, top_k=3, quantization="int8")
+    assert reopened.count("m") == 10
+    assert reopened.search(vectors[1], model="m")[0] == (pytest.approx(0.0, abs=1e-6), 101)
+    assert reopened.search(vectors[13], model="m")[0][1] == 13
+
+
+def test_switching_to_int8_quantizes_saved_vectors(index_dir):
+    vectors = random_vectors(30)
+    store = NumpyStore(index_dir, DIM, top_k=1)
+    add(store, vectors, list(range(30)))
+    store.flush()
+    quantized = NumpyStore(index_dir, DIM, top_k=1, quantization="int8", quantization_scale="dimension")
+    assert [quantized.search(v, model="m")[0][1] for v in vectors] == list(range(30))
+
+
+def test_codes_made_on_load_are_saved(index_dir, monkeypatch):
+    vectors = random_vectors(30)
+    store = NumpyStore(index_dir, DIM, top_k=1)
+    add(store, vectors, list(range(30)))
+    store.close()
+    NumpyStore(index_dir, DIM, top_k=1, quantization="int8").count("m")
+
+    def fail(vectors):
+        raise AssertionError("saved vectors quantized again")
+
+    monkeypatch.setattr(numpy_store, "quantize_per_vector", fail)
+    reopened = NumpyStore(index_dir, DIM, top_k=1, quantization="int8")
+    assert reopened.search(vectors[4], model="m")[0][1] == 4
+
+
+def test_unknown_quantization_is_rejected(index_dir):
+    with pytest.raises(ParamError):
+        NumpyStore(index_dir, DIM, top_k=1, quantization="int4")
@@ -0,0 +1,34 @@
+import numpy as np
+
+from modelcache.manager.vector_data.quantization import (
+    INT8_MAX,
+    dequantize,
+    fit_dimension_scales,
+    quantize_per_dimension,
+    quantize_per_vector,
+)
+
+
+def test_per_vector_error_is_bounded_by_half_a_step():
+    vectors = np.random.default_rng(0).standard_normal((100, 16)).astype(np.float32)
+    codes, scales = quantize_per_vector(vectors)
+    assert codes.dtype == np.int8 and scales.shape == (100,)
+    assert np.abs(codes).max() == INT8_MAX
+    error = np.abs(dequantize(codes, scales) - vectors)
+    assert np.all(error <= scales[:, None] / 2 + 1e-6)
+
+
+def test_per_vector_zero_vector():
+    codes, scales = quantize_per_vector(np.zeros((1, 4), dtype=np.float32))
+    assert not codes.any() and scales[0] == 1.0
+
+
+def test_per_dimension_scales_and_clipping():
+    vectors = np.array([[1.0, 0.0, -0.5], [-2.0, 0.0, 0.25]], dtype=np.float32)
+    scales = fit_dimension_scales(vectors)
+    assert scales[0] == np.float32(2.0 / INT8_MAX)
+    assert scales[1] == scales.max()  # All-zero dimension borrows the largest scale
+    codes = quantize_per_dimension(vectors, scales)
+    np.testing.assert_allclose(dequantize(codes, scales, per_dimension=True), vectors, atol=scales.max() / 2)
+    # Values beyond the fitted range clip instead of wrapping around
+    assert quantize_per_dimension(np.array([[10.0, 0.0, 0.0]], dtype=np.float32), scales)[0, 0] == INT8_MAX
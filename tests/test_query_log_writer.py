@@ -0,0 +1,119 @@
+import asyncio
+import threading
+
+import pytest
+
+from modelcache.manager.query_log_writer import QueryLogWriter
+
+
+class Sink:
+    """write_func recording each batch, optionally blocking until released."""
+
+    def __init__(self, fail=False, gate=None):
+        self.batches = []
+        self.fail = fail
+        self.gate = gate
+
+    def __call__(self, rows):
+        if self.gate is not None:
+            self.gate.wait(2)
+        if self.fail:
+            raise RuntimeError("storage unavailable")
+        self.batches.append(list(rows))
+
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+
+def test_rows_are_written_in_batches():
+    sink = Sink()
+    writer = QueryLogWriter(sink, batch_size=10, flush_interval=60)
+    for i in range(25):
+        writer.put({"errorCode": 0}, model="m", query=str(i))
+    writer.close()
+    assert [len(b) for b in sink.batches] == [10, 10, 5]
+    assert [kwargs["query"] for _, kwargs in sink.rows()] == [str(i) for i in range(25)]
+    assert writer.flushed == 25
+    assert writer.dropped == 0
+
+
+def test_partial_batch_written_after_flush_interval():
+    sink = Sink()
+    writer = QueryLogWriter(sink, batch_size=100, flush_interval=0.01)
+    writer.put({"errorCode": 0}, model="m")
+    writer.put({"errorCode": 0}, model="m")
+    writer.close()
+    assert len(sink.rows()) == 2
+
+
+def test_flush_writes_queued_rows_from_caller():
+    gate = threading.Event()
+    sink = Sink(gate=gate)
+    writer = QueryLogWriter(sink, batch_size=100, flush_interval=60)
+    writer.put({"errorCode": 0}, model="m")  # picked up by the background thread, blocked in the sink
+    writer.put({"errorCode": 1}, model="m")
+    gate.set()
+    writer.flush()
+    writer.close()
+    assert len(sink.rows()) == 2
+
+
+def test_drop_policy_counts_rows_when_queue_is_full():
+    gate = threading.Event()
+    sink = Sink(gate=gate)
+    writer = QueryLogWriter(sink, max_queue_size=2, batch_size=1, flush_interval=60, policy="drop")
+    for i in range(10):
+        writer.put({"errorCode": 0}, query=str(i))
+    assert writer.dropped >= 7  # at most one row in the sink and two queued
+    gate.set()
+    writer.close()
+    assert writer.flushed + writer.dropped == 10
+
+
+def test_block_policy_never_drops():
+    sink = Sink()
+    writer = QueryLogWriter(sink, max_queue_size=1, batch_size=1, flush_interval=60, policy="block")
+    for i in range(50):
+        writer.put({"errorCode": 0}, query=str(i))
+    writer.close()
+    assert writer.dropped == 0
+    assert len(sink.rows()) == 50
+
+
+def test_failed_write_is_counted():
+    writer = QueryLogWriter(Sink(fail=True), batch_size=10, flush_interval=60)
+    writer.put({"errorCode": 0})
+    writer.close()
+    assert writer.failed == 1
+    assert writer.flushed == 0
+
+
+def test_rows_after_close_are_dropped():
+    sink = Sink()
+    writer = QueryLogWriter(sink)
+    writer.close()
+    writer.put({"errorCode": 0})
+    assert writer.dropped == 1
+    assert sink.rows() == []
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        QueryLogWriter(Sink(), policy="spill")
+
+
+def test_block_policy_does_not_block_an_event_loop():
+    gate = threading.Event()
+    sink = Sink(gate=gate)
+    writer = QueryLogWriter(sink, max_queue_size=1, batch_size=1, flush_interval=60, policy="block")
+
+    async def log():
+        for i in range(20):
+            writer.put({"errorCode": 0}, query=str(i))
+
+    asyncio.run(asyncio.wait_for(log(), 1))
+    assert not gate.is_set() and len(writer) >= 18  # the sink is still stuck on the first row
+    gate.set()
+    writer.close()
+    assert writer.dropped == 0
+    assert [kwargs["query"] for _, kwargs in sink.rows()] == [str(i) for i in range(20)]
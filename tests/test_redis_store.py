@@ -0,0 +1,134 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+pytest.importorskip("redis")
+
+from modelcache.embedding import MetricType  # noqa: E402
+from modelcache.manager.vector_data import redis as redis_store  # noqa: E402
+from modelcache.manager.vector_data.base import VectorData  # noqa: E402
+from modelcache.manager.vector_data.redis import RedisVectorStore  # noqa: E402
+
+DIM = 4
+
+
+@pytest.fixture()
+def client():
+    client = MagicMock()
+    with patch.object(redis_store, "Redis", return_value=client):
+        yield client
+
+
+def make_store(**kwargs):
+    return RedisVectorStore(dimension=DIM, **kwargs)
+
+
+def test_mul_add_sends_one_pipeline_per_batch(client):
+    store = make_store(batch_size=4)
+    store.mul_add([VectorData(id=i, data=np.full(DIM, i, dtype=np.float64)) for i in range(10)], model="m")
+    assert [call.kwargs for call in client.pipeline.call_args_list] == [{"transaction": False}] * 3
+    client.hset.assert_not_called()
+
+
+def test_mul_add_writes_under_the_model_prefix(client):
+    pipes = []
+
+    def pipeline(transaction=True):
+        pipe = MagicMock()
+        pipes.append(pipe)
+        return pipe
+
+    client.pipeline.side_effect = pipeline
+    store = make_store(batch_size=2)
+    vectors = np.random.default_rng(0).random((3, DIM))
+    store.mul_add([VectorData(id=i, data=v) for i, v in enumerate(vectors)], model="m")
+
+    assert [len(pipe.hset.call_args_list) for pipe in pipes] == [2, 1]
+    assert all(pipe.execute.call_count == 1 for pipe in pipes)
+    key, = pipes[1].hset.call_args.args
+    mapping = pipes[1].hset.call_args.kwargs["mapping"]
+    assert key == "prefix_m2"
+    assert mapping["data_id"] == 2
+    assert mapping["data_vector"] == vectors[2].astype(np.float32).tobytes()
+
+
+def test_delete_targets_the_model_prefix_in_batches(client):
+    client.delete.side_effect = lambda *keys: len(keys) - 1
+    store = make_store(batch_size=2)
+    assert store.delete([1, 2, 3], model="m") == 1
+    assert [call.args for call in client.delete.call_args_list] == [("prefix_m1", "prefix_m2"), ("prefix_m3",)]
+
+
+def test_delete_without_model_covers_every_index(client):
+    client.execute_command.return_value = [b"modelcache_a", b"other", b"modelcache_b"]
+    client.delete.side_effect = lambda *keys: len(keys)
+    store = make_store()
+    assert store.delete([7], model=None) == 2
+    assert client.delete.call_args.args == ("prefix_a7", "prefix_b7")
+
+
+def test_asearch_uses_the_async_client(client):
+    aclient = MagicMock()
+    docs = [SimpleNamespace(distance="0.5", data_id="3")]
+    aclient.ft.return_value.search = AsyncMock(return_value=SimpleNamespace(docs=docs))
+    with patch("redis.asyncio.Redis", return_value=aclient):
+        store = make_store(async_client=True)
+    result = asyncio.run(store.asearch(np.zeros(DIM), model="m"))
+    assert result == [(0.5, 3)]
+    aclient.ft.assert_called_with("modelcache_m")
+    client.ft.assert_not_called()
+
+
+def test_asearch_falls_back_to_a_thread(client):
+    client.ft.return_value.search.return_value = SimpleNamespace(docs=[SimpleNamespace(distance="1.0", data_id="9")])
+    store = make_store()
+    assert asyncio.run(store.asearch(np.zeros(DIM), model="m")) == [(1.0, 9)]
+
+
+def test_search_sends_top_k_and_ef_runtime(client):
+    client.ft.return_value.search.return_value = SimpleNamespace(docs=[])
+    store = make_store(top_k=3, ef_runtime=50)
+    store.search(np.zeros(DIM), model="m")
+    store.search(np.zeros(DIM), top_k=7, model="m")
+    (first, first_kwargs), (second, second_kwargs) = [
+        (call.args[0], call.kwargs) for call in client.ft.return_value.search.call_args_list
+    ]
+    assert "KNN $k" in first.query_string() and "EF_RUNTIME $ef_runtime" in first.query_string()
+    assert first_kwargs["query_params"]["k"] == 3 and first_kwargs["query_params"]["ef_runtime"] == 50
+    assert second_kwargs["query_params"]["k"] == 7
+    args = second.get_args()
+    assert args[args.index("LIMIT") + 1:args.index("LIMIT") + 3] == [0, 7]
+
+
+def test_cosine_results_are_similarities(client):
+    client.ft.return_value.search.return_value = SimpleNamespace(docs=[SimpleNamespace(distance="0.25", data_id="1")])
+    store = make_store(metric_type=MetricType.COSINE)
+    assert store.search(np.zeros(DIM), model="m") == [(0.75, 1)]
+
+
+def test_index_uses_configured_hnsw_params(client):
+    client.ft.return_value.info.side_effect = Exception("Unknown index name")
+    store = make_store(metric_type=MetricType.COSINE, vector_type="FLOAT16", m=32, ef_construction=400,
+                       initial_cap=50000)
+    assert store.create(model="m") == "create_success"
+    field = client.ft.return_value.create_index.call_args.kwargs["fields"][1]
+    args = [str(arg) for arg in field.args]
+    for name, value in [("TYPE", "FLOAT16"), ("DISTANCE_METRIC", "COSINE"), ("M", "32"),
+                        ("EF_CONSTRUCTION", "400"), ("INITIAL_CAP", "50000")]:
+        assert args[args.index(name) + 1] == value
+
+
+def test_float16_vectors_are_packed_as_float16(client):
+    pipe = client.pipeline.return_value
+    store = make_store(vector_type="FLOAT16")
+    vector = np.arange(DIM, dtype=np.float64)
+    store.mul_add([VectorData(id=1, data=vector)], model="m")
+    assert pipe.hset.call_args.kwargs["mapping"]["data_vector"] == vector.astype(np.float16).tobytes()
+
+
+def test_unknown_vector_type_is_rejected(client):
+    with pytest.raises(ValueError):
+        make_store(vector_type="INT8")
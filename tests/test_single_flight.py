@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from modelcache.utils.single_flight import SingleFlight
+
+
+class Lookup:
+    """Slow async lookup counting how many times it actually ran."""
+
+    def __init__(self, fail=False):
+        self.runs = 0
+        self.fail = fail
+
+    async def __call__(self, value):
+        self.runs += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("lookup failed")
+        return {"data": value}
+
+
+def test_concurrent_duplicates_run_once():
+    """Callers with the same key share one execution and all receive its result."""
+    flights = SingleFlight()
+    lookup = Lookup()
+
+    async def run():
+        return await asyncio.gather(*(flights.do("k", lookup, "v") for _ in range(50)))
+
+    results = asyncio.run(run())
+    assert lookup.runs == 1
+    assert results == [{"data": "v"}] * 50
+    assert len(flights) == 0
+
+
+def test_different_keys_run_separately():
+    flights = SingleFlight()
+    lookup = Lookup()
+
+    async def run():
+        return await asyncio.gather(flights.do("a", lookup, 1), flights.do("b", lookup, 2))
+
+    assert asyncio.run(run()) == [{"data": 1}, {"data": 2}]
+    assert lookup.runs == 2
+
+
+def test_sequential_calls_are_not_coalesced():
+    """Once a flight lands, the next call for the key starts a new one."""
+    flights = SingleFlight()
+    lookup = Lookup()
+
+    async def run():
+        await flights.do("k", lookup, 1)
+        await flights.do("k", lookup, 1)
+
+    asyncio.run(run())
+    assert lookup.runs == 2
+
+
+def test_exception_reaches_every_caller():
+    flights = SingleFlight()
+    lookup = Lookup(fail=True)
+
+    async def run():
+        return await asyncio.gather(*(flights.do("k", lookup, 1) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert lookup.runs == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(flights) == 0
+
+
+def test_cancelled_caller_does_not_cancel_flight():
+    flights = SingleFlight()
+    lookup = Lookup()
+
+    async def run():
+        first = asyncio.ensure_future(flights.do("k", lookup, 1))
+        second = asyncio.ensure_future(flights.do("k", lookup, 1))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == {"data": 1}
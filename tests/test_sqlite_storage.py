@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from modelcache.manager.eviction_manager import EvictionManager
+from modelcache.manager.scalar_data import sql_storage_sqlite
+from modelcache.manager.scalar_data.sql_storage_sqlite import SQLStorage
+
+
+@pytest.fixture()
+def store(tmp_path):
+    store = SQLStorage(db_type="sqlite", url=str(tmp_path / "cache.db"))
+    yield store
+    store.close()
+
+
+def rows(n, model="m"):
+    return [(f"answer{i}", f"question{i}", np.full(4, i, dtype=np.float32), model) for i in range(n)]
+
+
+def test_connection_is_persistent_and_uses_wal(store):
+    conn = store._connection()
+    assert store._connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    # NORMAL is 1
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_each_thread_gets_its_own_connection(store):
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(store._connection()))
+    thread.start()
+    thread.join()
+    assert seen[0] is not store._connection()
+    store.close()
+    assert store._connections == []
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_batch_insert_returns_ids_in_row_order(store, monkeypatch, returning):
+    monkeypatch.setattr(sql_storage_sqlite, "SUPPORTS_RETURNING", returning)
+    monkeypatch.setattr(sql_storage_sqlite, "BATCH_SIZE", 7)
+    ids = store.batch_insert(rows(20))
+    assert len(set(ids)) == 20
+    fetched = store.get_data_by_ids(ids)
+    assert [fetched[i][0] for i in ids] == [f"answer{i}" for i in range(20)]
+    assert store.count(is_all=True) == 20
+
+
+def test_batch_insert_is_one_transaction(store):
+    data = rows(3)
+    data[2] = (None, "question", np.ones(4), "m")
+    with pytest.raises(sqlite3.IntegrityError):
+        store.batch_insert(data)
+    assert store.count(is_all=True) == 0
+
+
+def test_soft_delete_and_clear(store):
+    ids = store.batch_insert(rows(5))
+    assert store.mark_deleted(ids[:2]) == 2
+    assert store.get_data_by_id(ids[0]) is None
+    assert set(store.get_data_by_ids(ids)) == set(ids[2:])
+    assert store.count(state=1) == 2 and store.count(state=0) == 3 and store.count(is_all=True) == 5
+    assert store.get_ids(deleted=True) == ids[:2]
+    assert store.get_ids(deleted=False) == ids[2:]
+    assert store.clear_deleted_data() == 2
+    assert store.count(is_all=True) == 3
+
+
+def test_hit_counts(store):
+    key = store.batch_insert(rows(1))[0]
+    store.update_hit_count_by_id(key)
+    store.update_hit_counts({key: 4})
+    assert store._connection().execute("SELECT hit_count FROM modelcache_llm_answer").fetchone()[0] == 5
+
+
+def test_old_databases_gain_the_is_deleted_column(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE modelcache_llm_answer (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT NOT NULL, answer TEXT NOT NULL,
+        answer_type INTEGER NOT NULL, hit_count INTEGER NOT NULL DEFAULT 0, model VARCHAR(1000) NOT NULL,
+        embedding_data BLOB NOT NULL)""")
+    conn.execute("INSERT INTO modelcache_llm_answer (question, answer, answer_type, model, embedding_data) "
+                 "VALUES ('q', 'a', 0, 'm', x'')")
+    conn.commit()
+    conn.close()
+
+    store = SQLStorage(db_type="sqlite", url=path)
+    assert store.get_data_by_id(1) == ("a", "q", None, "m")
+    assert store.count(state=0) == 1
+    store.close()
+
+
+def test_eviction_manager_runs_on_sqlite(store):
+    ids = store.batch_insert(rows(10))
+    vector_base = MagicMock()
+    manager = EvictionManager(store, vector_base)
+    manager.soft_evict(ids[:2])
+    assert manager.check_evict()
+    manager.delete("m")
+    vector_base.delete.assert_called_once_with(ids[:2], "m")
+    assert store.count(is_all=True) == 8
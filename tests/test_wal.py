@@ -0,0 +1,310 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from modelcache.manager.vector_data.base import VectorData, VectorStorage
+from modelcache.manager.vector_data.numpy_store import NumpyStore
+from modelcache.manager.vector_data.wal import WriteAheadLog, OP_ADD, OP_DELETE, OP_DROP
+
+DIM = 4
+
+
+def random_vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, DIM), dtype=np.float32)
+
+
+def add(store, vectors, ids, model="m"):
+    store.mul_add([VectorData(id=i, data=v) for i, v in zip(ids, vectors)], model=model)
+
+
+def crash(store):
+    # Drop the store without a final snapshot, as a killed process would
+    store._wal.close()
+
+
+def replayed(path):
+    records = []
+    wal = WriteAheadLog(path)
+    wal.replay(lambda op, model, ids, vectors: records.append((op, model, ids, vectors)), DIM)
+    wal.close()
+    return records
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / "wal.log")
+    vectors = random_vectors(3)
+    wal = WriteAheadLog(path)
+    wal.append_add("m", [1, "a", np.int64(3)], vectors)
+    wal.append_delete("m", ["a"])
+    seq = wal.append_drop("other")
+    wal.wait(seq)
+    wal.close()
+
+    records = replayed(path)
+    assert [(op, model, ids) for op, model, ids, _ in records] == [
+        (OP_ADD, "m", [1, "a", 3]),
+        (OP_DELETE, "m", ["a"]),
+        (OP_DROP, "other", []),
+    ]
+    np.testing.assert_array_equal(records[0][3], vectors)
+    assert records[1][3] is None
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    path = str(tmp_path / "wal.log")
+    wal = WriteAheadLog(path)
+    wal.append_add("m", [1], random_vectors(1))
+    wal.wait(wal.append_add("m", [2], random_vectors(1, seed=1)))
+    wal.close()
+    intact = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(intact - 3)
+
+    records = replayed(path)
+    assert [ids for _, _, ids, _ in records] == [[1]]
+    assert os.path.getsize(path) < intact - 3
+
+    # Records appended after the cut replay cleanly
+    wal = WriteAheadLog(path)
+    wal.wait(wal.append_delete("m", [1]))
+    wal.close()
+    assert [op for op, _, _, _ in replayed(path)] == [OP_ADD, OP_DELETE]
+
+
+def test_corrupt_record_stops_replay(tmp_path):
+    path = str(tmp_path / "wal.log")
+    wal = WriteAheadLog(path)
+    wal.append_delete("m", [1])
+    wal.wait(wal.append_delete("m", [2]))
+    wal.close()
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"\xff")
+    assert [ids for _, _, ids, _ in replayed(path)] == [[1]]
+
+
+def test_concurrent_appends_are_all_durable(tmp_path):
+    path = str(tmp_path / "wal.log")
+    wal = WriteAheadLog(path)
+
+    def writer(start):
+        for i in range(start, start + 50):
+            wal.wait(wal.append_delete("m", [i]))
+
+    threads = [threading.Thread(target=writer, args=(n * 50,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wal.close()
+    assert sorted(ids[0] for _, _, ids, _ in replayed(path)) == list(range(200))
+
+
+def test_checkpoint_runs_once_the_log_is_large(tmp_path):
+    path = str(tmp_path / "wal.log")
+    done = threading.Event()
+
+    def checkpoint():
+        wal.truncate()
+        done.set()
+
+    wal = WriteAheadLog(path, checkpoint_func=checkpoint, checkpoint_interval=0.05, checkpoint_bytes=1)
+    wal.wait(wal.append_delete("m", [1]))
+    assert done.wait(5)
+    assert wal.size() == 0
+    wal.close()
+    assert replayed(path) == []
+
+
+def test_store_recovers_unflushed_writes(tmp_path):
+    index_dir = str(tmp_path / "numpy")
+    store = NumpyStore(index_dir, DIM, top_k=3, wal=True)
+    vectors = random_vectors(10)
+    add(store, vectors[:5], list(range(5)))
+    store.flush()
+    add(store, vectors[5:], list(range(5, 10)))
+    store.delete([0, 1], model="m")
+    add(store, vectors[:2], ["x", "y"], model="other")
+    store.rebuild_col("other")
+    crash(store)
+
+    store = NumpyStore(index_dir, DIM, top_k=3, wal=True)
+    assert store.count("m") == 8
+    assert store.search(vectors[7], model="m")[0][1] == 7
+    assert store.search(vectors[0], model="other") == []
+    store.close()
+
+
+def test_flush_empties_the_log(tmp_path):
+    index_dir = str(tmp_path / "numpy")
+    store = NumpyStore(index_dir, DIM, top_k=3, wal=True)
+    add(store, random_vectors(3), [1, 2, 3])
+    assert store._wal.size() > 0
+    store.flush()
+    assert store._wal.size() == 0
+    store.close()
+    assert NumpyStore(index_dir, DIM, top_k=3).count("m") == 3
+
+
+@pytest.mark.parametrize("name", ["faiss", "hnswlib"])
+def test_index_stores_recover_unflushed_writes(tmp_path, name):
+    pytest.importorskip(name)
+    index_path = str(tmp_path / name)
+    store = VectorStorage.get(name, dimension=DIM, top_k=3, index_path=index_path, wal=True)
+    vectors = random_vectors(20)
+    add(store, vectors, list(range(20)))
+    store.delete([3], model="m")
+    crash(store)
+
+    store = VectorStorage.get(name, dimension=DIM, top_k=3, index_path=index_path, wal=True)
+    assert store.count("m") == 19
+    assert store.search(vectors[5], model="m")[0][1] == 5
+    assert 3 not in [_id for _, _id in store.search(vectors[3], model="m")]
+    store.close()
+
+
+def test_rotated_segments_replay_until_removed(tmp_path):
+    path = str(tmp_path / "wal.log")
+    wal = WriteAheadLog(path)
+    wal.append_delete("m", [1])
+    first = wal.rotate()
+    wal.append_delete("m", [2])
+    second = wal.rotate()
+    wal.wait(wal.append_delete("m", [3]))
+    assert wal.size() > 0
+    wal.close()
+    assert [ids for _, _, ids, _ in replayed(path)] == [[1], [2], [3]]
+
+    wal = WriteAheadLog(path)
+    assert wal.rotate() == second + 1
+    wal.remove_sealed(first)
+    wal.close()
+    assert [ids for _, _, ids, _ in replayed(path)] == [[2], [3]]
+
+
+def test_rotate_releases_waiters_of_the_sealed_segment(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "wal.log"))
+    seq = wal.append_delete("m", [1])
+    wal.rotate()
+    wal.wait(seq)
+    wal.wait(wal.append_delete("m", [2]))
+    wal.close()
+
+
+class BlockedSnapshots:
+    """Holds every checkpoint inside its snapshot write until released."""
+
+    def __init__(self, store, monkeypatch):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.models = []
+        write_snapshot = store._write_snapshot
+
+        def blocked(model, *args):
+            self.models.append(model)
+            self.started.set()
+            assert self.release.wait(5)
+            write_snapshot(model, *args)
+
+        monkeypatch.setattr(store, "_write_snapshot", blocked)
+
+
+def make_store(name, index_path, **kwargs):
+    if name == "numpy":
+        return NumpyStore(index_path, DIM, top_k=3, **kwargs)
+    pytest.importorskip(name)
+    return VectorStorage.get(name, dimension=DIM, top_k=3, index_path=index_path, **kwargs)
+
+
+@pytest.mark.parametrize("name", ["numpy", "faiss", "hnswlib"])
+def test_checkpoint_writes_changed_models_without_blocking(tmp_path, monkeypatch, name):
+    index_path = str(tmp_path / name)
+    store = make_store(name, index_path, wal=True)
+    vectors = random_vectors(20)
+    add(store, vectors[:10], list(range(10)), model="a")
+    add(store, vectors[10:], list(range(10, 20)), model="b")
+    store.flush()
+
+    blocked = BlockedSnapshots(store, monkeypatch)
+    add(store, vectors[:1], ["x"], model="a")
+    checkpoint = threading.Thread(target=store.flush)
+    checkpoint.start()
+    assert blocked.started.wait(5)
+    # Writes and searches go on while the snapshot is written
+    add(store, vectors[1:2], ["y"], model="b")
+    store.delete([12], model="b")
+    assert store.search(vectors[5], model="a")[0][1] in (5, "x")
+    blocked.release.set()
+    checkpoint.join()
+    assert blocked.models == ["a"]  # b was unchanged when the checkpoint started
+
+    crash(store)
+    store = make_store(name, index_path, wal=True)
+    assert (store.count("a"), store.count("b")) == (11, 10)
+    assert 12 not in [_id for _, _id in store.search(vectors[12], model="b")]
+    store.close()
+
+
+def test_failed_checkpoint_keeps_the_log(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "numpy")
+    store = NumpyStore(index_dir, DIM, top_k=3, wal=True)
+    vectors = random_vectors(5)
+    add(store, vectors, list(range(5)))
+
+    def fail(model, snapshot):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_write_snapshot", fail)
+    with pytest.raises(OSError):
+        store.flush()
+    monkeypatch.undo()
+    assert store._dirty == {"m"}
+    crash(store)
+
+    store = NumpyStore(index_dir, DIM, top_k=3, wal=True)
+    assert store.count("m") == 5
+    store.flush()
+    assert not [name for name in os.listdir(index_dir) if name.startswith("wal.log.")]
+    store.close()
+
+
+def test_int8_originals_follow_writes_made_during_a_checkpoint(tmp_path, monkeypatch):
+    from modelcache.manager.vector_data import numpy_store
+    monkeypatch.setattr(numpy_store, "COMPACT_MIN_TOMBSTONES", 1)
+    store = NumpyStore(str(tmp_path / "numpy"), DIM, top_k=1, quantization="int8")
+    vectors = random_vectors(30)
+    add(store, vectors[:20], list(range(20)))
+    blocked = BlockedSnapshots(store, monkeypatch)
+    checkpoint = threading.Thread(target=store.flush)
+    checkpoint.start()
+    assert blocked.started.wait(5)
+    store.delete(list(range(8)), model="m")  # compacts, moving the rows under the snapshot
+    add(store, vectors[20:], list(range(20, 30)))
+    blocked.release.set()
+    checkpoint.join()
+
+    matrix = store._matrices["m"]
+    assert isinstance(matrix.disk, np.memmap) and len(matrix.disk) == 20 and matrix._pending_rows == 10
+    for i in range(8, 30):
+        assert store.search(vectors[i], model="m")[0] == (pytest.approx(0.0, abs=1e-6), i)
+
+
+def test_failed_fsync_is_raised_to_the_waiters_of_its_batch(tmp_path, monkeypatch):
+    wal = WriteAheadLog(str(tmp_path / "wal.log"))
+    wal.wait(wal.append_delete("m", [1]))
+
+    def fail(fd):
+        raise OSError(5, "Input/output error")
+
+    monkeypatch.setattr(os, "fsync", fail)
+    seq = wal.append_delete("m", [2])
+    with pytest.raises(OSError):
+        wal.wait(seq)
+    monkeypatch.undo()
+    # Later batches are not reported durable either, while the earlier one stays so
+    with pytest.raises(OSError):
+        wal.wait(wal.append_delete("m", [3]))
+    wal.wait(1)
+    wal.close()